@@ -2,31 +2,25 @@ import yaml
 import pandas as pd
 import re
 import numpy as np
-import uuid
 import pandas as pd
 from googlemaps import Client as GoogleMaps
 import googlemaps
 import gmaps
 import subprocess
+import functools
+import os
+import sys
 
+# shared modules (pipeline.py, set_headers.py, ...) live in utils/ at the repo root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "utils"))
+from columns import ColumnMapper
+from resources import load_metadata
+from identity import record_ids
+from geocoding import GoogleGeocoder, GeocodeCache, CentroidIndex, geocode_series
+from pipeline import Pipeline
 
-# FUNCTIONS
-
-def MapColumns(colname:str, map_dict: dict) -> str: 
-    """_summary_
-
-    Args:
-        colname (str): Current column in DataFrame
-        map (dict): Dictionary mapping of preprocessed col names to standardised col names
 
-    Returns:
-        str: Standardised column name
-    """
-
-    for key, values in map_dict.items():
-        if colname in values:
-            return key
-    return colname
+# FUNCTIONS
 
 # standardise dtypes
 def NumvarStd(x):
@@ -73,158 +67,237 @@ def CreateDummy(x: list):
     return (borewell, rainwater, tank, govt, stp)
 
 # Enter the path to your openssl encoded file
-encrypted_file = "~/config.enc"
+ENCRYPTED_FILE="~/config.enc"
 
-# Command to decrypt using OpenSSL - You will be prompted to enter the openssl password used for encryption
-command = f"openssl aes-256-cbc -d -salt -in {encrypted_file}"
+# concurrent requests, requests per second (API limit is 50) and retries for transient failures
+GEOCODE_CONCURRENCY=10
+GEOCODE_RATE=40
+GEOCODE_RETRIES=3
 
-try:
-    MyAPI=subprocess.check_output(command, shell=True, text=True).strip()
-except subprocess.CalledProcessError as e:
-    raise(e)
+# Optional table of pincode centroids (pincode, lat, long), not kept in the repo. Build it once from India Post's All
+# India Pincode Directory (data.gov.in), averaging the latitude/longitude of the post offices of each pincode. Without
+# it, every pincode is geocoded through the API as before. tests/fixtures/pincode_centroids.csv is a small sample of the
+# format
+CENTROIDS_FILE="pincode_centroids.csv"
 
-def geocode(full_address: str, MyAPI: str) -> tuple:
-    """_summary_
+
+# RESOURCES - created on first use and reused for the life of the process
+
+@functools.lru_cache(maxsize=None)
+def get_geocoder(encrypted_file: str = ENCRYPTED_FILE) -> GoogleGeocoder:
+    """A single client for the process - the API key is decrypted the first time an address needs the API
 
     Args:
-        full_address (str): concatenated address to include all relevant geographical fields
+        encrypted_file (str, optional): path to your openssl encoded file
 
     Returns:
-        tuple: lat, long
+        GoogleGeocoder: geocoder
     """
-    assert isinstance(MyAPI,str) and len(MyAPI)==39, "invalid input"
-    gmaps = googlemaps.Client(key=MyAPI)
-
-    if full_address!=np.nan or full_address!="":
-        try:
-            geocode_result = gmaps.geocode(full_address)
-            if geocode_result:
-                lat= geocode_result[0]['geometry']['location'] ['lat']
-                long= geocode_result[0]['geometry']['location']['lng']
-                return lat, long
-            else:
-                raise Exception("No result returned.")
-        except Exception as e:
-            print(f"Geocoding failed {e}")
-    return None, None
+    # Command to decrypt using OpenSSL - You will be prompted to enter the openssl password used for encryption
+    command = f"openssl aes-256-cbc -d -salt -in {encrypted_file}"
+
+    try:
+        MyAPI=subprocess.check_output(command, shell=True, text=True).strip()
+    except subprocess.CalledProcessError as e:
+        raise(e)
+    return GoogleGeocoder(MyAPI)
+
+
+@functools.lru_cache(maxsize=None)
+def get_geocode_cache() -> GeocodeCache:
+    """Results cached on disk across runs - only addresses not seen before call the API"""
+    return GeocodeCache("geocode_cache.sqlite", ttl_days=180)
+
+
+@functools.lru_cache(maxsize=None)
+def get_centroids(path: str = CENTROIDS_FILE) -> CentroidIndex:
+    """Local pincode centroids - pincodes are geocoded offline, the API is only used for pincodes missing from the table
+
+    Args:
+        path (str, optional): csv with pincode, lat and long columns
+
+    Returns:
+        CentroidIndex: index over the table, None if the file is missing (every pincode then goes to the API)
+    """
+    if not os.path.exists(path):
+        print(f"{path} not found - geocoding all pincodes through the API")
+        return None
+    return CentroidIndex.from_csv(path, key="pincode")
 
 #------------------------------------------------------------------
 
 # STANDARDISATION FOR 2024
-df=pd.read_csv("2024.csv")
+def standardise_2024(pipeline: Pipeline, metadata: str = "METADATA.yaml") -> pd.DataFrame:
+    """Standardises the 2024 survey (2024.csv) and writes survey_2024.csv
+
+    Args:
+        pipeline (Pipeline): pipeline the stages are recorded in
+        metadata (str, optional): path to METADATA.yaml, parsed once per process
+
+    Returns:
+        pd.DataFrame: standardised survey
+    """
+    with pipeline.stage("2024: Read and map columns") as stage:
+        df=pd.read_csv("2024.csv")
+
+        D=load_metadata(metadata)
 
-with open("METADATA.yaml", "r") as f:
-    D=yaml.safe_load(f)
+        # renaming preprocessed columns to their standardised names
+        preprocessed_col_map=ColumnMapper(D["tables"]["survey_2024.csv"]["column_mapping"], normalise=False)
 
-# renaming preprocessed columns to their standardised names
-preprocessed_col_map=D["tables"]["survey_2024.csv"]["column_mapping"]
+        df.columns=[col.lstrip().rstrip() for col in df.columns]
+        df.columns=preprocessed_col_map.map_columns(df.columns)
+        stage.output(df)
 
-df.columns=[col.lstrip().rstrip() for col in df.columns]
-df.columns=[MapColumns(col, preprocessed_col_map) for col in df.columns]
 
+    # cleaning columns
+    with pipeline.stage("2024: Clean columns", df):
+        df["location.geometry.pincode"]=df["location.geometry.pincode"].astype(str)
+        df[df["location.geometry.pincode"].str.len()!=6]
 
-# cleaning columns
-df["location.geometry.pincode"]=df["location.geometry.pincode"].astype(str)
-df[df["location.geometry.pincode"].str.len()!=6]
 
+        int_cols=["survey.numberOfHousingUnits", "survey.numberOfTankersPerMonth", "survey.capacityPerTanker", "survey.cost.tanker.present", "survey.cost.tanker.previousYear", "survey.cost.communityMonthlyWaterExpenses"]
 
-int_cols=["survey.numberOfHousingUnits", "survey.numberOfTankersPerMonth", "survey.capacityPerTanker", "survey.cost.tanker.present", "survey.cost.tanker.previousYear", "survey.cost.communityMonthlyWaterExpenses"]
+        # fixing dtypes
+        for col in int_cols:
+            if df[col].dtype=="object":
+                df[col]=df[col].apply(lambda x: NumvarStd(x))
+                df[col]=df[col].astype(float)
 
-# fixing dtypes
-for col in int_cols:
-    if df[col].dtype=="object":
-        df[col]=df[col].apply(lambda x: NumvarStd(x))
-        df[col]=df[col].astype(float)
+        for col in df.columns:
+            if df[col].dtype=="object":
+                df[col]=df[col].str.lstrip().str.rstrip().str.upper()
 
-for col in df.columns:
-    if df[col].dtype=="object":
-        df[col]=df[col].str.lstrip().str.rstrip().str.upper()
 
+        df["survey.source.all"]=df["survey.source.all"].str.split(",")
 
-df["survey.source.all"]=df["survey.source.all"].str.split(",")
+        result=df["survey.source.all"].apply(lambda x: CreateDummy(x))
 
-result=df["survey.source.all"].apply(lambda x: CreateDummy(x))
+        df["survey.source.borewell"], df["survey.source.rainwater"], df["survey.source.tanker"], df["survey.source.govt"], df["survey.source.STP"]= zip(*result)
 
-df["survey.source.borewell"], df["survey.source.rainwater"], df["survey.source.tanker"], df["survey.source.govt"], df["survey.source.STP"]= zip(*result)
+    # add std columns 
+    with pipeline.stage("2024: Add standard columns", df):
+        master_col_vals=D["tables"]["survey_2024.csv"]["column_values"]
+        master_cols=list(master_col_vals.keys())
+        cols_add=set(master_cols) - set(df.columns)
 
-# add std columns 
-master_col_vals=D["tables"]["survey_2024.csv"]["column_values"]
-master_cols=list(master_col_vals.keys())
-cols_add=set(master_cols) - set(df.columns)
+        for col in cols_add:
+            df[col]=master_col_vals[col]
 
-for col in cols_add:
-    df[col]=master_col_vals[col]
 
+        # create recordID
+        df["metadata.recordID"]=record_ids(df=df)
 
-# create recordID
-df["metadata.recordID"]=[uuid.uuid4() for i in range(len(df))]
+    # geocode
 
-# geocode
 
+    # Apply function - centroid lookup, then the API for the remaining pincodes
+    with pipeline.stage("2024: Geocoding", df):
+        centroids=get_centroids()
+        if centroids is not None:
+            df["location.geometry.latitude.imputed"], df["location.geometry.longitude.imputed"] = centroids.lookup(df["location.geometry.pincode"])
+        else:
+            df["location.geometry.latitude.imputed"], df["location.geometry.longitude.imputed"] = np.nan, np.nan
+
+        missing=df["location.geometry.latitude.imputed"].isna()
+        if missing.any():
+            df.loc[missing, "location.geometry.latitude.imputed"], df.loc[missing, "location.geometry.longitude.imputed"] = geocode_series(addresses=df.loc[missing, "location.geometry.pincode"], geocoder=get_geocoder(), cache=get_geocode_cache(), 
+            concurrency=GEOCODE_CONCURRENCY, rate=GEOCODE_RATE, retries=GEOCODE_RETRIES, failure_report="geocode_failures_2024.csv")
 
-# Apply function
-df["location.geometry.latitude.imputed"], df["location.geometry.longitude.imputed"] = zip(*df["location.geometry.pincode"].apply(lambda x: geocode(x, MyAPI)))
+    # Filtering and ordering columns needed
+    with pipeline.stage("2024: Export", df) as stage:
+        df=df[master_cols]
+        df.to_csv("survey_2024.csv", index=False)
+        stage.output(df)
 
-# Filtering and ordering columns needed
-df=df[master_cols]
-df.to_csv("survey_2024.csv", index=False)
+    return df
 
 # ------------------------------------------------------------------
 
 # STANDARDISATION FOR 2019
-df=pd.read_csv("2019.csv")
+def standardise_2019(pipeline: Pipeline, metadata: str = "METADATA.yaml") -> pd.DataFrame:
+    """Standardises the 2019 survey (2019.csv) and writes survey_2019.csv
+
+    Args:
+        pipeline (Pipeline): pipeline the stages are recorded in
+        metadata (str, optional): path to METADATA.yaml, parsed once per process
+
+    Returns:
+        pd.DataFrame: standardised survey
+    """
+    with pipeline.stage("2019: Read and map columns") as stage:
+        df=pd.read_csv("2019.csv")
+
+        D=load_metadata(metadata)
+
+        # renaming preprocessed columns to their standardised names
+        preprocessed_col_map=ColumnMapper(D["tables"]["survey_2019"]["column_mapping"], normalise=False)
+
+        df.columns=[col.lstrip().rstrip() for col in df.columns]
+        df.columns=preprocessed_col_map.map_columns(df.columns)
+        stage.output(df)
+
+    with pipeline.stage("2019: Clean columns", df):
+        int_cols=["survey.numberOfHousingUnits", "survey.numberOfTankersPerMonth", "survey.capacityPerTanker", "survey.cost.tanker.present"]
 
-with open("METADATA.yaml", "r") as f:
-    D=yaml.safe_load(f)
+        # fixing dtypes
+        for col in int_cols:
+            if df[col].dtype=="object":
+                df[col]=df[col].apply(lambda x: NumvarStd(x))
+                df[col]=df[col].astype(float)
 
-# renaming preprocessed columns to their standardised names
-preprocessed_col_map=D["tables"]["survey_2019"]["column_mapping"]
+        for col in df.columns:
+            if df[col].dtype=="object":
+                df[col]=df[col].str.lstrip().str.rstrip().str.upper()
 
-df.columns=[col.lstrip().rstrip() for col in df.columns]
-df.columns=[MapColumns(col, preprocessed_col_map) for col in df.columns]
+        df["survey.source.all"]=df["survey.source.all"].str.split("\n")
 
-int_cols=["survey.numberOfHousingUnits", "survey.numberOfTankersPerMonth", "survey.capacityPerTanker", "survey.cost.tanker.present"]
+        result=df["survey.source.all"].apply(lambda x: CreateDummy(x))
 
-# fixing dtypes
-for col in int_cols:
-    if df[col].dtype=="object":
-        df[col]=df[col].apply(lambda x: NumvarStd(x))
-        df[col]=df[col].astype(float)
+        df["survey.source.borewell"], df["survey.source.rainwater"], df["survey.source.tanker"], df["survey.source.govt"], df["survey.source.STP"]= zip(*result)
 
-for col in df.columns:
-    if df[col].dtype=="object":
-        df[col]=df[col].str.lstrip().str.rstrip().str.upper()
+    # add std columns 
+    with pipeline.stage("2019: Add standard columns", df):
+        master_col_vals=D["tables"]["2019.csv"]["column_values"]
+        master_cols=list(master_col_vals.keys())
+        cols_add=set(master_cols) - set(df.columns)
 
-df["survey.source.all"]=df["survey.source.all"].str.split("\n")
+        for col in cols_add:
+            df[col]=master_col_vals[col]
 
-result=df["survey.source.all"].apply(lambda x: CreateDummy(x))
 
-df["survey.source.borewell"], df["survey.source.rainwater"], df["survey.source.tanker"], df["survey.source.govt"], df["survey.source.STP"]= zip(*result)
+        # create recordID
+        df["metadata.recordID"]=record_ids(df=df)
 
-# add std columns 
-master_col_vals=D["tables"]["2019.csv"]["column_values"]
-master_cols=list(master_col_vals.keys())
-cols_add=set(master_cols) - set(df.columns)
 
-for col in cols_add:
-    df[col]=master_col_vals[col]
+    # Geocoding
+    with pipeline.stage("2019: Geocoding", df) as stage:
+        df["survey.address"]=df["survey.address"].apply(lambda x: np.nan if not re.search(r"\D",str(x)) else x)
 
+        geocode_df=df[df["survey.address"].isna()==False]
 
-# create recordID
-df["metadata.recordID"]=[uuid.uuid4() for i in range(len(df))]
+        geocode_df["survey.address"]=geocode_df["survey.address"]+","+"BENGALURU,KARNATAKA,INDIA"
+        geocode_df["location.geometry.latitude.imputed"], geocode_df["location.geometry.longitude.imputed"] = geocode_series(addresses=geocode_df["survey.address"], geocoder=get_geocoder(), cache=get_geocode_cache(), 
+        concurrency=GEOCODE_CONCURRENCY, rate=GEOCODE_RATE, retries=GEOCODE_RETRIES, failure_report="geocode_failures_2019.csv")
 
+        df=df[df["survey.address"].isna()]._append(geocode_df)
+        stage.output(df)
 
-# Geocoding
-df["survey.address"]=df["survey.address"].apply(lambda x: np.nan if not re.search(r"\D",str(x)) else x)
+    # Filtering and ordering columns needed
+    with pipeline.stage("2019: Export", df) as stage:
+        df=df[master_cols]
+        df.to_csv("survey_2019.csv", index=False)
+        stage.output(df)
 
-geocode_df=df[df["survey.address"].isna()==False]
+    return df
 
-geocode_df["survey.address"]=geocode_df["survey.address"]+","+"BENGALURU,KARNATAKA,INDIA"
-geocode_df["location.geometry.latitude.imputed"], geocode_df["location.geometry.longitude.imputed"] = zip(*geocode_df["survey.address"].apply(lambda x: geocode(x, MyAPI)))
 
-df=df[df["survey.address"].isna()]._append(geocode_df)
+if __name__ == "__main__":
+    # per-stage timings, memory and row counts - set PIPELINE_PROFILE_STAGE to a stage name to profile it
+    pipeline=Pipeline("CS0023DS0056 standardise")
 
-# Filtering and ordering columns needed
-df=df[master_cols]
-df.to_csv("survey_2019.csv", index=False)
+    standardise_2024(pipeline)
+    standardise_2019(pipeline)
 
+    print(pipeline.summary())
+    pipeline.save("pipeline_report.json")
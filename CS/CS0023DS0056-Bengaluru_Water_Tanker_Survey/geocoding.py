@@ -0,0 +1,434 @@
+import re
+import json
+import random
+import sqlite3
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode
+from urllib.request import urlopen
+import numpy as np
+import pandas as pd
+import googlemaps
+
+GOOGLE_GEOCODE_URL = "https://maps.googleapis.com/maps/api/geocode/json"
+PINCODE_PATTERN = r"(?<!\d)(\d{6})(?!\d)"
+EARTH_RADIUS_KM = 6371.0
+
+
+def normalise_address(address) -> str:
+    """Normalises an address/pincode for de-duplication and cache lookups
+
+    Args:
+        address: address or pincode in the dataset
+
+    Returns:
+        str: upper case address with single spaces and no space before commas, None if null or blank
+    """
+    if pd.isna(address):
+        return None
+    address = re.sub(r"\s+", " ", str(address)).strip().upper()
+    address = re.sub(r"\s*,\s*", ",", address)
+    return address if address and address != "NAN" else None
+
+
+class GeocodeError(Exception):
+    """Geocoding failed for an address - retryable for transient errors (rate limits, server/network errors)"""
+
+    def __init__(self, message: str, retryable: bool = False):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class GoogleGeocoder:
+    """Geocodes addresses with the Google Maps Geocoding API through a single client"""
+
+    def __init__(self, MyAPI: str):
+        """
+        Args:
+            MyAPI (str): Google Maps API key
+        """
+        assert isinstance(MyAPI, str) and len(MyAPI) == 39, "invalid input"
+        self.client = googlemaps.Client(key=MyAPI)
+
+    def geocode(self, full_address: str) -> tuple:
+        """Geocodes a single address
+
+        Args:
+            full_address (str): concatenated address to include all relevant geographical fields
+
+        Returns:
+            tuple: lat, long
+
+        Raises:
+            GeocodeError: No result returned
+        """
+        geocode_result = self.client.geocode(full_address)
+        if geocode_result:
+            lat = geocode_result[0]['geometry']['location']['lat']
+            long = geocode_result[0]['geometry']['location']['lng']
+            return lat, long
+        raise GeocodeError("No result returned.")
+
+
+class HTTPGeocoder:
+    """Async geocoder for the Google Geocoding API over HTTP - base_url can point to a local stub server"""
+
+    def __init__(self, MyAPI: str, base_url: str = GOOGLE_GEOCODE_URL, timeout: float = 10):
+        """
+        Args:
+            MyAPI (str): Google Maps API key
+            base_url (str, optional): geocoding endpoint
+            timeout (float, optional): request timeout in seconds
+        """
+        assert isinstance(MyAPI, str), "invalid input"
+        self.key = MyAPI
+        self.base_url = base_url
+        self.timeout = timeout
+
+    async def geocode(self, full_address: str) -> tuple:
+        """Geocodes a single address
+
+        Args:
+            full_address (str): concatenated address to include all relevant geographical fields
+
+        Returns:
+            tuple: lat, long
+
+        Raises:
+            GeocodeError: request failed or no result returned
+        """
+        return await asyncio.to_thread(self._request, full_address)
+
+    def _request(self, full_address: str) -> tuple:
+        url = f"{self.base_url}?{urlencode({'address': full_address, 'key': self.key})}"
+        try:
+            with urlopen(url, timeout=self.timeout) as response:
+                body = json.load(response)
+        except HTTPError as e:
+            raise GeocodeError(f"HTTP {e.code}", retryable=e.code == 429 or e.code >= 500)
+        except (URLError, TimeoutError) as e:
+            raise GeocodeError(f"Request failed: {e}", retryable=True)
+
+        status = body.get("status")
+        if status == "OK" and body.get("results"):
+            location = body["results"][0]["geometry"]["location"]
+            return location["lat"], location["lng"]
+        raise GeocodeError(f"Status {status}", retryable=status in ("OVER_QUERY_LIMIT", "UNKNOWN_ERROR"))
+
+
+class TokenBucket:
+    """Token-bucket rate limiter for async requests"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        """
+        Args:
+            rate (float): tokens (requests) added per second
+            capacity (float, optional): maximum burst, defaults to one second of tokens
+        """
+        assert rate > 0, "Invalid input: rate must be positive"
+        self.rate = rate
+        self.capacity = capacity or max(1, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Waits until a token is available and takes it"""
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+async def _geocode_all(addresses: list, geocoder, concurrency: int, rate: float, retries: int, backoff: float) -> list:
+    semaphore = asyncio.Semaphore(concurrency)
+    bucket = TokenBucket(rate) if rate else None
+    is_async = asyncio.iscoroutinefunction(geocoder.geocode)
+
+    async def geocode_one(address):
+        async with semaphore:
+            for attempt in range(retries + 1):
+                if bucket:
+                    await bucket.acquire()
+                try:
+                    if is_async:
+                        return (address, await geocoder.geocode(address), None)
+                    return (address, await asyncio.to_thread(geocoder.geocode, address), None)
+                except Exception as e:
+                    # unexpected errors (e.g. from the googlemaps client) are treated as transient
+                    if not getattr(e, "retryable", True) or attempt == retries:
+                        return (address, None, {"address": address, "error": str(e), "attempts": attempt + 1})
+                    # exponential backoff with jitter
+                    await asyncio.sleep(backoff * 2 ** attempt * (1 + random.random()))
+
+    return await asyncio.gather(*(geocode_one(address) for address in addresses))
+
+
+def geocode_many(*, addresses: list, geocoder, concurrency: int = 1, rate: float = None, retries: int = 0,
+                 backoff: float = 1.0) -> tuple:
+    """Geocodes addresses concurrently with a rate limit, retrying transient failures with exponential backoff
+
+    Args:
+        addresses (list): addresses to geocode
+        geocoder: object with geocode(address) -> (lat, long), sync (run in threads) or async
+        concurrency (int, optional): maximum requests in flight
+        rate (float, optional): maximum requests per second, unlimited if None
+        retries (int, optional): retries per address for transient failures
+        backoff (float, optional): base delay in seconds, doubled on each retry
+
+    Returns:
+        tuple: ({address: (lat, long)} for successes, pd.DataFrame failure report - address, error, attempts)
+    """
+    assert isinstance(concurrency, int) and concurrency > 0, "Invalid input: concurrency must be a positive integer"
+
+    coroutine = _geocode_all(list(addresses), geocoder, concurrency, rate, retries, backoff)
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        results = asyncio.run(coroutine)
+    else:
+        # already inside an event loop (e.g. a notebook) - run in a separate thread
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            results = pool.submit(asyncio.run, coroutine).result()
+
+    found = {address: location for address, location, failure in results if failure is None}
+    failures = pd.DataFrame([failure for _, _, failure in results if failure is not None],
+                            columns=["address", "error", "attempts"])
+    return (found, failures)
+
+
+class GeocodeCache:
+    """Persistent SQLite cache of normalised address -> (lat, long), with expiry and size-bounded eviction"""
+
+    def __init__(self, path: str = "geocode_cache.sqlite", ttl_days: float = 180, max_size: int = 100000):
+        """Opens (or creates) the cache
+
+        Args:
+            path (str, optional): SQLite database file
+            ttl_days (float, optional): days after which a cached result is looked up again
+            max_size (int, optional): maximum number of entries retained, oldest evicted first
+        """
+        self.ttl = ttl_days * 24 * 60 * 60
+        self.max_size = max_size
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS geocode (address TEXT PRIMARY KEY, lat REAL, long REAL, created REAL)")
+        self.conn.commit()
+
+    def get_many(self, addresses: list) -> dict:
+        """Looks up unexpired results for a list of normalised addresses
+
+        Args:
+            addresses (list): normalised addresses
+
+        Returns:
+            dict: {address: (lat, long)} for cached addresses
+        """
+        found = {}
+        cutoff = time.time() - self.ttl
+        # stay under SQLite's limit on query parameters
+        for i in range(0, len(addresses), 500):
+            batch = addresses[i:i + 500]
+            rows = self.conn.execute(
+                f"SELECT address, lat, long FROM geocode WHERE created >= ? AND address IN ({','.join('?' * len(batch))})",
+                [cutoff] + batch)
+            found.update({address: (lat, long) for address, lat, long in rows})
+        return found
+
+    def set_many(self, results: dict):
+        """Stores results, then drops expired entries and evicts the oldest beyond max_size
+
+        Args:
+            results (dict): {address: (lat, long)}
+        """
+        now = time.time()
+        self.conn.executemany("INSERT OR REPLACE INTO geocode VALUES (?, ?, ?, ?)",
+                              [(address, lat, long, now) for address, (lat, long) in results.items()])
+        self.conn.execute("DELETE FROM geocode WHERE created < ?", (now - self.ttl,))
+        self.conn.execute(
+            "DELETE FROM geocode WHERE address NOT IN (SELECT address FROM geocode ORDER BY created DESC LIMIT ?)",
+            (self.max_size,))
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+def geocode_series(*, addresses: pd.Series, geocoder, cache: GeocodeCache = None, concurrency: int = 1,
+                   rate: float = None, retries: int = 0, failure_report: str = None) -> tuple:
+    """Geocodes a column of addresses/pincodes - each distinct normalised address is looked up once, in the cache
+    first, and only misses are sent to the geocoder
+
+    Args:
+        addresses (pd.Series): addresses or pincodes
+        geocoder: object with geocode(address) -> (lat, long), sync or async, e.g. GoogleGeocoder, HTTPGeocoder
+            or a local fake
+        cache (GeocodeCache, optional): persistent cache, updated with new results
+        concurrency (int, optional): maximum requests in flight
+        rate (float, optional): maximum requests per second, unlimited if None
+        retries (int, optional): retries per address for transient failures
+        failure_report (str, optional): csv path to write failed addresses to (address, error, attempts)
+
+    Returns:
+        tuple: (lat, long) Series aligned with addresses, None where geocoding failed
+    """
+    keys = addresses.map(normalise_address)
+    unique = [key for key in keys.unique() if key is not None]
+
+    results = cache.get_many(unique) if cache is not None else {}
+    misses = [address for address in unique if address not in results]
+    new, failures = geocode_many(addresses=misses, geocoder=geocoder, concurrency=concurrency, rate=rate,
+                                 retries=retries)
+    if cache is not None and new:
+        cache.set_many(new)
+    results.update(new)
+
+    if len(failures):
+        print(f"Geocoding failed for {len(failures)} of {len(misses)} addresses")
+        if failure_report:
+            failures.to_csv(failure_report, index=False)
+
+    lat = keys.map(lambda key: results.get(key, (None, None))[0])
+    long = keys.map(lambda key: results.get(key, (None, None))[1])
+    return (lat, long)
+
+
+## -----------------------------OFFLINE CENTROIDS------------------------------ ##
+
+def normalise_pincode(pincodes: pd.Series) -> pd.Series:
+    """Extracts the 6 digit pincode from a column of pincodes/addresses
+
+    Args:
+        pincodes (pd.Series): pincodes as numbers or strings, or addresses containing a pincode
+
+    Returns:
+        pd.Series: pincode as string, NaN if no pincode is found
+    """
+    return pincodes.astype(str).str.replace(r"\.0$", "", regex=True).str.extract(PINCODE_PATTERN, expand=False)
+
+
+class CentroidIndex:
+    """Offline geocoder over a local table of pincode/ward centroids - a hash index by key for forward lookups and a
+    grid index over the coordinates for reverse (nearest centroid) lookups"""
+
+    def __init__(self, centroids: pd.DataFrame, key: str = "pincode", lat: str = "lat", long: str = "long",
+                 cell_size: float = 0.05):
+        """
+        Args:
+            centroids (pd.DataFrame): one row per pincode/ward with its centroid
+            key (str, optional): pincode/ward column
+            lat (str, optional): latitude column
+            long (str, optional): longitude column
+            cell_size (float, optional): grid cell size in degrees for reverse lookups
+        """
+        assert {key, lat, long}.issubset(centroids.columns), "Invalid input: centroid table is missing columns"
+
+        table = centroids[[key, lat, long]].dropna().copy()
+        if key == "pincode":
+            table[key] = normalise_pincode(table[key])
+        table = table.dropna().drop_duplicates(subset=key).rename(columns={lat: "lat", long: "long"})
+
+        # forward index - key -> centroid
+        self.key = key
+        self.table = table.set_index(key)[["lat", "long"]].astype(float)
+        self.keys = self.table.index.to_numpy()
+        self.coords = self.table.to_numpy()
+
+        # reverse index - grid cell -> rows with a centroid in the cell
+        self.cell_size = cell_size
+        self.grid = {}
+        for row, cell in enumerate(map(tuple, np.floor(self.coords / cell_size).astype(int))):
+            self.grid.setdefault(cell, []).append(row)
+        cells = np.array(list(self.grid.keys())) if self.grid else np.zeros((1, 2), dtype=int)
+        self.cell_min, self.cell_max = cells.min(axis=0), cells.max(axis=0)
+
+    @classmethod
+    def from_csv(cls, path: str, **kwargs):
+        """Loads the centroid table from a csv file
+
+        Args:
+            path (str): csv with key, lat and long columns
+
+        Returns:
+            CentroidIndex: index over the table
+        """
+        return cls(pd.read_csv(path, dtype={kwargs.get("key", "pincode"): str}), **kwargs)
+
+    def geocode(self, full_address: str) -> tuple:
+        """Geocodes a single pincode/ward (or an address containing a pincode) - same contract as GoogleGeocoder
+
+        Args:
+            full_address (str): pincode, ward or address
+
+        Returns:
+            tuple: lat, long
+
+        Raises:
+            GeocodeError: No centroid for the pincode/ward
+        """
+        lat, long = self.lookup(pd.Series([full_address]))
+        if pd.isna(lat.iloc[0]):
+            raise GeocodeError("No centroid found.")
+        return float(lat.iloc[0]), float(long.iloc[0])
+
+    def lookup(self, keys: pd.Series) -> tuple:
+        """Geocodes a column of pincodes/wards from the centroid table
+
+        Args:
+            keys (pd.Series): pincodes (or addresses containing a pincode) or ward names/IDs
+
+        Returns:
+            tuple: (lat, long) Series aligned with keys, NaN where the key is not in the table
+        """
+        if self.key == "pincode":
+            keys = normalise_pincode(keys)
+        else:
+            keys = keys.map(normalise_address)
+        return (keys.map(self.table["lat"]), keys.map(self.table["long"]))
+
+    def nearest(self, lat: float, long: float) -> tuple:
+        """Finds the centroid nearest to a point, searching outward ring by ring from the point's grid cell
+
+        Args:
+            lat (float): latitude
+            long (float): longitude
+
+        Returns:
+            tuple: (pincode/ward, distance in km), (None, None) if the table is empty
+        """
+        if not len(self.coords):
+            return (None, None)
+
+        cell = np.floor(np.array([lat, long]) / self.cell_size).astype(int)
+        # longitude degrees shrink with latitude - scale them so grid distances are comparable
+        scale = np.cos(np.radians(lat))
+        max_ring = int(np.max(np.maximum(np.abs(cell - self.cell_min), np.abs(cell - self.cell_max))))
+
+        best, best_dist = None, np.inf
+        for ring in range(max_ring + 1):
+            # points beyond this ring are at least ring cells away
+            if (ring - 1) * self.cell_size * scale > best_dist:
+                break
+            rows = [row for i in range(-ring, ring + 1) for j in range(-ring, ring + 1)
+                    if max(abs(i), abs(j)) == ring for row in self.grid.get((cell[0] + i, cell[1] + j), [])]
+            if not rows:
+                continue
+            dist = np.hypot(self.coords[rows, 0] - lat, (self.coords[rows, 1] - long) * scale)
+            if dist.min() < best_dist:
+                best, best_dist = rows[int(dist.argmin())], dist.min()
+
+        return (self.keys[best], haversine(lat, long, *self.coords[best]))
+
+
+def haversine(lat1: float, long1: float, lat2: float, long2: float) -> float:
+    """Great-circle distance between two points in km"""
+    lat1, long1, lat2, long2 = map(np.radians, (lat1, long1, lat2, long2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((long2 - long1) / 2) ** 2
+    return float(2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a)))
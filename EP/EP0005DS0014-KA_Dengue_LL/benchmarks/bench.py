@@ -0,0 +1,568 @@
+"""Benchmarks for functions.py and the preprocess -> standardise flow, on synthetic Karnataka line lists.
+
+Usage (from EP/EP0005DS0014-KA_Dengue_LL):
+    python benchmarks/bench.py                                  # every case and end-to-end at 10k, 100k and 1M rows
+    python benchmarks/bench.py --rows 10000 --cases age dates   # cases whose name contains age or dates
+    python benchmarks/bench.py --rows 100000 --no-end-to-end
+    python benchmarks/bench.py --compare --scale 100000         # best time per case across the commits benchmarked
+
+Each result is appended to benchmarks/results.jsonl (git-ignored) with the commit (git describe --dirty), so runs on
+different commits can be compared. Scalar functions are timed as the scripts apply them (row by row) on at most max_rows
+rows.
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DATASET_DIR = os.path.dirname(BENCH_DIR)
+REPO_DIR = os.path.dirname(os.path.dirname(DATASET_DIR))
+UTILS_DIR = os.path.join(REPO_DIR, "utils")
+sys.path[:0] = [DATASET_DIR, UTILS_DIR]
+
+from functions import *  # noqa: E402
+import synthetic  # noqa: E402
+
+SCALES = [10_000, 100_000, 1_000_000]
+RESULTS_PATH = os.path.join(BENCH_DIR, "results.jsonl")
+YEAR = 2023
+DATEVARS = ["event.symptomOnsetDate", "event.test.sampleCollectionDate", "event.test.resultDate"]
+
+# name -> (setup, max_rows, fixed size) - setup(data) returns the callable timed
+CASES = {}
+
+
+def case(name: str, max_rows: int = None, fixed: bool = False):
+    """Registers a benchmark case.
+
+    Args:
+        name (str): Case name, starting with the function benchmarked.
+        max_rows (int, optional): Rows timed at most, for functions applied row by row.
+        fixed (bool, optional): Input does not scale with the line list - run at the smallest scale only.
+    """
+    def register(setup):
+        CASES[name] = (setup, max_rows, fixed)
+        return setup
+    return register
+
+
+class BenchData:
+    """Synthetic line list at one scale, with the derived inputs that cases share."""
+
+    def __init__(self, rows: int, seed: int = 0):
+        self.rows = rows
+        self.regions = synthetic.make_regions(seed)
+        self.df = synthetic.make_line_list(rows, self.regions, YEAR, seed)
+        self.gazetteer = RegionGazetteer(self.regions)
+        self.headers = [raw for layout in synthetic.LAYOUTS for raw, _ in layout]
+        self._dates = None
+        # outputs of the write cases
+        self.tmpdir = tempfile.mkdtemp(prefix="bench_")
+
+    def head(self, max_rows: int = None) -> pd.DataFrame:
+        return self.df if max_rows is None else self.df.iloc[:max_rows]
+
+    def dates(self) -> pd.DataFrame:
+        """Date columns as datetime64, as they are after string_clean_dates and fix_year_hist_series."""
+        if self._dates is None:
+            self._dates = pd.DataFrame({
+                var: fix_year_hist_series(Date=pd.to_datetime(self.df[col], format="mixed", dayfirst=True,
+                                                              errors="coerce"), Year=YEAR)
+                for var, col in zip(DATEVARS, ["symptom_date", "sample_date", "result_date"])})
+        return self._dates
+
+
+# 00 - PREPROCESSING
+
+@case("extract_test_method_with_result", max_rows=100_000)
+def _(data):
+    df = data.head(100_000)
+    return lambda: df.apply(lambda x: extract_test_method_with_result(
+        test_method=x["test_method"], result=x["result"]), axis=1)
+
+
+@case("extract_test_method_without_result", max_rows=100_000)
+def _(data):
+    df = data.head(100_000)
+    return lambda: df.apply(lambda x: extract_test_method_without_result(test_method=x["test_method"]), axis=1)
+
+
+@case("extract_test_methods_series")
+def _(data):
+    return lambda: extract_test_methods_series(test_method=data.df["test_method"], result=data.df["result"])
+
+
+@case("extract_test_methods_series (without result)")
+def _(data):
+    return lambda: extract_test_methods_series(test_method=data.df["test_method"])
+
+
+@case("normalise_colname", fixed=True)
+def _(data):
+    headers = data.headers * 1000
+    return lambda: [normalise_colname(col) for col in headers]
+
+
+@case("map_columns", fixed=True)
+def _(data):
+    headers = data.headers * 1000
+    return lambda: [map_columns(colname=col, map_dict=synthetic.COLUMN_MAPPING) for col in headers]
+
+
+@case("ColumnMapper.map_columns", fixed=True)
+def _(data):
+    headers = data.headers * 1000
+    return lambda: ColumnMapper(synthetic.COLUMN_MAPPING).map_columns(headers)
+
+
+@case("extract_contact", max_rows=100_000)
+def _(data):
+    address = data.head(100_000)["address"]
+    return lambda: address.apply(lambda x: extract_contact(address=x))
+
+
+@case("extract_age_gender", max_rows=100_000)
+def _(data):
+    agegender = data.head(100_000)["agegender"]
+    return lambda: agegender.apply(lambda x: extract_age_gender(agegender=x))
+
+
+@case("extract_contact_series")
+def _(data):
+    return lambda: extract_contact_series(address=data.df["address"])
+
+
+@case("extract_age_gender_series")
+def _(data):
+    return lambda: extract_age_gender_series(agegender=data.df["agegender"])
+
+# 01 - STANDARDISATION
+
+
+@case("standardise_age", max_rows=100_000)
+def _(data):
+    age = data.head(100_000)["age"]
+    return lambda: age.apply(lambda x: standardise_age(age=x))
+
+
+@case("validate_age", max_rows=100_000)
+def _(data):
+    age = data.head(100_000)["age"].apply(lambda x: standardise_age(age=x))
+    return lambda: age.apply(lambda x: validate_age(age=x))
+
+
+@case("standardise_age_series")
+def _(data):
+    return lambda: standardise_age_series(age=data.df["age"])
+
+
+@case("standardise_gender", max_rows=100_000)
+def _(data):
+    gender = data.head(100_000)["gender"]
+    return lambda: gender.apply(lambda x: standardise_gender(gender=x))
+
+
+@case("standardise_gender_series")
+def _(data):
+    return lambda: standardise_gender_series(gender=data.df["gender"])
+
+
+@case("standardise_test_result", max_rows=100_000)
+def _(data):
+    result = data.head(100_000)["ns1"]
+    return lambda: result.apply(lambda x: standardise_test_result(result=x))
+
+
+@case("standardise_test_result_series")
+def _(data):
+    return lambda: standardise_test_result_series(result=data.df["ns1"])
+
+
+@case("generate_test_count", max_rows=100_000)
+def _(data):
+    df = pd.DataFrame({"test1": standardise_test_result_series(result=data.head(100_000)["ns1"]),
+                       "test2": standardise_test_result_series(result=data.head(100_000)["igm"])})
+    return lambda: df.apply(lambda x: generate_test_count(test1=x["test1"], test2=x["test2"]), axis=1)
+
+
+for _name, _func, _series, _col in [("opd_ipd", opd_ipd, opd_ipd_series, "opd_ipd"),
+                                    ("public_private", public_private, public_private_series, "public_private"),
+                                    ("active_passive", active_passive, active_passive_series, "surveillance"),
+                                    ("rural_urban", rural_urban, rural_urban_series, "urban_rural")]:
+    def _scalar(data, func=_func, col=_col):
+        s = data.head(100_000)[col]
+        return lambda: s.apply(lambda x: func(s=x))
+
+    def _column(data, series=_series, col=_col):
+        return lambda: series(s=data.df[col])
+
+    case(_name, max_rows=100_000)(_scalar)
+    case(_name + "_series")(_column)
+
+
+@case("fix_symptom_date", max_rows=100_000)
+def _(data):
+    df = data.head(100_000)
+    return lambda: df.apply(lambda x: fix_symptom_date(symptomDate=x["symptom_date"], resultDate=x["result_date"]),
+                            axis=1)
+
+
+@case("string_clean_dates", max_rows=10_000)
+def _(data):
+    dates = data.head(10_000)["sample_date"]
+    return lambda: dates.apply(lambda x: string_clean_dates(Date=x))
+
+
+@case("parse_dates")
+def _(data):
+    return lambda: parse_dates(dates=data.df["sample_date"])
+
+
+@case("normalise_dates")
+def _(data):
+    df = data.df[["symptom_date", "sample_date", "result_date"]].set_axis(DATEVARS, axis=1)
+    return lambda: normalise_dates(df=df.copy(), datevars=DATEVARS, year=YEAR)
+
+
+@case("fix_year_hist", max_rows=100_000)
+def _(data):
+    dates = pd.to_datetime(data.head(100_000)["sample_date"], format="mixed", dayfirst=True, errors="coerce")
+    return lambda: dates.apply(lambda x: fix_year_hist(Date=x, Year=YEAR))
+
+
+@case("fix_year_hist_series")
+def _(data):
+    dates = pd.to_datetime(data.df["sample_date"], format="mixed", dayfirst=True, errors="coerce")
+    return lambda: fix_year_hist_series(Date=dates, Year=YEAR)
+
+
+@case("fix_two_dates", max_rows=100_000)
+def _(data):
+    df = data.dates().iloc[:100_000]
+    early, late = DATEVARS[:2]
+    return lambda: df.apply(lambda x: fix_two_dates(earlyDate=x[early], lateDate=x[late]), axis=1)
+
+
+@case("fix_two_dates_series")
+def _(data):
+    df = data.dates()
+    return lambda: fix_two_dates_series(earlyDate=df[DATEVARS[0]], lateDate=df[DATEVARS[1]])
+
+
+@case("swap_day_month")
+def _(data):
+    dates = data.dates()[DATEVARS[1]]
+    return lambda: swap_day_month(Date=dates)
+
+
+@case("fix_date_sequence")
+def _(data):
+    return lambda: fix_date_sequence(df=data.dates().copy(), datevars=DATEVARS)
+
+
+@case("clean_strings", max_rows=100_000)
+def _(data):
+    names = data.head(100_000)["name"] + " , " + data.head(100_000)["address_only"]
+    return lambda: names.apply(lambda x: clean_strings(s=x))
+
+
+@case("clean_district_name", max_rows=100_000)
+def _(data):
+    names = data.head(100_000)["district"]
+    return lambda: names.apply(lambda x: clean_district_name(districtName=x))
+
+
+@case("clean_subdist_name", max_rows=100_000)
+def _(data):
+    names = data.head(100_000)["taluk"]
+    return lambda: names.apply(lambda x: clean_subdist_name(subdistName=x))
+
+
+@case("clean_village_name", max_rows=100_000)
+def _(data):
+    names = data.head(100_000)["village"].dropna()
+    return lambda: names.apply(lambda x: clean_village_name(villageName=x))
+
+
+@case("RegionGazetteer", fixed=True)
+def _(data):
+    return lambda: RegionGazetteer(data.regions)
+
+
+@case("dist_mapping", max_rows=10_000)
+def _(data):
+    names = data.head(10_000)["district"]
+    return lambda: names.apply(lambda x: dist_mapping(stateID="state_29", districtName=x, gazetteer=data.gazetteer,
+                                                      threshold=synthetic.CONFIG["thresholds"]["district"]))
+
+
+@case("subdist_ulb_mapping", max_rows=10_000)
+def _(data):
+    df = data.head(10_000)
+    return lambda: df.apply(lambda x: subdist_ulb_mapping(
+        districtID=x["district_id"], subdistName=x["taluk"], gazetteer=data.gazetteer,
+        threshold=synthetic.CONFIG["thresholds"]["subdistrict"]), axis=1)
+
+
+@case("village_ward_mapping", max_rows=10_000)
+def _(data):
+    df = data.head(10_000)
+    return lambda: df.apply(lambda x: village_ward_mapping(
+        subdistID=x["subdistrict_id"], villageName=x["village"], gazetteer=data.gazetteer,
+        threshold=synthetic.CONFIG["thresholds"]["village"]), axis=1)
+
+
+for _level, _parent, _col in [("district", None, "district"), ("subdistrict", "district_id", "taluk"),
+                              ("village", "subdistrict_id", "village")]:
+    def _geo_mapping(data, level=_level, parent=_parent, col=_col, matcher="fuzzywuzzy", warm=False):
+        parentIDs = pd.Series("state_29", index=data.df.index) if parent is None else data.df[parent]
+        gazetteer = RegionGazetteer(data.regions, matcher=get_matcher(name=matcher))
+        cache = GeoCache(max_size=1_000_000) if warm else None
+        run = lambda: geo_mapping(parentIDs=parentIDs, names=data.df[col], level=level, gazetteer=gazetteer,  # noqa
+                                  threshold=synthetic.CONFIG["thresholds"][level], cache=cache)
+        if warm:
+            run()
+        return run
+
+    case(f"geo_mapping {_level}")(_geo_mapping)
+    case(f"geo_mapping {_level} (rapidfuzz)")(lambda data, f=_geo_mapping: f(data, matcher="rapidfuzz"))
+    case(f"geo_mapping {_level} (warm GeoCache)")(lambda data, f=_geo_mapping: f(data, warm=True))
+
+# 02 - CHUNKED EXECUTION
+
+
+@case("row_keys")
+def _(data):
+    return lambda: row_keys(df=data.df)
+
+
+@case("drop_seen_duplicates")
+def _(data):
+    return lambda: drop_seen_duplicates(df=data.df, seen=set())
+
+# 03 - OUTPUT
+
+
+def _output(data) -> pd.DataFrame:
+    df = data.df.drop(columns=["subdistrict_id", "village_id"]).rename(columns={"district_id": "location.admin2.ID"})
+    return df.join(data.dates())
+
+
+@case("write_parquet_dataset")
+def _(data):
+    df = _output(data)
+    path = os.path.join(data.tmpdir, "write_parquet_dataset")
+    return lambda: write_parquet_dataset(df=df, path=path, year=YEAR, datevars=DATEVARS, categorical=["gender"])
+
+
+@case("read_parquet_dataset")
+def _(data):
+    path = os.path.join(data.tmpdir, "read_parquet_dataset")
+    write_parquet_dataset(df=_output(data), path=path, year=YEAR, datevars=DATEVARS, categorical=["gender"])
+    return lambda: read_parquet_dataset(path=path, years=[YEAR], columns=["name", "location.admin2.ID"] + DATEVARS)
+
+# 05 - IDENTITY
+
+
+@case("assign_group_ids")
+def _(data):
+    return lambda: assign_group_ids(df=data.df, keys=["name", "age", "gender"], ids={}, normalise=["name"])
+
+
+@case("assign_group_ids (deterministic)")
+def _(data):
+    return lambda: assign_group_ids(df=data.df, keys=["name", "age", "gender"], normalise=["name"], deterministic=True)
+
+
+@case("record_ids")
+def _(data):
+    return lambda: record_ids(df=data.df)
+
+
+@case("record_ids (deterministic)")
+def _(data):
+    return lambda: record_ids(df=data.df, deterministic=True)
+
+# 06 - RECORD LINKAGE
+
+
+@case("contact_prefix")
+def _(data):
+    return lambda: contact_prefix(contact=data.df["mobile"])
+
+
+def _link_records(data, matcher: str = "fuzzywuzzy"):
+    df = data.df.assign(prefix=contact_prefix(contact=data.df["mobile"]))
+    return lambda: link_records(df=df, blocks=["district_id", "gender", "prefix"], name="name",
+                                matcher=get_matcher(name=matcher))
+
+
+case("link_records")(_link_records)
+case("link_records (rapidfuzz)")(lambda data: _link_records(data, matcher="rapidfuzz"))
+
+
+# RUNNER
+
+def timed(func, repeat: int) -> list:
+    """Times repeated calls of func, in seconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def environment() -> dict:
+    """Commit and machine the results are recorded against."""
+    try:
+        commit = subprocess.run(["git", "describe", "--always", "--dirty"], cwd=REPO_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {"commit": commit, "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "machine": platform.node(), "cpus": os.cpu_count(), "python": platform.python_version(),
+            "pandas": pd.__version__, "numpy": np.__version__}
+
+
+def run_cases(data: BenchData, names: list, repeat: int, smallest: bool) -> list:
+    """Times the cases on one scale of synthetic data.
+
+    Returns:
+        list: one result per case
+    """
+    results = []
+    for name in names:
+        setup, max_rows, fixed = CASES[name]
+        if fixed and not smallest:
+            continue
+        times = timed(setup(data), repeat)
+        rows = None if fixed else min(data.rows, max_rows or data.rows)
+        results.append({"kind": "function", "case": name, "scale": data.rows, "rows": rows, "best": min(times),
+                        "mean": sum(times) / len(times), "repeat": repeat})
+        print(f"{data.rows:>9} {name:<45} {min(times):10.4f}s")
+    shutil.rmtree(data.tmpdir, ignore_errors=True)
+    return results
+
+
+def run_end_to_end(rows: int, workdir: str, chunk_size: int = None, matcher: str = None, seed: int = 0) -> list:
+    """Runs preprocess.py, standardise.py and link.py as scripts on synthetic district files, recording the time of each
+    script and of each of their pipeline stages.
+
+    Args:
+        rows (int): Rows across the district files.
+        workdir (str): Directory the inputs and outputs are written to.
+        chunk_size (int, optional): chunk_size in metadata.yaml.
+        matcher (str, optional): Fuzzy matcher backend, fuzzywuzzy if None.
+        seed (int, optional): Random seed.
+
+    Returns:
+        list: one result per script and per stage
+    """
+    synthetic.write_inputs(workdir, rows, YEAR, seed, chunk_size=chunk_size,
+                           matcher={"name": matcher} if matcher else None)
+
+    results = []
+    # regionids.csv is the synthetic one written above, not the LGD regions on S3
+    for script, options, report in [("preprocess.py", [], f"pipeline_report_preprocess_{YEAR}.json"),
+                                    ("standardise.py", ["--no-download"], f"pipeline_report_{YEAR}.json"),
+                                    ("link.py", [], f"pipeline_report_link_{YEAR}.json")]:
+        start = time.perf_counter()
+        subprocess.run([sys.executable, os.path.join(DATASET_DIR, script), str(YEAR)] + options, cwd=workdir, check=True,
+                       capture_output=True)
+        seconds = time.perf_counter() - start
+        results.append({"kind": "end-to-end", "case": script, "scale": rows, "rows": rows, "best": seconds,
+                        "mean": seconds, "repeat": 1})
+        print(f"{rows:>9} {script:<45} {seconds:10.4f}s")
+
+        with open(os.path.join(workdir, report)) as f:
+            stages = pd.DataFrame(json.load(f)["stages"])
+        for stage, wall_time in stages.groupby("stage", sort=False)["wall_time"].sum().items():
+            results.append({"kind": "stage", "case": f"{script}: {stage}", "scale": rows, "rows": rows,
+                            "best": wall_time, "mean": wall_time, "repeat": 1})
+    return results
+
+
+def save_results(results: list, path: str = RESULTS_PATH):
+    """Appends results to a JSON lines file, tagged with the commit and machine."""
+    env = environment()
+    with open(path, "a") as f:
+        for result in results:
+            f.write(json.dumps({**env, **result}) + "\n")
+
+
+def compare(path: str = RESULTS_PATH, scale: int = None) -> pd.DataFrame:
+    """Best time per case (rows) and commit (columns), in the order commits were first benchmarked, with the
+    last commit's time relative to the first.
+
+    Args:
+        path (str, optional): Results file.
+        scale (int, optional): Scale compared, the largest benchmarked if None.
+
+    Returns:
+        pd.DataFrame: seconds per case and commit
+    """
+    results = pd.read_json(path, lines=True)
+    scale = scale or results["scale"].max()
+    results = results[results["scale"] == scale]
+    commits = results.sort_values("timestamp")["commit"].drop_duplicates().tolist()
+    table = results.pivot_table(index="case", columns="commit", values="best", aggfunc="min", sort=False)[commits]
+    if len(commits) > 1:
+        table["ratio"] = table[commits[-1]] / table[commits[0]]
+    return table
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=SCALES, help="line list sizes")
+    parser.add_argument("--cases", nargs="*", help="run cases whose name contains any of these, all if omitted")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per case, the best is compared")
+    parser.add_argument("--no-functions", action="store_true", help="skip the functions.py cases")
+    parser.add_argument("--no-end-to-end", action="store_true", help="skip the preprocess -> standardise run")
+    parser.add_argument("--chunk-size", type=int, help="chunk_size for standardise.py in the end-to-end run")
+    parser.add_argument("--matcher", choices=list(MATCHERS), help="fuzzy matcher for the end-to-end run")
+    parser.add_argument("--workdir", help="keep the end-to-end inputs and outputs here instead of a temp dir")
+    parser.add_argument("--results", default=RESULTS_PATH, help="JSON lines file results are appended to")
+    parser.add_argument("--compare", action="store_true", help="print stored results by commit and exit")
+    parser.add_argument("--scale", type=int, help="line list size compared, the largest benchmarked if omitted")
+    args = parser.parse_args(argv)
+
+    # per-row date parsing warns on every call - the timings are what matter here
+    warnings.filterwarnings("ignore", category=UserWarning)
+
+    if args.compare:
+        with pd.option_context("display.max_rows", None, "display.width", 200):
+            print(compare(args.results, args.scale))
+        return
+
+    names = [name for name in CASES if not args.cases or any(pattern in name for pattern in args.cases)]
+    for rows in sorted(args.rows):
+        results = []
+        if not args.no_functions and names:
+            results += run_cases(BenchData(rows), names, args.repeat, smallest=rows == min(args.rows))
+        if not args.no_end_to_end:
+            if args.workdir:
+                workdir = os.path.join(args.workdir, str(rows))
+                os.makedirs(workdir, exist_ok=True)
+                results += run_end_to_end(rows, workdir, args.chunk_size, args.matcher)
+            else:
+                with tempfile.TemporaryDirectory(prefix="bench_") as workdir:
+                    results += run_end_to_end(rows, workdir, args.chunk_size, args.matcher)
+        # saved per scale, so results of the smaller scales are kept if a larger one is interrupted
+        save_results(results, args.results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,381 @@
+import os
+import numpy as np
+import pandas as pd
+import yaml
+
+# LGD district name: district file name as received from the department - old spellings, BBMP for Bengaluru Urban
+DISTRICTS = {
+    "BAGALKOT": "Bagalkote",
+    "BALLARI": "Bellary",
+    "BELAGAVI": "Belgaum",
+    "BENGALURU RURAL": "Bengaluru Rural",
+    "BENGALURU URBAN": "BBMP",
+    "BIDAR": "Bidar",
+    "CHAMARAJANAGARA": "Chamarajanagar",
+    "CHIKKABALLAPURA": "Chikkaballapur",
+    "CHIKKAMAGALURU": "Chikmagalur",
+    "CHITRADURGA": "Chitradurga",
+    "DAKSHINA KANNADA": "Dakshina Kannada",
+    "DAVANGERE": "Davanagere",
+    "DHARWAD": "Dharwad",
+    "GADAG": "Gadag",
+    "HASSAN": "Hassan",
+    "HAVERI": "Haveri",
+    "KALABURAGI": "Gulbarga",
+    "KODAGU": "Kodagu",
+    "KOLAR": "Kolar",
+    "KOPPAL": "Koppal",
+    "MANDYA": "Mandya",
+    "MYSURU": "Mysore",
+    "RAICHUR": "Raichur",
+    "RAMANAGARA": "Ramanagara",
+    "SHIVAMOGGA": "Shimoga",
+    "TUMAKURU": "Tumkur",
+    "UDUPI": "Udupi",
+    "UTTARA KANNADA": "Uttara Kannada",
+    "VIJAYANAGARA": "Vijayanagara",
+    "VIJAYAPURA": "Bijapur",
+    "YADGIR": "Yadgir",
+}
+
+# syllables for synthetic taluk and village names, e.g. HOSAHALLI, DODDAKERE
+PLACE_PREFIXES = ["HOSA", "DODDA", "CHIKKA", "KERE", "BETTA", "HONNA", "MALLA", "SIDDA", "RAMA", "KRISHNA", "NARASI",
+                  "HALE", "BASAVA", "CHANNA", "HEBBA", "KALLA", "NAGA", "SOMA", "HULI", "BILI", "MADDU", "GOWDA"]
+PLACE_SUFFIXES = ["HALLI", "PURA", "KERE", "PALYA", "NAGAR", "GERE", "KOTE", "PETE", "GUDDA", "DURGA", "GIRI",
+                  "KOPPA", "HATTI", "WADI", "HOSUR"]
+
+FIRST_NAMES = ["RAMESH", "SURESH", "LAKSHMI", "MANJUNATH", "SHIVAKUMAR", "KAVYA", "ANITHA", "NAGARAJ", "BASAVARAJ",
+               "SHWETHA", "PRAKASH", "MAHADEVI", "RAVI", "GEETHA", "SANTHOSH", "CHANDRU", "POOJA", "MOHAN", "SHILPA",
+               "VENKATESH", "ASHA", "KIRAN", "DEEPA", "HANUMANTHA", "YALLAPPA", "RENUKA", "IRFAN", "FATHIMA", "JOSEPH",
+               "MARY"]
+INITIALS = ["K", "B N", "S", "M R", "H", "G", "T K", "P", "N", "R S"]
+
+GENDERS = ["M", "F", "Male", "Female", "MALE", "female", "m", "f", "B", "G", "W", "Boy", np.nan]
+TEST_METHODS = ["NS1", "IgM", "NS1 & IgM", "ns1/igm", "NS1+IGM", "Elisa IgM", np.nan]
+RESULTS = ["Positive", "Pos", "+ve", "POSITIVE", "Negative", "Neg", "-ve", "Yes", np.nan]
+OPD_IPD = ["OPD", "IPD", "opd", "I.P.D", "ipd", np.nan]
+PUBLIC_PRIVATE = ["Govt", "Government", "Private", "Pvt", "PUBLIC", np.nan]
+SURVEILLANCE = ["Active", "Passive", "A", "P", "active", np.nan]
+URBAN_RURAL = ["Urban", "Rural", "U", "R", "rural", np.nan]
+
+# date formats seen in district files - most are day first
+DATE_FORMATS = ["%d-%m-%Y", "%d/%m/%Y", "%Y-%m-%d", "%d.%m.%Y", "%d-%m-%y"]
+
+# raw column layouts of the district files - (raw column, line list column)
+LAYOUTS = [
+    [("Sl No", "sl_no"), ("Name", "name"), ("Address", "address"), ("Age/Gender", "agegender"), ("Taluk", "taluk"),
+     ("Village", "village"), ("Date of Onset", "symptom_date"), ("Sample Date", "sample_date"),
+     ("Result Date", "result_date"), ("test_method", "test_method"), ("result", "result"), ("OPD/IPD", "opd_ipd"),
+     ("Public/Private", "public_private"), ("Surveillance", "surveillance"), ("Urban/Rural", "urban_rural"),
+     ("Unnamed: 15", None)],
+    [("SL. NO.", "sl_no"), ("Name", "name"), ("Address", "address_only"), ("Mobile No", "mobile"), ("Age", "age"),
+     ("Sex", "gender"), ("Taluka", "taluk"), ("Village/Ward", "village"), ("Symptom Date", "symptom_date"),
+     ("Date of Sample Collection", "sample_date"), ("Result Date", "result_date"), ("NS1", "ns1"), ("IgM", "igm"),
+     ("OPD IPD", "opd_ipd"), ("Hospital Type", "public_private"), ("Active/Passive", "surveillance"),
+     ("Area", "urban_rural")],
+]
+
+# metadata.yaml column mapping for the layouts above - aliases are normalised raw column names
+COLUMN_MAPPING = {
+    "metadata.contact": ["mobile_no", "mobile", "contact"],
+    "demographics.age": ["age", "age_yrs"],
+    "demographics.gender": ["sex", "gender"],
+    "event.test.test1.result": ["ns1"],
+    "event.test.test2.result": ["igm"],
+    "event.symptomOnsetDate": ["date_of_onset", "symptom_date"],
+    "event.test.sampleCollectionDate": ["sample_date", "date_of_sample_collection"],
+    "event.test.resultDate": ["result_date"],
+    "location.admin2.name": ["district"],
+    "location.admin3.name": ["taluk", "taluka"],
+    "location.admin5.name": ["village", "villageward"],
+    "case.opdOrIpd'": ["opdipd", "opd_ipd"],
+    "case.publicOrPrivate": ["publicprivate", "hospital_type"],
+    "case.surveillance": ["surveillance", "activepassive"],
+    "case.urbanOrRural": ["urbanrural", "area"],
+}
+
+COLUMN_VALUES = {
+    "metadata.nameAddress": None,
+    "metadata.contact": None,
+    "demographics.age": None,
+    "demographics.gender": None,
+    "event.test.test1.result": None,
+    "event.test.test2.result": None,
+    "event.symptomOnsetDate": None,
+    "event.test.sampleCollectionDate": None,
+    "event.test.resultDate": None,
+    "case.opdOrIpd'": None,
+    "case.publicOrPrivate": None,
+    "case.surveillance": None,
+    "case.urbanOrRural": None,
+    "location.admin1.ID": "state_29",
+    "location.admin1.name": "KARNATAKA",
+    "location.admin2.name": None,
+    "location.admin3.name": None,
+    "location.admin5.name": None,
+}
+
+CONFIG = {
+    "str_cols": ["metadata.nameAddress", "location.admin1.name"],
+    "thresholds": {"district": 65, "subdistrict": 75, "village": 75},
+    "pii": ["metadata.nameAddress", "metadata.contact"],
+    "output_formats": ["csv"],
+}
+
+
+def place_names(rng: np.random.Generator, n: int) -> list:
+    """Draws n distinct synthetic Kannada place names."""
+    names = np.array([prefix + suffix for prefix in PLACE_PREFIXES for suffix in PLACE_SUFFIXES])
+    assert n <= len(names), f"Invalid input: at most {len(names)} distinct place names"
+    return list(rng.choice(names, size=n, replace=False))
+
+
+def make_regions(seed: int = 0, taluks_per_district: int = 6, villages_per_taluk: int = 25) -> pd.DataFrame:
+    """Generates a synthetic LGD regionids.csv for Karnataka - the real districts, with synthetic taluks and
+    villages, and the BBMP urban local body under Bengaluru Urban.
+
+    Args:
+        seed (int, optional): Random seed.
+        taluks_per_district (int, optional): Subdistricts per district.
+        villages_per_taluk (int, optional): Villages per subdistrict.
+
+    Returns:
+        pd.DataFrame: regionID, regionName, parentID
+    """
+    rng = np.random.default_rng(seed)
+    rows = [("state_29", "KARNATAKA", "country_356")]
+
+    for d, district in enumerate(DISTRICTS):
+        districtID = f"district_{524 + d}"
+        rows.append((districtID, district, "state_29"))
+        if district == "BENGALURU URBAN":
+            rows.append(("ulb_272", "BBMP", districtID))
+
+        # the district headquarters is a taluk of the same name, as in LGD
+        taluks = [district.split()[0]] + place_names(rng, taluks_per_district - 1)
+        for t, taluk in enumerate(taluks):
+            subdistID = f"subdistrict_{5000 + d * taluks_per_district + t}"
+            rows.append((subdistID, taluk, districtID))
+            for v, village in enumerate(place_names(rng, villages_per_taluk)):
+                rows.append((f"village_{(d * taluks_per_district + t) * villages_per_taluk + v:06d}", village,
+                             subdistID))
+
+    return pd.DataFrame(rows, columns=["regionID", "regionName", "parentID"])
+
+
+def misspell(name: str, rng: np.random.Generator) -> str:
+    """Introduces a typo seen in manually entered names - a dropped, doubled or swapped letter, a vowel change, a
+    split word or a change of case.
+    """
+    i = int(rng.integers(1, max(len(name) - 1, 2)))
+    typo = rng.integers(6)
+    if typo == 0:
+        name = name[:i] + name[i + 1:]
+    elif typo == 1:
+        name = name[:i] + name[i] + name[i:]
+    elif typo == 2 and i < len(name) - 1:
+        name = name[:i] + name[i + 1] + name[i] + name[i + 2:]
+    elif typo == 3:
+        name = name.replace("A", "E", 1) if "A" in name else name.replace("U", "O", 1)
+    elif typo == 4:
+        name = name[:i] + " " + name[i:]
+    return name.title() if rng.random() < 0.5 else name
+
+
+def spellings(names: np.ndarray, rng: np.random.Generator, variants: int = 3, typo_rate: float = 0.3) -> np.ndarray:
+    """Draws a spelling for each name, misspelt with probability typo_rate from a fixed pool of variants per name.
+
+    Args:
+        names (np.ndarray): Correct names, one per row.
+        rng (np.random.Generator): Random generator.
+        variants (int, optional): Number of distinct misspellings of each name.
+        typo_rate (float, optional): Share of rows misspelt.
+
+    Returns:
+        np.ndarray: Names as entered.
+    """
+    codes, uniques = pd.factorize(pd.Series(names))
+    pool = np.array([[name] + [misspell(name, rng) for _ in range(variants)] for name in uniques], dtype=object)
+    variant = np.where(rng.random(len(codes)) < typo_rate, rng.integers(1, variants + 1, len(codes)), 0)
+    return pool[codes, variant]
+
+
+def format_dates(dates: pd.Series, rng: np.random.Generator) -> pd.Series:
+    """Formats dates as strings in mixed formats, with day and month swapped for some rows (where the day is a
+    valid month) and typos in the year for others.
+    """
+    dates = dates.copy()
+    formats = rng.choice(DATE_FORMATS, size=len(dates), p=[0.4, 0.25, 0.15, 0.1, 0.1])
+
+    # wrong year (previous decade, next year)
+    year_typo = rng.random(len(dates)) < 0.02
+    dates[year_typo] = dates[year_typo] - pd.DateOffset(years=10)
+    next_year = rng.random(len(dates)) < 0.01
+    dates[next_year] = dates[next_year] + pd.DateOffset(years=1)
+
+    out = pd.Series(pd.NA, index=dates.index, dtype=object)
+    for date_format in DATE_FORMATS:
+        rows = formats == date_format
+        out[rows] = dates[rows].dt.strftime(date_format)
+
+    # month first entries
+    swap = (rng.random(len(dates)) < 0.05) & (dates.dt.day <= 12).to_numpy()
+    out[swap] = dates[swap].dt.strftime("%m-%d-%Y")
+    return out
+
+
+def make_line_list(rows: int, regions: pd.DataFrame, year: int, seed: int = 0, duplicate_rate: float = 0.05) -> pd.DataFrame:
+    """Generates a synthetic dengue line list for Karnataka with the mess found in district files - free text ages
+    (5y6m, 8 months, 230), gender codes, mixed date formats with day/month swaps and "N days" symptom dates,
+    misspelt taluk and village names, and name/address strings carrying mobile numbers.
+
+    Args:
+        rows (int): Number of rows, including duplicates.
+        regions (pd.DataFrame): regionids.csv from make_regions.
+        year (int): Year of the line list.
+        seed (int, optional): Random seed.
+        duplicate_rate (float, optional): Share of rows that repeat an earlier row.
+
+    Returns:
+        pd.DataFrame: One row per case with raw fields (name, address, agegender, test_method, ...), the split
+            fields some districts send instead (address_only, mobile, age, gender, ns1, igm) and the true region
+            IDs (district_id, subdistrict_id, village_id).
+    """
+    rng = np.random.default_rng(seed)
+    unique_rows = rows - int(rows * duplicate_rate)
+
+    # regions - Bengaluru Urban (BBMP) reports the most cases
+    ids = regions.set_index("regionID")
+    districts = regions[regions["parentID"] == "state_29"]["regionID"].to_numpy()
+    weights = np.where(ids.loc[districts, "regionName"] == "BENGALURU URBAN", 10.0, 1.0)
+    district_id = rng.choice(districts, size=unique_rows, p=weights / weights.sum())
+
+    subdistricts = regions[regions["regionID"].str.startswith("subdistrict")].groupby("parentID")["regionID"].agg(list)
+    subdistrict_id = pd.Series(district_id).map(subdistricts).map(lambda x: x[rng.integers(len(x))]).to_numpy()
+    villages = regions[regions["regionID"].str.startswith("village")].groupby("parentID")["regionID"].agg(list)
+    village_id = pd.Series(subdistrict_id).map(villages).map(lambda x: x[rng.integers(len(x))]).to_numpy()
+
+    df = pd.DataFrame({"district_id": district_id, "subdistrict_id": subdistrict_id, "village_id": village_id})
+    df["district"] = ids.loc[district_id, "regionName"].map(DISTRICTS).to_numpy()
+    df["taluk"] = spellings(ids.loc[subdistrict_id, "regionName"].to_numpy(), rng)
+    village = spellings(ids.loc[village_id, "regionName"].to_numpy(), rng)
+    df["village"] = np.where(rng.random(unique_rows) < 0.05, None, village)
+
+    # name, address and mobile number
+    name = pd.Series(rng.choice(FIRST_NAMES, unique_rows)) + " " + rng.choice(INITIALS, unique_rows)
+    df["name"] = name.to_numpy()
+    df["address_only"] = ("#" + pd.Series(rng.integers(1, 999, unique_rows)).astype(str) + ", "
+                          + pd.Series(rng.integers(1, 20, unique_rows)).astype(str) + "th Cross, "
+                          + pd.Series(village).str.upper()).to_numpy()
+    mobile = pd.Series(rng.integers(6_000_000_000, 9_999_999_999, unique_rows)).astype(str)
+    mobile = mobile.where(rng.random(unique_rows) >= 0.1, "91" + mobile)
+    df["mobile"] = mobile.where(rng.random(unique_rows) >= 0.3).to_numpy()
+    df["address"] = (pd.Series(df["address_only"]) + " " + pd.Series(df["mobile"]).fillna("")).str.strip().to_numpy()
+
+    # age as free text
+    years = rng.integers(1, 90, unique_rows)
+    months = rng.integers(1, 12, unique_rows)
+    age_kind = rng.choice(8, size=unique_rows, p=[0.35, 0.2, 0.1, 0.08, 0.07, 0.08, 0.07, 0.05])
+    age = pd.Series(years).astype(str)
+    age = np.select([age_kind == 1, age_kind == 2, age_kind == 3, age_kind == 4, age_kind == 5, age_kind == 6,
+                     age_kind == 7],
+                    [age + "Y", age + " yrs", age + "y" + pd.Series(months).astype(str) + "m",
+                     pd.Series(months).astype(str) + " months", age + "0", age + ".5", ""], default=age)
+    df["age"] = np.where(rng.random(unique_rows) < 0.03, None, age)
+    df["gender"] = rng.choice(np.array(GENDERS, dtype=object), unique_rows)
+    df["agegender"] = (pd.Series(df["age"]).fillna("") + "/" + pd.Series(df["gender"]).fillna("")).to_numpy()
+
+    # tests
+    df["test_method"] = rng.choice(np.array(TEST_METHODS, dtype=object), unique_rows)
+    df["result"] = rng.choice(np.array(RESULTS, dtype=object), unique_rows)
+    df["ns1"] = rng.choice(np.array(RESULTS, dtype=object), unique_rows)
+    df["igm"] = rng.choice(np.array(RESULTS, dtype=object), unique_rows)
+
+    # dates - symptom onset <= sample collection <= result
+    sample = pd.Series(pd.Timestamp(year=year, month=1, day=1) + pd.to_timedelta(rng.integers(0, 365, unique_rows),
+                                                                                 unit="D"))
+    symptom = sample - pd.to_timedelta(rng.integers(0, 8, unique_rows), unit="D")
+    result = sample + pd.to_timedelta(rng.integers(0, 5, unique_rows), unit="D")
+    df["symptom_date"] = format_dates(symptom, rng).to_numpy()
+    days = rng.random(unique_rows) < 0.05
+    df.loc[days, "symptom_date"] = pd.Series(rng.integers(1, 8, days.sum())).astype(str).to_numpy() + " days"
+    df["sample_date"] = format_dates(sample, rng).to_numpy()
+    df["result_date"] = format_dates(result, rng).to_numpy()
+    for col in ["symptom_date", "sample_date", "result_date"]:
+        df.loc[rng.random(unique_rows) < 0.05, col] = None
+
+    df["opd_ipd"] = rng.choice(np.array(OPD_IPD, dtype=object), unique_rows)
+    df["public_private"] = rng.choice(np.array(PUBLIC_PRIVATE, dtype=object), unique_rows)
+    df["surveillance"] = rng.choice(np.array(SURVEILLANCE, dtype=object), unique_rows)
+    df["urban_rural"] = rng.choice(np.array(URBAN_RURAL, dtype=object), unique_rows)
+
+    # repeated entries
+    repeats = df.iloc[rng.integers(0, unique_rows, rows - unique_rows)]
+    df = pd.concat([df, repeats]).iloc[rng.permutation(rows)].reset_index(drop=True)
+    return df
+
+
+def district_files(df: pd.DataFrame) -> dict:
+    """Splits a line list into district files in the raw layouts, alternating layouts across districts.
+
+    Args:
+        df (pd.DataFrame): Line list from make_line_list.
+
+    Returns:
+        dict: {district file name: raw DataFrame}
+    """
+    files = {}
+    for d, (district, rows) in enumerate(df.groupby("district", sort=True)):
+        rows = rows.reset_index(drop=True)
+        rows["sl_no"] = np.arange(1, len(rows) + 1)
+        files[district] = pd.DataFrame({raw: rows[col] if col else None for raw, col in LAYOUTS[d % len(LAYOUTS)]})
+    return files
+
+
+def make_metadata(output_formats: list = None, chunk_size: int = None, matcher: dict = None) -> dict:
+    """Builds a metadata.yaml for the synthetic district files, with the sections read by preprocess.py and
+    standardise.py.
+
+    Args:
+        output_formats (list, optional): csv and/or parquet.
+        chunk_size (int, optional): Rows per chunk in standardise.py, one pass if None.
+        matcher (dict, optional): Fuzzy matcher config, e.g. {"name": "rapidfuzz"}.
+
+    Returns:
+        dict: metadata
+    """
+    config = dict(CONFIG)
+    config["output_formats"] = output_formats or CONFIG["output_formats"]
+    if chunk_size:
+        config["chunk_size"] = chunk_size
+    if matcher:
+        config["matcher"] = matcher
+    return {"config": config,
+            "column_mapping": {"historical": COLUMN_MAPPING},
+            "column_values": {col: {"value": value} for col, value in COLUMN_VALUES.items()}}
+
+
+def write_inputs(path: str, rows: int, year: int, seed: int = 0, **metadata_options) -> pd.DataFrame:
+    """Writes the inputs of preprocess.py and standardise.py to a directory - district files in ./{year},
+    regionids.csv and metadata.yaml.
+
+    Args:
+        path (str): Working directory.
+        rows (int): Number of rows across all district files.
+        year (int): Year of the line list.
+        seed (int, optional): Random seed.
+        **metadata_options: Options for make_metadata.
+
+    Returns:
+        pd.DataFrame: The line list written, with the true region IDs.
+    """
+    regions = make_regions(seed)
+    df = make_line_list(rows, regions, year, seed)
+
+    os.makedirs(os.path.join(path, str(year)), exist_ok=True)
+    for district, raw in district_files(df).items():
+        raw.to_csv(os.path.join(path, str(year), f"{district}.csv"), index=False)
+    regions.to_csv(os.path.join(path, "regionids.csv"), index=False)
+    with open(os.path.join(path, "metadata.yaml"), "w") as f:
+        yaml.safe_dump(make_metadata(**metadata_options), f, sort_keys=False)
+    return df
@@ -1,17 +1,31 @@
 import pandas as pd
 import os
 import re
-import yaml
 import numpy as np
 import datetime
-import boto3
-from fuzzywuzzy import process
 import uuid
-import pandas as pd
+import shutil
+import importlib.util
+
+# components shared with the other datasets live in utils/ (put on sys.path by the scripts) - re-exported here for the
+# line-list scripts, which import everything from functions
+from columns import normalise_colname, map_columns, ColumnMapper  # noqa: F401
+from resources import load_metadata, s3_client  # noqa: F401
+from geomapping import (REGIONS_BUCKET, REGIONS_KEY, FuzzywuzzyMatcher, RapidfuzzMatcher, MATCHERS,  # noqa: F401
+                        get_matcher, RegionGazetteer, clean_district_name, clean_subdist_name, clean_village_name,
+                        dist_mapping, subdist_ulb_mapping, village_ward_mapping, GeoCache, GEO_LEVELS, geo_mapping,
+                        download_regionids, load_gazetteer)
+from identity import (PATIENT_KEYS, RECORD_NAMESPACE, PATIENT_NAMESPACE, normalise_text, random_ids,  # noqa: F401
+                      row_keys, content_keys, record_ids, assign_group_ids)
 
 # 00 - PREPROCESSING (preprocess.py)
 
 
+# test methods in the test_method column
+NS1_PATTERN = re.compile(r"NS1", re.IGNORECASE)
+IGM_PATTERN = re.compile(r"IgM", re.IGNORECASE)
+
+
 def extract_test_method_with_result(*, test_method: str, result: str) -> tuple:
     """Creates separate NS1 and IgM columns with corresponding result if test_method and result variables provided
 
@@ -29,9 +43,9 @@ def extract_test_method_with_result(*, test_method: str, result: str) -> tuple:
     else:
         test1, test2 = ("", "")
 
-        if re.search(r"NS1", str(test_method), re.IGNORECASE):
+        if NS1_PATTERN.search(str(test_method)):
             test1 = result
-        if re.search(r"IgM", str(test_method), re.IGNORECASE):
+        if IGM_PATTERN.search(str(test_method)):
             test2 = result
         return (test1, test2)
 
@@ -51,35 +65,42 @@ def extract_test_method_without_result(*, test_method: str) -> tuple:
     else:
         test1, test2 = ("", "")
 
-        if re.search(r"NS1", str(test_method), re.IGNORECASE):
+        if NS1_PATTERN.search(str(test_method)):
             test1 = "Positive"
-        if re.search(r"IgM", str(test_method), re.IGNORECASE):
+        if IGM_PATTERN.search(str(test_method)):
             test2 = "Positive"
         return (test1, test2)
 
 
-def map_columns(*, colname: str, map_dict: dict) -> str:
-    """Standardises column names using mapping in config file
+def extract_test_methods_series(*, test_method: pd.Series, result: pd.Series = None) -> tuple:
+    """Column-wise extract_test_method_with_result (or _without_result if result is None) - each distinct test method
+    is searched once with str.contains and the results are selected with np.where
 
     Args:
-        colname (str): Current column in DataFrame
-        map (dict): Dictionary mapping of preprocessed col names to standardised col names
+        test_method (pd.Series): test method - IgM, NS1 or both
+        result (pd.Series, optional): whether positive or negative, Positive for every test if None
 
     Returns:
-        str: Standardised column name
+        tuple: (NS1 result, IgM result) columns, identical to applying the scalar functions row by row
     """
-    assert isinstance(colname, str) and isinstance(
-        map_dict, dict), "Invalid input type for column name or dictionary"
+    codes, uniques = pd.factorize(test_method)
+    methods = pd.Series(uniques, dtype=object).astype(str)
+    # code -1 (null test method) takes the appended False
+    has_ns1 = np.append(methods.str.contains(NS1_PATTERN).to_numpy(dtype=bool), False)[codes]
+    has_igm = np.append(methods.str.contains(IGM_PATTERN).to_numpy(dtype=bool), False)[codes]
 
-    colname = re.sub(r"[^\w\s]", "", colname.lstrip().rstrip().lower())
-    colname = re.sub(r"(\s+)", " ", colname)
-    colname = re.sub(r"\s", "_", colname)
+    missing = codes < 0
+    values = np.full(len(codes), "Positive", dtype=object) if result is None else result.to_numpy(dtype=object)
+    ns1 = np.where(missing, pd.NA, np.where(has_ns1, values, ""))
+    igm = np.where(missing, pd.NA, np.where(has_igm, values, ""))
+    return (pd.Series(ns1, index=test_method.index), pd.Series(igm, index=test_method.index))
 
-    for key, values in map_dict.items():
-        if colname in values:
-            return key
 
-    return colname
+# mobile number, optionally prefixed with 91 or 9
+CONTACT_DIGITS = r"9?1?\d{10}"
+CONTACT_PATTERN = re.compile(f"({CONTACT_DIGITS})")
+# age (number and unit)/gender (initial and rest), e.g. 25Y/M, 6M/Female
+AGE_GENDER_PATTERN = re.compile(r"([0-9]+[YyMm]?[A-Za-z]*)\/([MmFfGgBbWw]?[A-Za-z]*)")
 
 
 def extract_contact(*, address: str) -> tuple:
@@ -92,11 +113,11 @@ def extract_contact(*, address: str) -> tuple:
         tuple: DataFrame series of address & mobile number
     """
     if isinstance(address, str):
-        mobile_present = re.search(r"(9?1?\d{10})", address)
+        mobile_present = CONTACT_PATTERN.search(address)
 
         if (mobile_present):
             mobile_number = mobile_present.group(1)
-            address = re.sub(r"9?1?\d{10}", "", address)
+            address = CONTACT_PATTERN.sub("", address)
             return (address, mobile_number)
     return (address, pd.NA)
 
@@ -112,8 +133,7 @@ def extract_age_gender(*, agegender: str) -> tuple:
     """
 
     if not pd.isna(agegender):
-        match = re.search(
-            r"([0-9]+[YyMm]?[A-Za-z]*)\/([MmFfGgBbWw]?[A-Za-z]*)", str(agegender))
+        match = AGE_GENDER_PATTERN.search(str(agegender))
         if match:
             if match.group(1) and match.group(2):
                 return (match.group(1), match.group(2))
@@ -126,6 +146,80 @@ def extract_age_gender(*, agegender: str) -> tuple:
     else:
         return (pd.NA, pd.NA)
 
+
+def _extract_contact_re(values: np.ndarray) -> tuple:
+    """extract_contact on an array of strings with pandas string methods (Python's re)"""
+    text = pd.Series(values, dtype=object)
+    mobile = text.str.extract(CONTACT_PATTERN, expand=False)
+    matched = mobile.notna()
+    text[matched] = text[matched].str.replace(CONTACT_PATTERN, "", regex=True)
+    return (text.to_numpy(), mobile.where(matched, pd.NA).to_numpy(dtype=object))
+
+
+def _extract_contact_arrow(values: np.ndarray) -> tuple:
+    """extract_contact on an array of ASCII strings with pyarrow's regex kernels (RE2), which search leftmost-first as
+    re.search does"""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    text = pa.array(values, type=pa.string())
+    mobile = pc.extract_regex(text, f"(?P<mobile>{CONTACT_DIGITS})")
+    matched = mobile.is_valid().to_numpy(zero_copy_only=False)
+    mobile = np.where(matched, pc.struct_field(mobile, [0]).to_numpy(zero_copy_only=False), pd.NA)
+    stripped = pc.replace_substring_regex(text, CONTACT_DIGITS, "")
+    return (stripped.to_numpy(zero_copy_only=False), mobile)
+
+
+def extract_contact_series(*, address: pd.Series) -> tuple:
+    """Column-wise extract_contact - the first mobile number is extracted and all numbers are stripped in bulk, with
+    pyarrow's regex kernels where pyarrow is installed. Their \\d only matches ASCII digits, so entries with other
+    characters (e.g. Kannada digits) go through str.extract and str.replace, as do all entries without pyarrow.
+
+    Args:
+        address (pd.Series): Name & Address or Address column
+
+    Returns:
+        tuple: (address without mobile numbers, mobile number or NA), identical to applying extract_contact row by row
+    """
+    values = address.to_numpy(dtype=object)
+    stripped = values.copy()
+    mobile = np.full(len(values), pd.NA, dtype=object)
+
+    # only strings are searched, other entries are kept as they are
+    is_str = np.array([isinstance(x, str) for x in values], dtype=bool)
+    is_ascii = np.array([isinstance(x, str) and x.isascii() for x in values], dtype=bool)
+
+    if importlib.util.find_spec("pyarrow"):
+        batches = [(is_ascii, _extract_contact_arrow), (is_str & ~is_ascii, _extract_contact_re)]
+    else:
+        batches = [(is_str, _extract_contact_re)]
+    for rows, extract in batches:
+        if rows.any():
+            stripped[rows], mobile[rows] = extract(values[rows])
+
+    return (pd.Series(stripped, index=address.index), pd.Series(mobile, index=address.index))
+
+
+def extract_age_gender_series(*, agegender: pd.Series) -> tuple:
+    """Column-wise extract_age_gender - each distinct entry is matched once with str.extract
+
+    Args:
+        agegender (pd.Series): age/gender column
+
+    Returns:
+        tuple: (age, gender) as strings or NA, identical to applying extract_age_gender row by row
+    """
+    codes, uniques = pd.factorize(agegender)
+    parts = pd.Series(uniques, dtype=object).astype(str).astype("string").str.extract(AGE_GENDER_PATTERN)
+    age, gender = parts[0].astype(object), parts[1].astype(object)
+    age, gender = age.where(age.notna(), pd.NA), gender.where(gender.fillna("") != "", pd.NA)
+
+    # broadcast back to the rows, NA for nulls
+    present = codes >= 0
+    ages, genders = np.full(len(codes), pd.NA, dtype=object), np.full(len(codes), pd.NA, dtype=object)
+    ages[present], genders[present] = age.to_numpy()[codes[present]], gender.to_numpy()[codes[present]]
+    return (pd.Series(ages, index=agegender.index), pd.Series(genders, index=agegender.index))
+
 # 01 - STANDARDISATION (standardise.py)
 
 
@@ -183,7 +277,7 @@ def validate_age(*, age, upper_limit=105):
         upper_limit(int): Upper limit for age
 
     Returns:
-        float/NaT: <0 Age <106 
+        float/NaT: <0 Age <106
     """
     if isinstance(age, float):
         if age > 0 and age <= upper_limit:
@@ -196,6 +290,75 @@ def validate_age(*, age, upper_limit=105):
         return age
 
 
+# Precompiled patterns for the categorical standardisers
+FEMALE_PATTERN = re.compile(r'[fwgFWG]')
+MALE_PATTERN = re.compile(r'^[mbMB]')
+NEGATIVE_PATTERN = re.compile(r"-ve|Neg|Negative|No|0", re.IGNORECASE)
+POSITIVE_PATTERN = re.compile(
+    r"NS1|IgM|D|Yes|\+ve|Pos|Positive|1", re.IGNORECASE)
+IPD_PATTERN = re.compile(r"IPD?", re.IGNORECASE)
+OPD_PATTERN = re.compile(r"OPD?", re.IGNORECASE)
+FLOAT_CODE_PATTERN = re.compile(r"^\s*(\d+)\.0*\s*$")
+PRIVATE_PATTERN = re.compile(r"Private|Pvt", re.IGNORECASE)
+PUBLIC_PATTERN = re.compile(r"Public|Pub|Govt|Government", re.IGNORECASE)
+ACTIVE_PATTERN = re.compile(r"Acti?v?e?|A", re.IGNORECASE)
+PASSIVE_PATTERN = re.compile(r"Pas?s?i?v?e?|P", re.IGNORECASE)
+RURAL_PATTERN = re.compile(r"Rura?l?|R", re.IGNORECASE)
+URBAN_PATTERN = re.compile(r"Urba?n?|U", re.IGNORECASE)
+
+
+AGE_PATTERN = re.compile(
+    r'^(?P<value>\d+\.?\d*) *(?=(?P<unit>[m|M])?)(?=(?:[y|Y][^\d\n]*(?P<month>\d{1,2})[m|M])?)(?:[ym]?[ |.|,|-]?.*)?$')
+AGE_BINS = [0, 1, 6, 12, 18, 25, 45, 65, 105]
+
+
+def standardise_age_series(*, age: pd.Series, upper_limit: int = 105) -> tuple:
+    """Column-wise standardise_age, validate_age and age binning in one pass
+
+    Each distinct raw age is parsed once: AGE_PATTERN captures the number, a month unit and the month component of
+    year-month entries (e.g. 5y6m), years are computed with NumPy and the results are broadcast back by category code.
+
+    Args:
+        age (pd.Series): age column in the raw data
+        upper_limit (int, optional): Upper limit for age
+
+    Returns:
+        tuple: (age in years as float, NaN if invalid; age range as categorical), identical to applying
+        standardise_age, validate_age and pd.cut row by row
+    """
+    codes, uniques = pd.factorize(age)
+    uniques = np.asarray(uniques, dtype=object)
+    years = np.full(len(uniques), np.nan)
+
+    # numbers are taken as years, other non-strings are null
+    is_str = np.array([isinstance(x, str) for x in uniques], dtype=bool)
+    is_num = np.array([isinstance(x, (int, float)) for x in uniques], dtype=bool) & ~is_str
+    years[is_num] = uniques[is_num].astype(float)
+
+    if is_str.any():
+        parsed = pd.Series(uniques[is_str], dtype=object).str.extract(AGE_PATTERN)
+        value = parsed["value"].astype(float).to_numpy()
+        in_months = parsed["unit"].notna().to_numpy()
+        month = parsed["month"].astype(float).to_numpy()
+
+        # Python round for parity with standardise_age - np.round differs on halfway cases
+        as_years = np.array([round(float(x) / 12, 2) for x in value])
+        month_fraction = np.array([round(float(x) / 12, 2) for x in month])
+
+        parsed_years = value.copy()
+        parsed_years = np.where(in_months & (value < 13), as_years, parsed_years)
+        parsed_years = np.where(~in_months & ~np.isnan(month), value + month_fraction, parsed_years)
+        years[is_str] = parsed_years
+
+    # validate - 0 < age <= upper limit, ages above the limit are assumed to have an extra digit
+    years = np.where((years > 0) & (years <= upper_limit), years,
+                     np.where(years > upper_limit, years // 10, np.nan))
+
+    ages = pd.Series(np.append(years, np.nan)[codes], index=age.index, name=age.name)
+    ageRange = pd.cut(ages, bins=AGE_BINS, include_lowest=False)
+    return (ages, ageRange)
+
+
 def standardise_gender(*, gender: str) -> str:
     """Standardises gender
 
@@ -208,9 +371,9 @@ def standardise_gender(*, gender: str) -> str:
 
     gender = str(gender).upper().lstrip().rstrip()
 
-    if re.search(r'[fwgFWG]', gender):
+    if FEMALE_PATTERN.search(gender):
         return "FEMALE"
-    elif re.search(r'^[mbMB]', gender):
+    elif MALE_PATTERN.search(gender):
         return 'MALE'
     else:
         return 'UNKNOWN'
@@ -226,9 +389,11 @@ def standardise_test_result(*, result: str) -> str:
         str: Negative, Positive or Unknown
     """
     if isinstance(result, str) or isinstance(result, int):
-        if re.search(r"-ve|Neg|Negative|No|0", str(result), re.IGNORECASE):
+        # results coded 1/0 and written as floats are read back as 1.0/0.0 - match them as 1/0, or the 0 reads negative
+        result = FLOAT_CODE_PATTERN.sub(r"\1", str(result))
+        if NEGATIVE_PATTERN.search(result):
             return "NEGATIVE"
-        elif re.search(r"NS1|IgM|D|Yes|\+ve|Pos|Positive|1", str(result), re.IGNORECASE):
+        elif POSITIVE_PATTERN.search(result):
             return "POSITIVE"
     return "UNKNOWN"
 
@@ -263,9 +428,9 @@ def opd_ipd(*, s: str) -> str:
     """
 
     if isinstance(s, str):
-        if re.search(r"IPD?", s, re.IGNORECASE):
+        if IPD_PATTERN.search(s):
             return "IPD"
-        elif re.search(r"OPD?", s, re.IGNORECASE):
+        elif OPD_PATTERN.search(s):
             return "OPD"
         else:
             return pd.NA
@@ -282,9 +447,9 @@ def public_private(*, s: str) -> str:
     """
 
     if isinstance(s, str):
-        if re.search(r"Private|Pvt", s, re.IGNORECASE):
+        if PRIVATE_PATTERN.search(s):
             return "PRIVATE"
-        elif re.search(r"Public|Pub|Govt|Government", s, re.IGNORECASE):
+        elif PUBLIC_PATTERN.search(s):
             return "PUBLIC"
         else:
             return pd.NA
@@ -301,9 +466,9 @@ def active_passive(*, s: str) -> str:
     """
 
     if isinstance(s, str):
-        if re.search(r"Acti?v?e?|A", s, re.IGNORECASE):
+        if ACTIVE_PATTERN.search(s):
             return "ACTIVE"
-        elif re.search(r"Pas?s?i?v?e?|P", s, re.IGNORECASE):
+        elif PASSIVE_PATTERN.search(s):
             return "PASSIVE"
         else:
             return pd.NA
@@ -320,14 +485,131 @@ def rural_urban(*, s: str) -> str:
     """
 
     if isinstance(s, str):
-        if re.search(r"Rura?l?|R", s, re.IGNORECASE):
+        if RURAL_PATTERN.search(s):
             return "RURAL"
-        elif re.search(r"Urba?n?|U", s, re.IGNORECASE):
+        elif URBAN_PATTERN.search(s):
             return "URBAN"
         else:
             return pd.NA
 
 
+def map_unique(*, series: pd.Series, func) -> pd.Series:
+    """Applies a scalar standardiser once per distinct value of a column and maps the results back to every row
+    through the column's category codes
+
+    Args:
+        series (pd.Series): raw column
+        func (callable): scalar standardiser taking a single value
+
+    Returns:
+        pd.Series: standardised column, identical to series.apply(func)
+    """
+    codes, uniques = pd.factorize(series)
+    values = series.to_numpy(dtype=object)
+    nulls = values[codes == -1]
+    uniform = series.dtype != object or pd.api.types.infer_dtype(series, skipna=True) in ("string", "empty")
+    if uniform and len(set(map(type, nulls))) <= 1:
+        # the last slot holds the result for nulls, which factorize codes as -1
+        results = np.empty(len(uniques) + 1, dtype=object)
+        results[:-1] = [func(value) for value in np.asarray(uniques, dtype=object)]
+        if len(nulls):
+            results[-1] = func(nulls[0])
+        return pd.Series(results[codes], index=series.index, name=series.name)
+
+    # values of different types can share a code (e.g. 1, 1.0 and True, or None and NaN) and still be standardised
+    # differently - each (code, type) pair is standardised once, from its first row
+    kinds, _ = pd.factorize(series.map(type))
+    _, first, groups = np.unique(codes * (kinds.max() + 1) + kinds, return_index=True, return_inverse=True)
+    results = np.empty(len(first), dtype=object)
+    results[:] = [func(value) for value in values[first]]
+    return pd.Series(results[groups.ravel()], index=series.index, name=series.name)
+
+
+def standardise_contact_series(*, contact: pd.Series) -> pd.Series:
+    """Standardises contact numbers as text, dropping the .0 of numbers that were written as floats
+
+    Args:
+        contact (pd.Series): contact numbers, e.g. metadata.contact
+
+    Returns:
+        pd.Series: contact numbers, NaN where missing
+    """
+    contact = contact.astype("string").str.strip().str.replace(r"\.0$", "", regex=True)
+    return contact.astype(object).where(contact.notna() & (contact != ""), np.nan)
+
+
+def standardise_gender_series(*, gender: pd.Series) -> pd.Series:
+    """Standardises a gender column, see standardise_gender
+
+    Args:
+        gender (pd.Series): gender column in the raw dataset
+
+    Returns:
+        pd.Series: FEMALE, MALE, UNKNOWN
+    """
+    return map_unique(series=gender, func=lambda x: standardise_gender(gender=x))
+
+
+def standardise_test_result_series(*, result: pd.Series) -> pd.Series:
+    """Standardises a result column, see standardise_test_result
+
+    Args:
+        result (pd.Series): result column in the raw dataset
+
+    Returns:
+        pd.Series: NEGATIVE, POSITIVE, UNKNOWN
+    """
+    return map_unique(series=result, func=lambda x: standardise_test_result(result=x))
+
+
+def opd_ipd_series(*, s: pd.Series) -> pd.Series:
+    """Standardises an IPD/OPD column, see opd_ipd
+
+    Args:
+        s (pd.Series): IPD/OPD column in the dataset
+
+    Returns:
+        pd.Series: IPD, OPD or null
+    """
+    return map_unique(series=s, func=lambda x: opd_ipd(s=x))
+
+
+def public_private_series(*, s: pd.Series) -> pd.Series:
+    """Standardises a Private/Public column, see public_private
+
+    Args:
+        s (pd.Series): Private/Public column in the dataset
+
+    Returns:
+        pd.Series: PRIVATE, PUBLIC or null
+    """
+    return map_unique(series=s, func=lambda x: public_private(s=x))
+
+
+def active_passive_series(*, s: pd.Series) -> pd.Series:
+    """Standardises an Active/Passive column, see active_passive
+
+    Args:
+        s (pd.Series): Active/Passive column in the dataset
+
+    Returns:
+        pd.Series: ACTIVE, PASSIVE or null
+    """
+    return map_unique(series=s, func=lambda x: active_passive(s=x))
+
+
+def rural_urban_series(*, s: pd.Series) -> pd.Series:
+    """Standardises a Rural/Urban column, see rural_urban
+
+    Args:
+        s (pd.Series): Rural/Urban column in the dataset
+
+    Returns:
+        pd.Series: RURAL, URBAN or null
+    """
+    return map_unique(series=s, func=lambda x: rural_urban(s=x))
+
+
 def fix_symptom_date(*, symptomDate: str, resultDate: str) -> datetime.datetime:
     """If symptom date is in number of days, extracts number and converts to date as result date - number
 
@@ -365,15 +647,13 @@ def string_clean_dates(*, Date) -> datetime:
         Date (str or datetime or NaT): date in dataset
 
     Returns:
-        datetime: date in datetime format 
+        datetime: date in datetime format
     """
 
     if not re.search(r"\d", str(Date)):
         return pd.NA
-    else:
-        date = re.sub(r"\-\-", "-", str(Date))
     try:
-        date = pd.to_datetime(Date, format="mixed")
+        pd.to_datetime(Date, format="mixed")
         return Date
     except ValueError:
         return pd.NA
@@ -423,7 +703,8 @@ def fix_year_hist(*, Date: datetime.datetime, Year: int) -> datetime.datetime:
 
 
 def fix_two_dates(*, earlyDate: datetime.datetime, lateDate: datetime.datetime) -> tuple:
-    """Fixes invalid year entries, and attempts to fix logical check on symptom date>=sample date>=result date through date swapping
+    """Fixes invalid year entries, and attempts to fix logical check on symptom date>=sample date>=result date through
+    date swapping
 
     Args:
         earlyDate (datetime): First date in sequence (symptom date or sample date)
@@ -484,7 +765,8 @@ def fix_two_dates(*, earlyDate: datetime.datetime, lateDate: datetime.datetime)
             except AssertionError:  # if fix doesn't yield 31> delta > 0, retain original dates
                 return (earlyDate, lateDate)
 
-        # if difference between day of second date and month of first date is 1, try swapping day and month for second date
+        # if difference between day of second date and month of first date is 1, try swapping day and month for
+        # second date
         # e.g. 2023-08-27, 2023-06-09
         elif (lateDate.day-earlyDate.month == 1) & (lateDate.day in range(1, 13)):
             newLateDate = datetime.datetime(
@@ -496,7 +778,8 @@ def fix_two_dates(*, earlyDate: datetime.datetime, lateDate: datetime.datetime)
             except AssertionError:  # if fix doesn't yield 31> delta > 0, retain original dates
                 return (earlyDate, lateDate)
 
-        # if difference between day of first date and month of second date is -1, try swapping day and month for first date
+        # if difference between day of first date and month of second date is -1, try swapping day and month for
+        # first date
         # e.g., 2023-10-07, 2023-08-09
         elif (earlyDate.day-lateDate.month == -1):  # standalone fix to sample date
             newEarlyDate = datetime.datetime(
@@ -515,6 +798,233 @@ def fix_two_dates(*, earlyDate: datetime.datetime, lateDate: datetime.datetime)
         return (earlyDate, lateDate)
 
 
+def swap_day_month(*, Date: pd.Series) -> pd.Series:
+    """Swaps the day and month of each date, dropping the time component
+
+    Args:
+        Date (pd.Series): dates in datetime64 format
+
+    Returns:
+        pd.Series: swapped dates, NaT where null or where the day is not a valid month
+    """
+    return pd.to_datetime(pd.DataFrame({"year": Date.dt.year, "month": Date.dt.day, "day": Date.dt.month},
+                                       index=Date.index), errors="coerce")
+
+
+def fix_year_hist_series(*, Date: pd.Series, Year: int) -> pd.Series:
+    """Column-wise fix_year_hist - fixes year to current year/next year/previous year where year is not equal to the
+    current year
+
+    Args:
+        Date (pd.Series): date column in datetime64 format
+        Year (int): year of the file
+
+    Returns:
+        pd.Series: clean dates with year = current/next/previous, identical to fix_year_hist per row
+    """
+    assert pd.api.types.is_datetime64_any_dtype(Date) and isinstance(
+        Year, int), "Input datetime64 dates and int year"
+
+    off = Date.notna() & (Date.dt.year != Year)
+    if not off.any():
+        return Date.copy()
+
+    dates = Date[off]
+    years, months = dates.dt.year, dates.dt.month
+    # current year if month is not Jan or Dec, or if not from the previous/next year,
+    # else previous year for Dec and next year for Jan
+    keep_current = (~months.isin([1, 12])) | ((years - Year).abs() > 1)
+    new_years = np.where(keep_current, Year, np.where(months == 12, Year - 1, Year + 1))
+
+    fixed = Date.copy()
+    fixed[off] = pd.to_datetime(pd.DataFrame({"year": new_years, "month": months, "day": dates.dt.day},
+                                             index=dates.index))
+    return fixed
+
+
+def fix_two_dates_series(*, earlyDate: pd.Series, lateDate: pd.Series) -> tuple:
+    """Column-wise fix_two_dates - evaluates each day/month swap rule as a boolean mask, in the same order as the
+    row-wise function, and keeps a swap only where it yields 0 <= late date - early date <= 60 days
+
+    Args:
+        earlyDate (pd.Series): First date in sequence (symptom date or sample date) in datetime64 format
+        lateDate (pd.Series): Second date in sequence (sample date or result date) in datetime64 format
+
+    Returns:
+        tuple: (early dates, late dates), identical to fix_two_dates per row
+    """
+    assert pd.api.types.is_datetime64_any_dtype(earlyDate) and pd.api.types.is_datetime64_any_dtype(
+        lateDate), "Format the dates before applying this function"
+
+    delta = lateDate - earlyDate
+    # if diff between second and first date is >30 or <0, attempt to fix dates
+    invalid = earlyDate.notna() & lateDate.notna() & (
+        (delta > pd.Timedelta(30, "d")) | (delta < pd.Timedelta(0, "d")))
+
+    earlyDay, earlyMonth = earlyDate.dt.day, earlyDate.dt.month
+    lateDay, lateMonth = lateDate.dt.day, lateDate.dt.month
+
+    # rules are tried in order, and only the first rule a row meets is attempted
+    swapLate = invalid & (lateDay == earlyMonth) & (lateDay <= 12)
+    swapEarly = invalid & ~swapLate & (earlyDay == lateMonth) & (earlyDay <= 12)
+    swapBoth = invalid & ~swapLate & ~swapEarly & (earlyDay == lateDay) & (earlyDay <= 12)
+    swapLateOffByOne = invalid & ~(swapLate | swapEarly | swapBoth) & (
+        lateDay - earlyMonth == 1) & (lateDay <= 12)
+    swapEarlyOffByOne = invalid & ~(swapLate | swapEarly | swapBoth | swapLateOffByOne) & (
+        earlyDay - lateMonth == -1)
+
+    changeEarly = swapEarly | swapBoth | swapEarlyOffByOne
+    changeLate = swapLate | swapBoth | swapLateOffByOne
+    newEarlyDate = earlyDate.mask(changeEarly, swap_day_month(Date=earlyDate))
+    newLateDate = lateDate.mask(changeLate, swap_day_month(Date=lateDate))
+
+    # if fix doesn't yield 0 <= delta <= 60, retain original dates
+    newDelta = newLateDate - newEarlyDate
+    accept = (changeEarly | changeLate) & (newDelta >= pd.Timedelta(0, "d")) & (
+        newDelta <= pd.Timedelta(60, "d"))
+
+    return (earlyDate.mask(accept, newEarlyDate), lateDate.mask(accept, newLateDate))
+
+
+def fix_date_sequence(*, df: pd.DataFrame, datevars: list, fixpoint: bool = False,
+                      max_passes: int = 10) -> pd.DataFrame:
+    """Applies fix_two_dates_series to each consecutive pair of date columns (e.g. symptom -> sample -> result)
+
+    Args:
+        df (pd.DataFrame): dataset with datevars in datetime64 format
+        datevars (list): date columns in logical order
+        fixpoint (bool, optional): sweep the pairs until no date changes (up to max_passes) instead of
+            the default sweep followed by a final pass on the first pair
+        max_passes (int, optional): maximum number of sweeps when fixpoint is True
+
+    Returns:
+        pd.DataFrame: dataset with fixed dates
+    """
+    assert len(datevars) >= 2, "Invalid input: provide at least two date columns"
+
+    pairs = list(zip(datevars[:-1], datevars[1:]))
+    if not fixpoint:
+        # one sweep, then one last time on the first pair for convergence
+        for early, late in pairs + pairs[:1]:
+            df[early], df[late] = fix_two_dates_series(earlyDate=df[early], lateDate=df[late])
+        return df
+
+    for _ in range(max_passes):
+        before = df[datevars].copy()
+        for early, late in pairs:
+            df[early], df[late] = fix_two_dates_series(earlyDate=df[early], lateDate=df[late])
+        if df[datevars].equals(before):
+            break
+    return df
+
+
+# explicit formats tried in turn by parse_dates - month-first before day-first, as format="mixed" reads ambiguous
+# dates, so that bulk parsing gives the same dates (fix_date_sequence swaps day and month where the sequence shows
+# otherwise)
+DATE_FORMATS = ["%Y-%m-%d", "%m-%d-%Y", "%d-%m-%Y", "%m/%d/%Y", "%d/%m/%Y", "%m.%d.%Y", "%d.%m.%Y", "%m-%d-%y",
+                "%d-%m-%y", "%m/%d/%y", "%d/%m/%y", "%m.%d.%y", "%d.%m.%y", "%Y/%m/%d", "%d-%b-%Y", "%d-%b-%y",
+                "%d %b %Y", "%Y-%m-%d %H:%M:%S", "%m-%d-%Y %H:%M:%S", "%d-%m-%Y %H:%M:%S", "%m/%d/%Y %H:%M:%S",
+                "%d/%m/%Y %H:%M:%S"]
+# symptom dates entered as number of days before the result date, e.g. 5 days
+DAYS_PATTERN = re.compile(r"(\d+)\s?days?", re.IGNORECASE)
+
+
+def _count(counts: dict, key: str, n: int):
+    """Adds n to counts[key], if counting"""
+    if counts is not None and n:
+        counts[key] = counts.get(key, 0) + int(n)
+
+
+def parse_dates(*, dates: pd.Series, formats: list = DATE_FORMATS, counts: dict = None) -> pd.Series:
+    """Column-wise string_clean_dates and pd.to_datetime - each distinct entry is cleaned with string methods (stripped,
+    -- as -), entries without a digit are null, and the rest are parsed in bulk with each explicit format in turn. Only
+    entries no format reads are parsed one by one with format="mixed", and are null if that fails too.
+
+    Args:
+        dates (pd.Series): date column as read (strings, or datetimes)
+        formats (list, optional): strptime formats, tried in order
+        counts (dict, optional): rows parsed per format, updated - "mixed" for the residue and "invalid" for entries
+            with a number that could not be parsed
+
+    Returns:
+        pd.Series: dates as datetime64, NaT where missing or invalid
+    """
+    codes, uniques = pd.factorize(dates)
+    rows = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    uniques = pd.Series(uniques, dtype=object)
+    parsed = pd.Series(pd.NaT, index=uniques.index, dtype="datetime64[ns]")
+
+    is_str = np.array([isinstance(x, str) for x in uniques], dtype=bool)
+    text = uniques[is_str].str.strip().str.replace("--", "-", regex=False)
+    remaining = text[text.str.contains(r"\d")]
+    for date_format in formats:
+        if remaining.empty:
+            break
+        out = pd.to_datetime(remaining, format=date_format, errors="coerce")
+        ok = out.notna()
+        parsed[out.index[ok]] = out[ok]
+        _count(counts, date_format, rows[out.index[ok]].sum())
+        remaining = remaining[~ok]
+
+    # residue - strings no format reads, and non-strings with a number (e.g. datetimes)
+    other = uniques[~is_str]
+    for i, value in pd.concat([remaining, other[other.astype(str).str.contains(r"\d")]]).items():
+        try:
+            date = pd.to_datetime(value, format="mixed")
+            parsed[i] = date.tz_localize(None) if date.tzinfo else date
+            _count(counts, "mixed", rows[i])
+        except (ValueError, TypeError, OverflowError):
+            _count(counts, "invalid", rows[i])
+
+    # null entries (code -1) take the appended NaT
+    values = np.append(parsed.to_numpy(), np.datetime64("NaT", "ns"))[codes]
+    return pd.Series(values, index=dates.index)
+
+
+def symptom_days(*, symptomDate: pd.Series) -> pd.Series:
+    """Number of days in symptom dates entered as days before the result date (fix_symptom_date), e.g. 5 days
+
+    Args:
+        symptomDate (pd.Series): symptom date column as read
+
+    Returns:
+        pd.Series: number of days, NaN for other entries
+    """
+    is_str = np.array([isinstance(x, str) for x in symptomDate], dtype=bool)
+    days = symptomDate.where(is_str).astype("string").str.extract(DAYS_PATTERN, expand=False)
+    return pd.to_numeric(days, errors="coerce").astype(float)
+
+
+def normalise_dates(*, df: pd.DataFrame, datevars: list, year: int, formats: list = DATE_FORMATS,
+                    counts: dict = None) -> pd.DataFrame:
+    """Bulk fix_symptom_date, string_clean_dates and fix_year_hist for the date columns of the line list - symptom
+    dates entered as days are converted with timedelta arithmetic on the parsed result dates
+
+    Args:
+        df (pd.DataFrame): line list
+        datevars (list): date columns, including event.symptomOnsetDate and event.test.resultDate
+        year (int): year of the file
+        formats (list, optional): strptime formats, tried in order by parse_dates
+        counts (dict, optional): rows parsed per format, updated
+
+    Returns:
+        pd.DataFrame: line list with the date columns as datetime64
+    """
+    days = symptom_days(symptomDate=df["event.symptomOnsetDate"])
+    entered_as_days = days.notna()
+
+    for var in datevars:
+        dates = df[var].where(~entered_as_days) if var == "event.symptomOnsetDate" else df[var]
+        df[var] = parse_dates(dates=dates, formats=formats, counts=counts)
+
+    df.loc[entered_as_days, "event.symptomOnsetDate"] = df.loc[entered_as_days, "event.test.resultDate"] - \
+        pd.to_timedelta(days[entered_as_days], unit="D")
+
+    for var in datevars:
+        df[var] = fix_year_hist_series(Date=df[var], Year=year)
+    return df
+
+
 def clean_strings(*, s: str) -> str:
     """Standardises string entries
 
@@ -522,7 +1032,7 @@ def clean_strings(*, s: str) -> str:
         s (str): string entries in the raw dataset
 
     Returns:
-        str: null for entries without  a single alphabet, no extraspaces/whitespaces, upper case 
+        str: null for entries without  a single alphabet, no extraspaces/whitespaces, upper case
     """
 
     if isinstance(s, str):
@@ -534,97 +1044,175 @@ def clean_strings(*, s: str) -> str:
     return pd.NA
 
 
-def dist_mapping(*, stateID: str, districtName: str, regions_df: pd.DataFrame, threshold: int) -> tuple:
-    """Standardises district names and codes (based on LGD), provided the standardised state ID
+# 02 - CHUNKED EXECUTION
+
+
+def drop_seen_duplicates(*, df: pd.DataFrame, seen: set, columns: list = None) -> pd.DataFrame:
+    """Drops rows duplicated within the chunk or in earlier chunks, keeping the first - drop_duplicates across chunks
 
     Args:
-        stateID (str): standarised state ID
-        districtName (str): raw district name
-        regions_df (pd.DataFrame): regions.csv as a dataframe
-        threshold (int): cut-off for fuzzy matching
+        df (pd.DataFrame): chunk
+        seen (set): keys of rows kept from earlier chunks, updated with this chunk
+        columns (list, optional): columns compared, all if None
 
     Returns:
-        tuple: (LGD district name, LGD district code or admin_0 if not matched)
+        pd.DataFrame: chunk without duplicates
     """
+    keys = row_keys(df=df, columns=columns)
+    keep = ~keys.duplicated().to_numpy() & ~np.fromiter((key in seen for key in keys), dtype=bool, count=len(keys))
+    seen.update(keys[keep])
+    return df[keep].copy()
 
-    if pd.isna(districtName):
-        return (pd.NA, pd.NA)
 
-    districtName = districtName.upper().strip()
-    districtName = re.sub(r"GULBARGA", "KALABURAGI", districtName)
-    districtName = re.sub(r"\(?\sU\)?$", " URBAN", districtName)
-    districtName = re.sub(r"\(?\sR\)?$", " RURAL", districtName)
-    districtName = re.sub(r"BIJAPUR", "VIJAYAPURA", districtName)
-    districtName = re.sub(
-        r"B[AE]NGAL[OU]R[UE]\s?C?I?T?Y?|BBMP", "BENGALURU URBAN", districtName)
-
-    districts = regions_df[regions_df["parentID"]
-                           == stateID]["regionName"].to_list()
-    match = process.extractOne(districtName, districts, score_cutoff=threshold)
-    if match:
-        districtName = match[0]
-        districtCode = regions_df[(regions_df["parentID"] == stateID) & (
-            regions_df["regionName"] == districtName)]["regionID"].values[0]
+# 03 - OUTPUT
+
+
+PARTITION_COLS = ["year", "location.admin2.ID"]
+
+
+def write_parquet_dataset(*, df: pd.DataFrame, path: str, year: int, datevars: list = None, categorical: list = None,
+                          date_format: str = "%Y-%m-%dT%H:%M:%SZ", append: bool = False):
+    """Writes a standardised dataset as Parquet, partitioned by year and district (location.admin2.ID)
+
+    Existing files in the year/district partitions being written are replaced, so re-running a year does not
+    duplicate records. With append, files are added alongside existing ones instead - for writing a year in chunks,
+    after clearing it with remove_parquet_year.
+
+    Args:
+        df (pd.DataFrame): standardised dataset
+        path (str): root directory of the Parquet dataset
+        year (int): year of the dataset
+        datevars (list, optional): date columns, stored as datetime64 (ISO strings are parsed with date_format)
+        categorical (list, optional): enumerated columns, stored as categoricals
+        date_format (str, optional): format of date columns held as strings
+        append (bool, optional): add files to the partitions instead of replacing them
+    """
+    assert isinstance(year, int), "Invalid input: year must be an integer"
+    assert "location.admin2.ID" in df.columns, "Invalid input: df must have location.admin2.ID"
+
+    out = df.copy()
+    for col in (datevars or []):
+        if col in out.columns and not pd.api.types.is_datetime64_any_dtype(out[col]):
+            out[col] = pd.to_datetime(out[col], format=date_format)
+    for col in (categorical or []):
+        if col in out.columns:
+            # interval categories (e.g. age ranges) are stored by their labels
+            out[col] = out[col].astype("string").astype("category")
+    # object columns holding non-string values (e.g. UUIDs) are stored as strings
+    for col in out.columns:
+        if out[col].dtype == object and col not in PARTITION_COLS:
+            out[col] = out[col].astype("string")
+
+    out["year"] = year
+    if append:
+        out.to_parquet(path, partition_cols=PARTITION_COLS, index=False, existing_data_behavior="overwrite_or_ignore",
+                       basename_template=f"part-{uuid.uuid4().hex}-{{i}}.parquet")
     else:
-        districtCode = "admin_0"
-    return (districtName, districtCode)  # returns original name if unmatched
+        out.to_parquet(path, partition_cols=PARTITION_COLS, index=False, existing_data_behavior="delete_matching")
+
+
+def remove_parquet_year(*, path: str, year: int):
+    """Removes a year's partitions from a Parquet dataset written by write_parquet_dataset
+
+    Args:
+        path (str): root directory of the Parquet dataset
+        year (int): year to remove
+    """
+    shutil.rmtree(os.path.join(path, f"year={year}"), ignore_errors=True)
 
 
-def subdist_ulb_mapping(*, districtID: str, subdistName: str, regions_df: pd.DataFrame, threshold: int) -> tuple:
-    """Standardises subdistrict/ulb names and codes (based on LGD), provided the standardised district ID
+def read_parquet_dataset(*, path: str, years: list = None, districts: list = None,
+                         columns: list = None) -> pd.DataFrame:
+    """Reads a Parquet dataset written by write_parquet_dataset, loading only the requested partitions and columns
 
     Args:
-        districtID (str): standarised district ID
-        subdistName (str): raw subdistrict/ulb name
-        regions_df (pd.DataFrame): regions.csv as a dataframe
-        threshold (int): cut-off for fuzzy matching
+        path (str): root directory of the Parquet dataset
+        years (list, optional): years to load, all if None
+        districts (list, optional): district IDs (location.admin2.ID) to load, all if None
+        columns (list, optional): columns to load, all if None
 
     Returns:
-        tuple: (LGD subdistrict/ulb name, LGD subdistrict/ulb code or admin_0 if not matched)
+        pd.DataFrame: dataset with stored dtypes
     """
-    # subdist
-    if pd.isna(subdistName):
-        return (pd.NA, pd.NA)
+    filters = []
+    if years:
+        filters.append(("year", "in", [int(year) for year in years]))
+    if districts:
+        filters.append(("location.admin2.ID", "in", list(districts)))
+    return pd.read_parquet(path, columns=columns, filters=filters or None)
 
-    subdistName = subdistName.upper().strip()
-    subdistName = re.sub(r'\(?\sU\)?$', " URBAN", subdistName, re.IGNORECASE)
-    subdistName = re.sub(r'\(?\sR\)?$', " RURAL", subdistName, re.IGNORECASE)
-    subdistricts = regions_df[regions_df["parentID"]
-                              == districtID]["regionName"].to_list()
-    match = process.extractOne(
-        subdistName, subdistricts, score_cutoff=threshold)
-    if match:
-        subdistName = match[0]
-        subdistCode = regions_df[(regions_df["parentID"] == districtID) & (
-            regions_df["regionName"] == subdistName)]["regionID"].values[0]
-        return (subdistName, subdistCode)
-    else:
-        return (subdistName, "admin_0")  # returns original name if unmatched
+# 04 - RECORD LINKAGE
+# Links records of the same patient whose nameAddress is spelt differently, e.g. when reported by two labs. Rows are
+# only compared within blocks (rows agreeing on the block columns) and, within a block, with their nearest neighbours
+# in name order - so the cost grows with rows x window rather than with all pairs of rows.
 
 
-def village_ward_mapping(*, subdistID: str, villageName: str, regions_df: pd.DataFrame, threshold: int) -> tuple:
-    """Standardises village names and codes (based on LGD), provided the standardised district ID
+def contact_prefix(*, contact: pd.Series, digits: int = 5) -> pd.Series:
+    """Leading digits of the mobile number, for blocking - the country code and trunk 0 are dropped first
 
     Args:
-        subdistID (str): standarised subdistrict/ulb ID
-        villageName (str): raw village/ward name
-        df (pd.DataFrame): regions.csv as a dataframe
-        threshold (int): cut-off for fuzzy matching
+        contact (pd.Series): contact numbers, e.g. metadata.contact
+        digits (int, optional): number of leading digits kept
 
     Returns:
-        tuple: (LGD village/ward name, LGD village/ward code or admin_0 if not matched)
+        pd.Series: prefix per row, NaN where there is no number
     """
-    if pd.isna(villageName):
-        return (pd.NA, pd.NA)
+    # numbers read as floats end in .0
+    number = contact.astype("string").str.replace(r"\.0$|\D", "", regex=True).str[-10:]
+    prefix = number.str[:digits].where((number.str.len() >= digits).fillna(False)).astype(object)
+    return prefix.where(prefix.notna(), np.nan)
+
+
+def _connected_components(n: int, left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """Union-find over n nodes with numpy - every node is labelled with the lowest node of its component, by repeated
+    min-label propagation along the edges and pointer jumping"""
+    labels = np.arange(n)
+    while True:
+        low = np.minimum(labels[left], labels[right])
+        updated = labels.copy()
+        np.minimum.at(updated, left, low)
+        np.minimum.at(updated, right, low)
+        updated = updated[updated]
+        if np.array_equal(updated, labels):
+            return labels
+        labels = updated
+
+
+def link_records(*, df: pd.DataFrame, blocks: list, name: str, threshold: int = 90, window: int = 10,
+                 matcher=None) -> np.ndarray:
+    """Clusters rows referring to the same person - names are compared with their neighbours within each block and
+    matches are joined transitively
 
-    villageName = villageName.upper().strip()
-    villages = regions_df[regions_df["parentID"]
-                          == subdistID]["regionName"].to_list()
-    match = process.extractOne(villageName, villages, score_cutoff=threshold)
-    if match:
-        villageName = match[0]
-        villageCode = regions_df[(regions_df["parentID"] == subdistID) & (
-            regions_df["regionName"] == villageName)]["regionID"].values[0]
-        return (villageName, villageCode)
-    else:
-        return (villageName, "admin_0")  # returns original name if unmatched
+    Args:
+        df (pd.DataFrame): rows
+        blocks (list): columns rows must agree on to be compared (nulls agree with nulls)
+        name (str): text column compared, through normalise_text
+        threshold (int, optional): minimum token_sort_ratio (0-100) of a match
+        window (int, optional): neighbours each row is compared with in name order - blocks of up to window + 1 rows
+            are compared all-pairs
+        matcher (FuzzywuzzyMatcher | RapidfuzzMatcher, optional): scoring backend, fuzzywuzzy if None
+
+    Returns:
+        np.ndarray: position of the first row of its cluster per row - its own position if not linked
+    """
+    assert isinstance(window, int) and window > 0, "Invalid input: window must be a positive integer"
+    matcher = matcher or get_matcher()
+
+    names = normalise_text(s=df[name]).to_numpy()
+    block_keys = row_keys(df=df, columns=blocks).to_numpy()
+
+    # order by block, then by name, so that similar names in a block are neighbours
+    order = pd.DataFrame({"block": block_keys, "name": names}).sort_values(["block", "name"], kind="stable")
+    order = order.index.to_numpy()
+    has_name = pd.notna(names)
+
+    left, right = [np.zeros(0, dtype=int)], [np.zeros(0, dtype=int)]
+    for offset in range(1, min(window, len(df) - 1) + 1):
+        a, b = order[:-offset], order[offset:]
+        candidate = (block_keys[a] == block_keys[b]) & has_name[a] & has_name[b]
+        left.append(a[candidate])
+        right.append(b[candidate])
+    left, right = np.concatenate(left), np.concatenate(right)
+
+    matched = matcher.pair_scores(list(names[left]), list(names[right])) >= threshold
+    return _connected_components(len(df), left[matched], right[matched])
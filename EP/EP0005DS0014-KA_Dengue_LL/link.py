@@ -0,0 +1,127 @@
+import pandas as pd
+import os
+import argparse
+import sys
+
+# shared modules (pipeline.py, set_headers.py, ...) live in utils/ at the repo root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "utils"))
+from functions import *
+from pipeline import Pipeline
+
+# 0 - GLOBAL VARS
+# Runs after standardise.py - links records of the same patient across the districts and years given, and rewrites
+# their patient IDs in ./preprocessed and ./standardised. Tuned by config.linkage in metadata.yaml.
+
+LINKAGE_COLS=["metadata.recordID", "metadata.patientID", "metadata.nameAddress", "metadata.contact", "location.admin2.ID",
+"demographics.gender", "demographics.ageRange"]
+
+# rows are only compared with rows from the same district, of the same gender and age range and with the same mobile
+# number prefix (or no number)
+BLOCKS=["location.admin2.ID", "demographics.gender", "demographics.ageRange", "mobilePrefix"]
+
+# 1 - RECORD LINKAGE
+
+
+def read_linkage_cols(year: int, output_formats: list) -> pd.DataFrame:
+    """Reads the columns used for linkage from the year's standardised data with PII
+
+    Args:
+        year (int): year of the file
+        output_formats (list): formats written by standardise.py - csv is read if present, else parquet
+
+    Returns:
+        pd.DataFrame: linkage columns, in file order
+    """
+    if "csv" in output_formats:
+        df=pd.read_csv(f"preprocessed/{year}.csv", usecols=LINKAGE_COLS, dtype={"metadata.contact": str})
+    else:
+        df=read_parquet_dataset(path="preprocessed/parquet", years=[year], columns=LINKAGE_COLS)
+        df=df.astype({"location.admin2.ID": object, "demographics.gender": object, "demographics.ageRange": object})
+    return df[LINKAGE_COLS]
+
+
+def relink_csv(path: str, patient_ids: pd.Series):
+    """Rewrites the patient IDs of a csv output, leaving every other value as written
+
+    Args:
+        path (str): csv written by standardise.py
+        patient_ids (pd.Series): linked patient ID by record ID
+    """
+    df=pd.read_csv(path, dtype=str, keep_default_na=False)
+    df["metadata.patientID"]=df["metadata.recordID"].map(patient_ids).fillna("")
+    df.to_csv(path, index=False)
+
+
+def relink_parquet(path: str, year: int, patient_ids: pd.Series):
+    """Rewrites the patient IDs of a year of a Parquet output, replacing its partitions
+
+    Args:
+        path (str): root directory of the Parquet dataset
+        year (int): year to rewrite
+        patient_ids (pd.Series): linked patient ID by record ID
+    """
+    df=read_parquet_dataset(path=path, years=[year]).drop(columns=["year"])
+    df["location.admin2.ID"]=df["location.admin2.ID"].astype(str)
+    df["metadata.patientID"]=df["metadata.recordID"].astype(object).map(patient_ids).astype("string")
+    write_parquet_dataset(df=df, path=path, year=year)
+
+
+def run_linkage(years: list, config="metadata.yaml") -> Pipeline:
+    """Links records of the same patient across the years given and rewrites their patient IDs - each cluster of
+    linked records takes the first patient ID among its records, in year and file order
+
+    Args:
+        years (list): years standardised by standardise.py
+        config (str or dict, optional): path to metadata.yaml (parsed once per process) or the parsed metadata
+
+    Returns:
+        Pipeline: per-stage timings, memory and row counts of the run
+    """
+    assert all(isinstance(year, int) for year in years), "Invalid input: years must be integers"
+
+    D=load_metadata(config) if isinstance(config, str) else config
+    OUTPUT_FORMATS=D["config"].get("output_formats", ["csv"])
+    # token_sort_ratio cut-off, neighbours compared per row within a block, and mobile number digits in the block
+    LINKAGE=D["config"].get("linkage", {})
+
+    # per-stage timings, memory and row counts - set PIPELINE_PROFILE_STAGE to a stage name to profile it
+    pipeline=Pipeline(f"EP0005DS0014 link {'-'.join(str(year) for year in years)}")
+
+    with pipeline.stage("Read standardised files") as stage:
+        df=pd.concat([read_linkage_cols(year, OUTPUT_FORMATS) for year in years], ignore_index=True)
+        stage.output(df)
+
+    with pipeline.stage("Block", df):
+        df["mobilePrefix"]=contact_prefix(contact=df["metadata.contact"], digits=LINKAGE.get("prefix_digits", 5))
+
+    with pipeline.stage("Link records", df):
+        links=link_records(df=df, blocks=BLOCKS, name="metadata.nameAddress", threshold=LINKAGE.get("threshold", 90),
+        window=LINKAGE.get("window", 10), matcher=get_matcher(**D["config"].get("matcher", {})))
+
+        # first patient ID of each cluster - records without one (missing age/gender) take their cluster's
+        patient_ids=df["metadata.patientID"].groupby(links).transform("first")
+        relinked=(patient_ids!=df["metadata.patientID"]) & patient_ids.notna()
+        print(f"Linked {relinked.sum()} records to the patient ID of a similar record")
+        patient_ids.index=df["metadata.recordID"]
+
+    for year in years:
+        with pipeline.stage("Write outputs"):
+            for output in ["preprocessed", "standardised"]:
+                if "csv" in OUTPUT_FORMATS:
+                    relink_csv(f"{output}/{year}.csv", patient_ids)
+                if "parquet" in OUTPUT_FORMATS and os.path.exists(f"{output}/parquet/year={year}"):
+                    relink_parquet(f"{output}/parquet", year, patient_ids)
+
+    print(pipeline.summary())
+    pipeline.save(f"pipeline_report_link_{'-'.join(str(year) for year in years)}.json")
+    return pipeline
+
+
+if __name__ == "__main__":
+    # e.g. python link.py 2022 2023 - patients are linked across both years
+    parser=argparse.ArgumentParser(description="Link records of the same patient across standardised line lists")
+    parser.add_argument("years", type=int, nargs="+", help="years standardised by standardise.py")
+    parser.add_argument("--config", default="metadata.yaml", help="path to metadata.yaml")
+    args=parser.parse_args()
+
+    run_linkage(args.years, args.config)
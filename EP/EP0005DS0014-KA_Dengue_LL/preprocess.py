@@ -1,105 +1,183 @@
 import pandas as pd
 import os
 import re
-import yaml
+import argparse
 import numpy as np
-from functions import *
+from concurrent.futures import ProcessPoolExecutor
+import sys
 
-# 0 - SETTING GLOBAL VARS FROM METADATA.YAML
-with open("metadata.yaml") as f:
-    D = yaml.safe_load(f)
+# shared modules (pipeline.py, set_headers.py, ...) live in utils/ at the repo root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "utils"))
+from functions import *
+from pipeline import Pipeline
 
-COLUMN_MAP = D["column_mapping"]["historical"]
-COLUMN_VALUES = D["column_values"]
-COLUMN_MASTER = list(COLUMN_VALUES.keys())
+# 0 - GLOBAL VARS
+# metadata.yaml is parsed on first use (load_metadata) and reused for every year processed in the same process
 
-# TO CHANGE - use function with year as parameter instead of input field below
-CURRENT_YEAR = int(input("Enter the year of the file (integer)"))
+# number of worker processes for district files - None uses all CPUs, 1 runs serially
+WORKERS = None
 
 # 1 - PREPROCESSING
-main_df = pd.DataFrame()
-
-# TO ADD: Import district-wise raw files from AWS S3
-
-# Preprocess each file separately before appending to a single dataframe
-for file in os.listdir(f"./{CURRENT_YEAR}"):
-    if file.endswith(".csv"):
-        df = pd.read_csv(f"./{CURRENT_YEAR}/{file}")
-
-        # adding district name from filename
-        df["district"] = file.split(".")[0]
-
-        # drop extra empty columns
-        for col in df.columns:
-            if re.search(r"unnamed.", col, re.IGNORECASE):
-                df.drop(columns=[col], inplace=True)
-
-         # standardise test columns
-        if "test_method" in df.columns and "result" in df.columns:
-            tests = df.apply(lambda x: extract_test_method_with_result(
-                test_method=x["test_method"], result=x["result"]), axis=1)
-            df["ns1"], df["igm"] = zip(*tests)
-        elif "test_method" in df.columns:
-            tests = df.apply(lambda x: extract_test_method_without_result(
-                test_method=x["test_method"]), axis=1)
-            df["ns1"], df["igm"] = zip(*tests)
-
-        # map to new col names
-        df.columns = [map_columns(colname=col, map_dict=COLUMN_MAP)
-                      for col in df.columns]
-
-        # merging name & address
-        if "name" in df.columns and "address" in df.columns:
-            df["metadata.nameAddress"] = df["name"] + " , " + df["address"]
-            df.drop(columns=["name", "address"], inplace=True)
-        elif "name" in df.columns:
-            df.rename(columns={"name": "metadata.nameAddress"}, inplace=True)
-
-        # nullifying patient nameAddress that do not contain a single alphabet
-        df["metadata.nameAddress"] = df["metadata.nameAddress"].apply(
-            lambda x: x if re.search(r"[A-Za-z]", str(x).lstrip().rstrip()) else pd.NA)
-
-        # # dropping null patient nameAddress
-        df.dropna(subset=["metadata.nameAddress"], inplace=True, how="all")
-
-        # # extracting mobile numbers from, address and removing mobile number from address
-        if "metadata.contact" not in df.columns:
-            result = df["metadata.nameAddress"].apply(
-                lambda x: extract_contact(address=x))
-            df["metadata.nameAddress"], df["metadata.contact"] = zip(*result)
-
-        # #  separating age and gender
-        if "agegender" in df.columns:
-            demographics = df["agegender"].apply(
-                lambda x: extract_age_gender(agegender=x))
-            df["demographics.age"], df["demographics.gender"] = zip(
-                *demographics)
-
-        # dropping extraneous rows & columns
-        df.dropna(how="all", axis=0, inplace=True)
-        df.dropna(how="all", axis=1, inplace=True)
-
-        # skip if file is empty
-        if len(df) == 0:
-            continue
-
-        # append district to master
-        main_df = main_df._append(df)
-
-
-# adding standard list of columns from metadata that are not present in the dataset
-for col in COLUMN_MASTER:
-    if col not in main_df.columns:
-        main_df[col] = COLUMN_VALUES[col]["value"]
-
-# filtering and ordering dataframe cols, retaining only those in metadata.yaml
-main_df = main_df[COLUMN_MASTER]
-
-assert main_df["location.admin2.name"].nunique() == 31, "District(s) missing"
-
-# Locally export preprocessed file for standardisation instead of uploading to AWS S3
-# Note: not generating patient and metadata record ID at this stage:
-# 1) patient id requires standardised age, gender and clean name address
-# 2) record id requires de-duplication which only be done after standardising age, gender, dates, etc.
-
-main_df.to_csv(f"preprocessed_{CURRENT_YEAR}.csv", index=False)
+
+
+def preprocess_file(file: str, year: int, column_mapper: ColumnMapper) -> pd.DataFrame:
+    """Preprocesses a single district file
+
+    Args:
+        file (str): district csv file name in ./{year}
+        year (int): year of the files
+        column_mapper (ColumnMapper): mapping of raw col names to standardised col names
+
+    Returns:
+        pd.DataFrame: preprocessed district data, None if the file is empty after cleaning
+    """
+    df = pd.read_csv(f"./{year}/{file}")
+
+    # adding district name from filename
+    df["district"] = file.split(".")[0]
+
+    # drop extra empty columns
+    for col in df.columns:
+        if re.search(r"unnamed.", col, re.IGNORECASE):
+            df.drop(columns=[col], inplace=True)
+
+    # standardise test columns
+    if "test_method" in df.columns and "result" in df.columns:
+        df["ns1"], df["igm"] = extract_test_methods_series(
+            test_method=df["test_method"], result=df["result"])
+    elif "test_method" in df.columns:
+        df["ns1"], df["igm"] = extract_test_methods_series(
+            test_method=df["test_method"])
+
+    # map to new col names
+    df.columns = column_mapper.map_columns(df.columns)
+
+    # merging name & address
+    if "name" in df.columns and "address" in df.columns:
+        df["metadata.nameAddress"] = df["name"] + " , " + df["address"]
+        df.drop(columns=["name", "address"], inplace=True)
+    elif "name" in df.columns:
+        df.rename(columns={"name": "metadata.nameAddress"}, inplace=True)
+
+    # nullifying patient nameAddress that do not contain a single alphabet
+    df["metadata.nameAddress"] = df["metadata.nameAddress"].apply(
+        lambda x: x if re.search(r"[A-Za-z]", str(x).lstrip().rstrip()) else pd.NA)
+
+    # # dropping null patient nameAddress
+    df.dropna(subset=["metadata.nameAddress"], inplace=True, how="all")
+
+    # # extracting mobile numbers from, address and removing mobile number from address
+    if "metadata.contact" not in df.columns:
+        df["metadata.nameAddress"], df["metadata.contact"] = extract_contact_series(
+            address=df["metadata.nameAddress"])
+
+    # #  separating age and gender
+    if "agegender" in df.columns:
+        df["demographics.age"], df["demographics.gender"] = extract_age_gender_series(
+            agegender=df["agegender"])
+
+    # dropping extraneous rows & columns
+    df.dropna(how="all", axis=0, inplace=True)
+    df.dropna(how="all", axis=1, inplace=True)
+
+    # skip if file is empty
+    if len(df) == 0:
+        return None
+
+    return df
+
+
+def preprocess_files(year: int, column_mapper: ColumnMapper, workers: int = None) -> pd.DataFrame:
+    """Preprocesses all district files for a year in a process pool and concatenates them once
+
+    Args:
+        year (int): year of the files
+        column_mapper (ColumnMapper): mapping of raw col names to standardised col names
+        workers (int, optional): number of worker processes, defaults to the number of CPUs. 1 runs serially.
+
+    Returns:
+        pd.DataFrame: preprocessed data for all districts, in directory listing order
+    """
+    files = [file for file in os.listdir(f"./{year}") if file.endswith(".csv")]
+
+    if workers == 1:
+        frames = [preprocess_file(file, year, column_mapper) for file in files]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # map returns results in input order, so output row order does not depend on scheduling
+            frames = list(pool.map(preprocess_file, files, [year] * len(files), [column_mapper] * len(files)))
+
+    frames = [df for df in frames if df is not None]
+    return pd.concat(frames) if frames else pd.DataFrame()
+
+
+def run_preprocess(year: int, config="metadata.yaml", workers: int = WORKERS, export: bool = True) -> pd.DataFrame:
+    """Preprocesses the district files of a year into a single file with the standard columns of metadata.yaml
+
+    Args:
+        year (int): year of the files, read from ./{year}
+        config (str or dict, optional): path to metadata.yaml (parsed once per process) or the parsed metadata
+        workers (int, optional): number of worker processes for district files, defaults to WORKERS
+        export (bool, optional): write preprocessed_{year}.csv and the pipeline report
+
+    Returns:
+        pd.DataFrame: preprocessed data for the year
+    """
+    assert isinstance(year, int), "Invalid input: year must be an integer"
+
+    D = load_metadata(config) if isinstance(config, str) else config
+    column_mapper = ColumnMapper(D["column_mapping"]["historical"])
+    column_values = D["column_values"]
+    column_master = list(column_values.keys())
+
+    # per-stage timings, memory and row counts - set PIPELINE_PROFILE_STAGE to a stage name to profile it
+    pipeline = Pipeline(f"EP0005DS0014 preprocess {year}")
+
+    # TO ADD: Import district-wise raw files from AWS S3
+
+    # Preprocess each file separately before concatenating to a single dataframe
+    with pipeline.stage("Preprocess district files") as stage:
+        main_df = preprocess_files(year, column_mapper, workers=workers)
+        stage.output(main_df)
+
+    unmapped = column_mapper.unmapped_columns(main_df.columns)
+    if unmapped:
+        print(f"Columns without a mapping in metadata.yaml: {unmapped}")
+
+    with pipeline.stage("Standardise columns", main_df) as stage:
+        # adding standard list of columns from metadata that are not present in the dataset
+        for col in column_master:
+            if col not in main_df.columns:
+                main_df[col] = column_values[col]["value"]
+
+        # filtering and ordering dataframe cols, retaining only those in metadata.yaml
+        main_df = main_df[column_master]
+        stage.output(main_df)
+
+    assert main_df["location.admin2.name"].nunique() == 31, "District(s) missing"
+
+    # Locally export preprocessed file for standardisation instead of uploading to AWS S3
+    # Note: not generating patient and metadata record ID at this stage:
+    # 1) patient id requires standardised age, gender and clean name address
+    # 2) record id requires de-duplication which only be done after standardising age, gender, dates, etc.
+
+    if export:
+        with pipeline.stage("Export", main_df):
+            main_df.to_csv(f"preprocessed_{year}.csv", index=False)
+
+        print(pipeline.summary())
+        pipeline.save(f"pipeline_report_preprocess_{year}.json")
+
+    return main_df
+
+
+if __name__ == "__main__":
+    # e.g. python preprocess.py 2022 2023 - years are processed back-to-back in one process
+    parser = argparse.ArgumentParser(description="Preprocess the district files of one or more years")
+    parser.add_argument("years", type=int, nargs="+", help="years of the files, read from ./{year}")
+    parser.add_argument("--config", default="metadata.yaml", help="path to metadata.yaml")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="worker processes, 1 runs serially")
+    args = parser.parse_args()
+
+    for year in args.years:
+        run_preprocess(year, args.config, workers=args.workers)
@@ -1,154 +1,234 @@
 import pandas as pd
 import re
-import yaml
+import argparse
 import numpy as np
 import datetime
-import boto3
 from fuzzywuzzy import process
 import uuid
-from functions import *
-
-# 0 - IMPORTING GLOBAL VARS FROM METADATA.YAML
-
-# CHANGE - Import from Github
-with open("metadata.yaml") as f:
-    D=yaml.safe_load(f)
-
-STR_VARS=D["config"]["str_cols"]
-THRESHOLDS=D["config"]["thresholds"]
-PII_FIELDS=D["config"]["pii"]
+import os
+import sys
 
-CURRENT_YEAR=int(input("Enter the year of the file (integer)"))
-
-# get regions.csv
-s3 = boto3.client('s3')
-bucket_name = 'dsih-artpark-03-standardised-data'
-file_path = 'GS0015DS0034-LGD_Region_IDs_and_Names/regionids.csv'
-
-try:
-    s3.download_file(bucket_name, file_path)
-except Exception as e:
-    print(f'File did not download: {e}')
+# shared modules (pipeline.py, set_headers.py, ...) live in utils/ at the repo root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "utils"))
+from functions import *
+from pipeline import Pipeline
 
-regions=pd.read_csv("regionids.csv")
+# 0 - GLOBAL VARS
+# metadata.yaml, regionids.csv and the S3 client are loaded on first use (load_metadata, load_gazetteer) and reused
+# for every year standardised in the same process
 
+CATEGORICAL_VARS=["demographics.gender", "demographics.ageRange", "event.test.test1.result", "event.test.test2.result", 
+"case.opdOrIpd'", "case.publicOrPrivate", "case.surveillance", "case.urbanOrRural", "location.admin.hierarchy"]
 
 # 1 - STANDARDISATION
-df=pd.read_csv(f"preprocessed_{CURRENT_YEAR}.csv")
-
-# Standardise Age
-df["demographics.age"]=df["demographics.age"].apply(lambda x: standardise_age(age=x))
-
-# Validate Age - 0 to 105
-df["demographics.age"]=df["demographics.age"].apply(lambda x: validate_age(age=x))
-
-# Bin Age
-df["demographics.ageRange"]=pd.cut(df["demographics.age"].fillna(-999), bins=[0, 1, 6, 12, 18, 25, 45, 65, 105], include_lowest=False)
-df.loc[df["demographics.age"].isna(), "demographics.ageRange"]=pd.NA
-
-# Standardise Gender - MALE, FEMALE, UNKNOWN
-df["demographics.gender"]=df["demographics.gender"].apply(lambda x: standardise_gender(gender=x))
-
-### Standardise Result variables - POSITIVE, NEGATIVE, UNKNOWN
-df["event.test.test1.result"]=df["event.test.test1.result"].apply(lambda x: standardise_test_result(result=x))
-df["event.test.test2.result"]=df["event.test.test2.result"].apply(lambda x: standardise_test_result(result=x))
-
-## Generate test count - [0,1,2]
-df["event.test.numberOfTests"]=df.apply(lambda x: generate_test_count(test1=x["event.test.test1.result"], test2=x["event.test.test2.result"]), axis=1)
-
-# Standardise case variables 
-## OPD, IPD
-df["case.opdOrIpd'"]=df["case.opdOrIpd'"].apply(lambda x: opd_ipd(s=x))
-
-## PUBLIC, PRIVATE
-df["case.publicOrPrivate"]=df["case.publicOrPrivate"].apply(lambda x: public_private(s=x))
-
-## ACTIVE, PASSIVE
-df["case.surveillance"]=df["case.surveillance"].apply(lambda x: active_passive(s=x))
+# Row-local stages run on each chunk; the global stages (de-duplication, patient ID) run across chunks on
+# compact row keys
 
-# URBAN, RURAL
-df["case.urbanOrRural"]=df["case.urbanOrRural"].apply(lambda x: rural_urban(s=x))
-
-# Fix date variables
 datevars=["event.symptomOnsetDate", "event.test.sampleCollectionDate","event.test.resultDate"]
 
-# Fix symptom date where number of days is entered instead of date
-new_dates=df.apply(lambda x: fix_symptom_date(symptomDate=x["event.symptomOnsetDate"], resultDate=x["event.test.resultDate"]), axis=1)
-df["event.symptomOnsetDate"], df["event.test.resultDate"] = zip(*new_dates)
-
-# Then, string clean dates and fix year errors to current/previous (if dec)/next (if jan)
-for var in datevars:
-    df[var]=df[var].apply(lambda x: string_clean_dates(Date=x))
-    df[var]=df[var].apply(lambda x: fix_year_hist(Date=x,Year=CURRENT_YEAR))
-
-# Then, carry out year and date logical checks and fixes on symptom and sample date first
-result=df.apply(lambda x: fix_two_dates(earlyDate=x["event.symptomOnsetDate"], lateDate=x["event.test.sampleCollectionDate"]), axis=1)
-df["event.symptomOnsetDate"], df["event.test.sampleCollectionDate"] = zip(*result)
-
-# Then, carry out year and date logical checks and fixes on symptom and sample date first
-result=df.apply(lambda x: fix_two_dates(earlyDate=x["event.test.sampleCollectionDate"], lateDate=x["event.test.resultDate"]), axis=1)
-df["event.test.sampleCollectionDate"], df["event.test.resultDate"] = zip(*result)
-
-# One last time on symptom and sample date..for convergence..miracles do happen! 
-result=df.apply(lambda x: fix_two_dates(earlyDate=x["event.symptomOnsetDate"],lateDate=x["event.test.sampleCollectionDate"]), axis=1)
-df["event.symptomOnsetDate"], df["event.test.sampleCollectionDate"] = zip(*result)
-
-# format dates to ISO format
-for var in datevars:
-    df[var]=pd.to_datetime(df[var]).dt.strftime('%Y-%m-%dT%H:%M:%SZ')
-
-# Setting primary date - symptom date > sample date > result date
-df["metadata.primaryDate"]=df["event.symptomOnsetDate"].fillna(df["event.test.sampleCollectionDate"]).fillna(df["event.test.resultDate"])  # noqa: E501
-
-# Clean string vars
-for var in STR_VARS:
-    if var in df.columns:
-        df[var]=df[var].apply(lambda x: clean_strings(s=x))
-
-# Geo-mapping
-## Note: can be optimised to improve geo-mapping
-# Move BBMP from district to subdistrict/ulb field
-df.loc[df["location.admin2.name"]=="BBMP", "location.admin3.name"]="BBMP"
-
-# Map district name to standardised LGD name and code
-dists=df.apply(lambda x: dist_mapping(stateID=x["location.admin1.ID"], districtName=x["location.admin2.name"], regions_df=regions, 
-threshold=THRESHOLDS["district"]), axis=1)
-df["location.admin2.name"], df["location.admin2.ID"]=zip(*dists)
-
-assert len(df[df["location.admin2.ID"]=="admin_0"])==0, "District(s) missing"
-
-# Map subdistrict/ulb name to standardised LGD name and code
-subdist=df.apply(lambda x: subdist_ulb_mapping(districtID=x["location.admin2.ID"], subdistName=x["location.admin3.name"], regions_df=regions, 
-threshold=THRESHOLDS["subdistrict"]), axis=1)
-df["location.admin3.name"], df["location.admin3.ID"]=zip(*subdist)
-
-# Map village/ward name to standardised LGD name and code
-villages=df.apply(lambda x: village_ward_mapping(subdistID=x["location.admin3.ID"], villageName=x["location.admin5.name"], regions, THRESHOLDS["village"] ), axis=1)
-df["location.admin5.name"], df["location.admin5.ID"]=zip(*villages)
-
-# Extract admin hierarchy from admin3.ID - ULB, REVENUE, admin_0 (if missing ulb/subdistrict LGD code)
-df["location.admin.hierarchy"]=df["location.admin3.ID"].apply(lambda x: "ULB" if x.startswith("ulb") else ("REVENUE" if x.startswith("subdistrict") else "admin_0"))
-
-# Drop duplicates across all vars after standardisation
-df.drop_duplicates(inplace=True)
-
-# Generate recordID after standardisation and de-duplication
-df["metadata.recordID"]=[uuid.uuid4() for i in range(len(df))]
+# spellings matched in earlier chunks and years are reused - entries are keyed by matcher backend, so switching
+# config.matcher between years does not reuse the other backend's matches
+geo_cache=GeoCache(max_size=1000000)
 
-# Generate patient ID by grouping by nameAddress, age and gender
-df["metadata.patientID"]=df.groupby(['metadata.nameAddress', 'demographics.age', 'demographics.gender'])["metadata.patientID"].transform(lambda x: uuid.uuid4())
 
-# CHANGE - Push to AWS - To check date format when pushing to AWS directly
-if not os.path.exists("./preprocessed"):
-    os.makedirs("./preprocessed")
+def standardise_chunk(df: pd.DataFrame, year: int, config: dict, gazetteer: RegionGazetteer, geo_cache: GeoCache, 
+pipeline: Pipeline) -> pd.DataFrame:
+    """Row-local standardisation of a chunk of the preprocessed line list
 
-df.to_csv(f"preprocessed/{CURRENT_YEAR}.csv", index=False, date_format="%Y-%m-%d")
+    Args:
+        df (pd.DataFrame): chunk of the preprocessed line list
+        year (int): year of the file
+        config (dict): config section of metadata.yaml
+        gazetteer (RegionGazetteer): regionids.csv indexed by parent region
+        geo_cache (GeoCache): previously resolved spellings
+        pipeline (Pipeline): pipeline the stages are recorded in
 
-# Drop PII fields
-std=df.drop(columns=PII_FIELDS)
+    Returns:
+        pd.DataFrame: standardised chunk
+    """
+    THRESHOLDS=config["thresholds"]
 
-# CHANGE - Push to AWS - To check date format when pushing to AWS directly
-if not os.path.exists("./standardised"):
-    os.makedirs("./standardised")
+    # Standardise Age, validate age - 0 to 105, and bin age
+    with pipeline.stage("Standardise age", df):
+        df["demographics.age"], df["demographics.ageRange"]=standardise_age_series(age=df["demographics.age"])
 
-std.to_csv(f"standardised/{CURRENT_YEAR}.csv", index=False, date_format="%Y-%m-%d")
+    # Standardise contact - numbers written as floats (e.g. 9198XXXXXXXX.0) as digits
+    with pipeline.stage("Standardise contact", df):
+        df["metadata.contact"]=standardise_contact_series(contact=df["metadata.contact"])
+
+    # Standardise Gender - MALE, FEMALE, UNKNOWN
+    with pipeline.stage("Standardise gender", df):
+        df["demographics.gender"]=standardise_gender_series(gender=df["demographics.gender"])
+
+    ### Standardise Result variables - POSITIVE, NEGATIVE, UNKNOWN
+    with pipeline.stage("Standardise test results", df):
+        df["event.test.test1.result"]=standardise_test_result_series(result=df["event.test.test1.result"])
+        df["event.test.test2.result"]=standardise_test_result_series(result=df["event.test.test2.result"])
+
+        ## Generate test count - [0,1,2]
+        df["event.test.numberOfTests"]=df.apply(lambda x: generate_test_count(test1=x["event.test.test1.result"], test2=x["event.test.test2.result"]), axis=1)
+
+    # Standardise case variables 
+    with pipeline.stage("Standardise case variables", df):
+        ## OPD, IPD
+        df["case.opdOrIpd'"]=opd_ipd_series(s=df["case.opdOrIpd'"])
+
+        ## PUBLIC, PRIVATE
+        df["case.publicOrPrivate"]=public_private_series(s=df["case.publicOrPrivate"])
+
+        ## ACTIVE, PASSIVE
+        df["case.surveillance"]=active_passive_series(s=df["case.surveillance"])
+
+        # URBAN, RURAL
+        df["case.urbanOrRural"]=rural_urban_series(s=df["case.urbanOrRural"])
+
+    # Fix date variables
+    # Clean and parse dates in bulk (explicit formats, then format="mixed" for the rest), convert symptom dates entered
+    # as number of days to result date - number, and fix year errors to current/previous (if dec)/next (if jan)
+    with pipeline.stage("Normalise dates", df):
+        df=normalise_dates(df=df, datevars=datevars, year=year, formats=config.get("date_formats", DATE_FORMATS), 
+        counts=pipeline.counter("date formats"))
+
+    # Then, carry out year and date logical checks and fixes on symptom and sample date, then sample and result date,
+    # and one last time on symptom and sample date for convergence (fixpoint=True iterates until no date changes)
+    with pipeline.stage("Fix date sequence", df) as stage:
+        df=fix_date_sequence(df=df, datevars=datevars)
+
+        # format dates to ISO format
+        for var in datevars:
+            df[var]=pd.to_datetime(df[var]).dt.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+        # Setting primary date - symptom date > sample date > result date
+        df["metadata.primaryDate"]=df["event.symptomOnsetDate"].fillna(df["event.test.sampleCollectionDate"]).fillna(df["event.test.resultDate"])  # noqa: E501
+        stage.output(df)
+
+    # Clean string vars
+    with pipeline.stage("Clean strings", df):
+        for var in config["str_cols"]:
+            if var in df.columns:
+                df[var]=df[var].apply(lambda x: clean_strings(s=x))
+
+    # Geo-mapping - each unique (parent ID, name) pair is matched once and broadcast back to all rows
+    with pipeline.stage("Geo-mapping", df):
+        # Move BBMP from district to subdistrict/ulb field
+        df.loc[df["location.admin2.name"]=="BBMP", "location.admin3.name"]="BBMP"
+
+        # Map district name to standardised LGD name and code
+        df["location.admin2.name"], df["location.admin2.ID"]=geo_mapping(parentIDs=df["location.admin1.ID"], names=df["location.admin2.name"], 
+        level="district", gazetteer=gazetteer, threshold=THRESHOLDS["district"], cache=geo_cache)
+
+        assert len(df[df["location.admin2.ID"]=="admin_0"])==0, "District(s) missing"
+
+        # Map subdistrict/ulb name to standardised LGD name and code
+        df["location.admin3.name"], df["location.admin3.ID"]=geo_mapping(parentIDs=df["location.admin2.ID"], names=df["location.admin3.name"], 
+        level="subdistrict", gazetteer=gazetteer, threshold=THRESHOLDS["subdistrict"], cache=geo_cache)
+
+        # Map village/ward name to standardised LGD name and code
+        df["location.admin5.name"], df["location.admin5.ID"]=geo_mapping(parentIDs=df["location.admin3.ID"], names=df["location.admin5.name"], 
+        level="village", gazetteer=gazetteer, threshold=THRESHOLDS["village"], cache=geo_cache)
+
+        # Extract admin hierarchy from admin3.ID - ULB, REVENUE, admin_0 (if missing ulb/subdistrict LGD code)
+        df["location.admin.hierarchy"]=df["location.admin3.ID"].apply(lambda x: "ULB" if x.startswith("ulb") else ("REVENUE" if x.startswith("subdistrict") else "admin_0"))
+
+    return df
+
+
+def run_standardise(year: int, config="metadata.yaml", download_regions: bool = True) -> Pipeline:
+    """Standardises the preprocessed line list of a year (preprocessed_{year}.csv), writing the de-identified
+    standardised data to ./standardised and the data with PII to ./preprocessed
+
+    Args:
+        year (int): year of the file
+        config (str or dict, optional): path to metadata.yaml (parsed once per process) or the parsed metadata
+        download_regions (bool, optional): refresh regionids.csv from S3 on first use, else use the local copy
+
+    Returns:
+        Pipeline: per-stage timings, memory and row counts of the run
+    """
+    assert isinstance(year, int), "Invalid input: year must be an integer"
+
+    D=load_metadata(config) if isinstance(config, str) else config
+    PII_FIELDS=D["config"]["pii"]
+    # csv and/or parquet - parquet is partitioned by year and district with typed columns
+    OUTPUT_FORMATS=D["config"].get("output_formats", ["csv"])
+    # rows per chunk - the file is standardised in chunks of this size to bound memory, in one pass if not set
+    CHUNK_SIZE=D["config"].get("chunk_size")
+    # random IDs by default - with deterministic, IDs are derived from the content so re-runs keep them. Set a private
+    # namespace (a uuid) for them, as patient IDs are derived from PII
+    IDS=D["config"].get("ids", {})
+    NAMESPACES={"namespace": uuid.UUID(IDS["namespace"])} if "namespace" in IDS else {}
+
+    # per-stage timings, memory and row counts - set PIPELINE_PROFILE_STAGE to a stage name to profile it
+    pipeline=Pipeline(f"EP0005DS0014 standardise {year}")
+
+    # regions are downloaded and indexed on the first run only
+    with pipeline.stage("Load gazetteer"):
+        gazetteer=load_gazetteer(path="regionids.csv", download=download_regions, **D["config"].get("matcher", {}))
+
+    # CHANGE - Push to AWS - To check date format when pushing to AWS directly
+    if not os.path.exists("./preprocessed"):
+        os.makedirs("./preprocessed")
+    if not os.path.exists("./standardised"):
+        os.makedirs("./standardised")
+
+    # chunks append to the outputs - clear the year's parquet partitions first
+    if "parquet" in OUTPUT_FORMATS:
+        remove_parquet_year(path="preprocessed/parquet", year=year)
+        remove_parquet_year(path="standardised/parquet", year=year)
+
+    # columns are read as text and typed by the stages - read_csv would otherwise infer dtypes per chunk (e.g.
+    # metadata.contact as float in one chunk and text in the next), giving the same row different keys in each chunk
+    chunks=pd.read_csv(f"preprocessed_{year}.csv", chunksize=CHUNK_SIZE, dtype=str) if CHUNK_SIZE else [pd.read_csv(f"preprocessed_{year}.csv", dtype=str)]
+
+    # keys of rows kept so far, and patient IDs by nameAddress, age and gender
+    seen_rows=set()
+    patient_ids={}
+
+    for n, df in enumerate(pipeline.iterate("Read preprocessed file", chunks)):
+        df=standardise_chunk(df, year, D["config"], gazetteer, geo_cache, pipeline)
+
+        # Drop duplicates across all vars after standardisation
+        with pipeline.stage("Drop duplicates", df) as stage:
+            df=drop_seen_duplicates(df=df, seen=seen_rows)
+            stage.output(df)
+
+        with pipeline.stage("Generate IDs", df):
+            # Generate recordID after standardisation and de-duplication
+            df["metadata.recordID"]=record_ids(df=df, deterministic=IDS.get("deterministic", False), **NAMESPACES)
+
+            # Generate patient ID by grouping by normalised nameAddress, age and gender
+            df["metadata.patientID"]=assign_group_ids(df=df, keys=PATIENT_KEYS, ids=patient_ids, normalise=["metadata.nameAddress"], 
+            deterministic=IDS.get("deterministic", False), **NAMESPACES)
+
+        with pipeline.stage("Write outputs", df):
+            if "csv" in OUTPUT_FORMATS:
+                df.to_csv(f"preprocessed/{year}.csv", index=False, date_format="%Y-%m-%d", mode="w" if n==0 else "a", header=n==0)
+            if "parquet" in OUTPUT_FORMATS:
+                write_parquet_dataset(df=df, path="preprocessed/parquet", year=year, datevars=datevars+["metadata.primaryDate"], categorical=CATEGORICAL_VARS, append=True)
+
+            # Drop PII fields
+            std=df.drop(columns=PII_FIELDS)
+
+            if "csv" in OUTPUT_FORMATS:
+                std.to_csv(f"standardised/{year}.csv", index=False, date_format="%Y-%m-%d", mode="w" if n==0 else "a", header=n==0)
+            if "parquet" in OUTPUT_FORMATS:
+                write_parquet_dataset(df=std, path="standardised/parquet", year=year, datevars=datevars+["metadata.primaryDate"], categorical=CATEGORICAL_VARS, append=True)
+
+    print(pipeline.summary())
+    # rows parsed per date format - formats rarely hit can be dropped from config.date_formats, and frequent "mixed"
+    # entries added
+    print(pd.Series(pipeline.counter("date formats"), name="rows", dtype=int).sort_values(ascending=False))
+    pipeline.save(f"pipeline_report_{year}.json")
+    return pipeline
+
+
+if __name__ == "__main__":
+    # e.g. python standardise.py 2022 2023 - years are standardised back-to-back in one process
+    parser=argparse.ArgumentParser(description="Standardise the preprocessed line lists of one or more years")
+    parser.add_argument("years", type=int, nargs="+", help="years of the files (preprocessed_{year}.csv)")
+    parser.add_argument("--config", default="metadata.yaml", help="path to metadata.yaml")
+    parser.add_argument("--no-download", action="store_true", help="use the local regionids.csv instead of S3")
+    args=parser.parse_args()
+
+    for year in args.years:
+        run_standardise(year, args.config, download_regions=not args.no_download)
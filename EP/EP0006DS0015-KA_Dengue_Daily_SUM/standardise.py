@@ -1,159 +1,208 @@
 import pandas as pd
 import re
 import os
+import argparse
 from fuzzywuzzy import process
 import yaml
 import datetime
-import boto3
-from functions import *
-
-client = boto3.client('s3')
+import functools
+import sys
+
+# shared modules (pipeline.py, set_headers.py, ...) live in utils/ at the repo root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "utils"))
+from columns import ColumnMapper
+from resources import load_metadata, s3_client
+from geomapping import GeoCache, geo_mapping, load_gazetteer
+from identity import record_ids
+from store import DailyStore, S3Backend
+from set_headers import resolve_headers
+from pipeline import Pipeline
 
 ## -----------------------------SETTING GLOBALS-------------------------------- ##
 
-with open("metadata.yaml") as f:
-    D=yaml.safe_load(f)
+# metadata.yaml, regionids.csv, the S3 client and the store are loaded on first use and reused for every report
+# date standardised in the same process
+HEADER_UNNAMED_PATTERN=re.compile("Unnamed|NaN", re.IGNORECASE)
+HEADER_CLEAN_PATTERN=re.compile(r"[\d\-\(\)\s]+")
+
+
+@functools.lru_cache(maxsize=None)
+def column_mapper(config: str = "metadata.yaml") -> ColumnMapper:
+    """Column mapper for the current daily report layout, built once per process so resolved headers are reused"""
+    return ColumnMapper(load_metadata(config)["column_mapping"]["current"])
+
 
-COLUMN_MAP=D["column_mapping"]["current"]
-COLUMN_VALUES=D["column_values"]["current"]
-COLUMN_MASTER=list(COLUMN_VALUES.keys())
-SKIP=D["config"]["skip"]
-COLS=D["config"]["cols"]
-MIN_COLS=D["config"]["min_cols"]
-THRESHOLDS=D["config"]["thresholds"]
+@functools.lru_cache(maxsize=None)
+def default_store() -> DailyStore:
+    """Standardised data store on S3 - one object per report date, with a manifest of stored dates"""
+    return DailyStore(S3Backend(s3_client(), bucket='dsih-artpark-03-standardised-data', prefix='EP0006DS0015-KA_Dengue_Daily_SUM'))
 
-client.download_file(Bucket='dsih-artpark-03-standardised-data', Key='GS0015DS0034-LGD_Region_IDs_and_Names/regionids.csv', Filename='regionids.csv')
-regions=pd.read_csv("regionids.csv")
+
+@functools.lru_cache(maxsize=None)
+def default_geo_cache() -> GeoCache:
+    """Spellings resolved on previous days, reused across daily runs"""
+    return GeoCache("geo_cache.json", max_size=50000)
 
 
 ## -----------------------------PREPROCESS-------------------------------------- ##
 
-def standardise(raw_file_date):
-    
+def standardise_day(raw_file_date: str, store: DailyStore = None, compact: bool = False, config: str = "metadata.yaml") -> str:
+    """Standardises the daily summary for a report date from the raw file on S3, and appends it to the store
+
+    Args:
+        raw_file_date (str): report date as yyyy-mm-dd
+        store (DailyStore, optional): standardised data store, defaults to the S3 store
+        compact (bool, optional): rebuild the yearly view ({year}.csv) after appending
+        config (str, optional): path to metadata.yaml
+
+    Raises:
+        Exception: Date already exists in the standardised data
+        Exception: File is missing minimum required columns
+
+    Returns:
+        str: Success/Failure message for upload
+    """
     assert re.match(r"\d{4}\-\d{2}\-\d{2}", raw_file_date), "Invalid filename, enter as yyyy-mm-dd"
 
+    D=load_metadata(config)
+    SKIP=D["config"]["skip"]
+    COLS=D["config"]["cols"]
+    MIN_COLS=D["config"]["min_cols"]
+    THRESHOLDS=D["config"]["thresholds"]
+    # random record IDs by default - with deterministic, IDs are derived from the content so re-running a date keeps them
+    DETERMINISTIC_IDS=D["config"].get("ids", {}).get("deterministic", False)
+    COLUMN_VALUES=D["column_values"]["current"]
+    COLUMN_MASTER=list(COLUMN_VALUES.keys())
+    COLUMN_MAPPER=column_mapper(config)
+
+    store=store or default_store()
+    client=s3_client()
+    # regions are downloaded and indexed on the first report date only
+    gazetteer=load_gazetteer(path="regionids.csv", **D["config"].get("matcher", {}))
+    geo_cache=default_geo_cache()
+
+    # check the manifest before any processing
+    if store.has_date(raw_file_date):
+        raise Exception("Duplicate Alert: Date already exists in standardised data")
+
+    # per-stage timings, memory and row counts - set PIPELINE_PROFILE_STAGE to a stage name to profile it
+    pipeline=Pipeline(f"EP0006DS0015 standardise {raw_file_date}")
+
     date=pd.to_datetime(raw_file_date, format="%Y-%m-%d")
     year=date.year
 
     # downloading the raw file
-    try:
-        client.download_file(Bucket='dsih-artpark-01-raw-data', Key=f'EPRDS8-KA_Dengue_Chikungunya_SUM/Daily/{year}/By_Day/{raw_file_date}.xlsx', Filename=f'{raw_file_date}.xlsx')
-    except Exception:
-        print("Raw file not found on AWS S3")
-
-    df=pd.read_excel(f'{raw_file_date}.xlsx', skiprows=SKIP)
-
-    # drop extraneous cols (set in metadata.yaml)
-    df=df.iloc[:,:COLS]
-
-    #forward fill unnamed and nan in current columns
-    for i in range(1,len(df.columns)):
-        if (re.search("Unnamed", str(df.columns[i]), re.IGNORECASE)) or (re.search("NaN", str(df.columns[i]), re.IGNORECASE)):
-            df.columns.values[i]=df.columns.values[i-1]
-            
-    # identify index where df starts - i.e., S.No. is 1 - not ideal, explore pivot column
-    df_start=df[df.iloc[:,0]==1].index[0]
-
-    # for each header row in the dataframe (except last), forward fill if nan
-    for row in range(df_start-1):
-        df.iloc[row]=df.iloc[row].ffill()
-
-    # for each header row in the dataframe,upward merge
-    for row in range(df_start):
-        row_data=df.iloc[row].to_list()
-        for i in range(len(row_data)):
-            if not re.search("nan", str(row_data[i]), re.IGNORECASE):
-                df.columns.values[i]=re.sub(r"[\d\-\(\)\s]+", "", df.columns.values[i].strip())+"_"+ re.sub(r"[\d\-\(\)\s]+", "", str(row_data[i]).strip())
-    
-
-    # drop village, etc.
-    drop_cols=[col for col in df.columns if re.search(r"Taluk|Village|PHC|Population|Block|Remarks", col, re.IGNORECASE)]
-    df.drop(columns=drop_cols, inplace=True)
-    # remove header rows
-    df=df.iloc[df_start:,:]
-    # map cols
-    df.columns=[map_columns(col, COLUMN_MAP) for col in df.columns]
-    # check that min cols are present
-    if not set(MIN_COLS).issubset(set(df.columns)):
-        raise Exception(f"File is missing minimum required columns - {set(MIN_COLS).difference(set(df.columns))}")
-
-    # add standardised cols from metadata.yaml
-    # adding standard list of columns from metadata that are not present in the dataset
-    for col in COLUMN_MASTER:
-        if col not in df.columns:
-            df[col]=COLUMN_VALUES[col]["value"]
-
-    # extract BBMP from S.No. to district - the district 
-    df["sl_no"]=df["sl_no"].astype(str)
-    df.loc[(df["sl_no"].str.contains(r"[Cc]ity")==True), "location.admin3.name"]="BBMP"
-    df.loc[(df["location.admin3.name"]=="BBMP"), "location.admin2.name"]="BENGALURU URBAN"
-            
-    # drop total, rows with district name missing
-    df=df[(df["location.admin2.name"].str.contains(r"[Tt]otal")==False) & (df["sl_no"].str.contains(r"[Tt]otal")==False) & (df["location.admin2.name"].isna()==False)]
-    
-    # filtering dataset to retain only standardised cols
-    df=df[COLUMN_MASTER]
+    with pipeline.stage("Download raw file"):
+        try:
+            client.download_file(Bucket='dsih-artpark-01-raw-data', Key=f'EPRDS8-KA_Dengue_Chikungunya_SUM/Daily/{year}/By_Day/{raw_file_date}.xlsx', Filename=f'{raw_file_date}.xlsx')
+        except Exception:
+            print("Raw file not found on AWS S3")
+
+    with pipeline.stage("Read raw file") as stage:
+        df=pd.read_excel(f'{raw_file_date}.xlsx', skiprows=SKIP)
+
+        # drop extraneous cols (set in metadata.yaml)
+        df=df.iloc[:,:COLS]
+        stage.output(df)
+
+    # resolve multi-row headers - forward fill unnamed/nan headers and header rows, then merge header rows upward
+    # into the column names; data starts where S.No. is 1 - not ideal, explore pivot column
+    with pipeline.stage("Resolve headers", df) as stage:
+        df=resolve_headers(df, col_start_index=0, col_start_value=1, unnamed_pattern=HEADER_UNNAMED_PATTERN, 
+        ffill_header_rows=True, keep_start_row=True, pattern=HEADER_CLEAN_PATTERN, sep="_", lower=False, clean_columns=True, skip_pattern="nan")
+        stage.output(df)
+
+    with pipeline.stage("Map columns", df):
+        # drop village, etc.
+        drop_cols=[col for col in df.columns if re.search(r"Taluk|Village|PHC|Population|Block|Remarks", col, re.IGNORECASE)]
+        df.drop(columns=drop_cols, inplace=True)
+        # map cols
+        df.columns=COLUMN_MAPPER.map_columns(df.columns)
+        # check that min cols are present
+        if not set(MIN_COLS).issubset(set(df.columns)):
+            raise Exception(f"File is missing minimum required columns - {set(MIN_COLS).difference(set(df.columns))}")
+
+        # add standardised cols from metadata.yaml
+        # adding standard list of columns from metadata that are not present in the dataset
+        for col in COLUMN_MASTER:
+            if col not in df.columns:
+                df[col]=COLUMN_VALUES[col]["value"]
+
+    with pipeline.stage("Drop totals", df) as stage:
+        # extract BBMP from S.No. to district - the district 
+        df["sl_no"]=df["sl_no"].astype(str)
+        df.loc[(df["sl_no"].str.contains(r"[Cc]ity")==True), "location.admin3.name"]="BBMP"
+        df.loc[(df["location.admin3.name"]=="BBMP"), "location.admin2.name"]="BENGALURU URBAN"
+                
+        # drop total, rows with district name missing
+        df=df[(df["location.admin2.name"].str.contains(r"[Tt]otal")==False) & (df["sl_no"].str.contains(r"[Tt]otal")==False) & (df["location.admin2.name"].isna()==False)]
+        
+        # filtering dataset to retain only standardised cols
+        df=df[COLUMN_MASTER]
+        stage.output(df)
     
     # geo-mapping - districts
-    # Map district name to standardised LGD name and code
-    dists=df.apply(lambda x: dist_mapping(x["location.admin1.ID"], x["location.admin2.name"], regions, 
-    THRESHOLDS["district"]), axis=1)
-    df["location.admin2.name"], df["location.admin2.ID"]=zip(*dists)
+    with pipeline.stage("Geo-mapping", df):
+        # Map district name to standardised LGD name and code
+        df["location.admin2.name"], df["location.admin2.ID"]=geo_mapping(parentIDs=df["location.admin1.ID"], names=df["location.admin2.name"], 
+        level="district", gazetteer=gazetteer, threshold=THRESHOLDS["district"], cache=geo_cache)
 
-    assert len(df[df["location.admin2.ID"]=="admin_0"])==0, "District(s) missing"
+        assert len(df[df["location.admin2.ID"]=="admin_0"])==0, "District(s) missing"
 
-    # Map subdistrict/ulb name to standardised LGD name and code
-    subdist=df.apply(lambda x: subdist_ulb_mapping(x["location.admin2.ID"], x["location.admin3.name"], regions, 
-    THRESHOLDS["subdistrict"]), axis=1)
-    df["location.admin3.name"], df["location.admin3.ID"]=zip(*subdist)
+        # Map subdistrict/ulb name to standardised LGD name and code
+        df["location.admin3.name"], df["location.admin3.ID"]=geo_mapping(parentIDs=df["location.admin2.ID"], names=df["location.admin3.name"], 
+        level="subdistrict", gazetteer=gazetteer, threshold=THRESHOLDS["subdistrict"], cache=geo_cache)
+        geo_cache.save()
 
-    # Extract admin hierarchy from admin3.ID - ULB, REVENUE, admin_0 (if missing ulb/subdistrict LGD code)
-    df["location.admin.hierarchy"]=df["location.admin3.ID"].apply(lambda x: pd.NA if pd.isna(x) else "ULB" if x.startswith("ulb") else "REVENUE" if x.startswith("subdistrict") else "admin_0")
+        # Extract admin hierarchy from admin3.ID - ULB, REVENUE, admin_0 (if missing ulb/subdistrict LGD code)
+        df["location.admin.hierarchy"]=df["location.admin3.ID"].apply(lambda x: pd.NA if pd.isna(x) else "ULB" if x.startswith("ulb") else "REVENUE" if x.startswith("subdistrict") else "admin_0")
 
     # Drop duplicates across all vars after standardisation
-    df.drop_duplicates(inplace=True)
+    with pipeline.stage("Drop duplicates", df):
+        df.drop_duplicates(inplace=True)
 
-    # Generate recordID after standardisation and de-duplication
-    df["metadata.recordID"]=[uuid.uuid4() for i in range(len(df))]
+    with pipeline.stage("Generate metadata", df):
+        # Generate recordID after standardisation and de-duplication
+        df["metadata.recordID"]=record_ids(df=df, deterministic=DETERMINISTIC_IDS)
 
-    # Generate recordDate from filename
-    df["metadata.recordDate"]=date.strftime('%Y-%m-%dT%H:%M:%SZ')
-    df["metadata.ISOWeek"]=date.isocalendar().week
+        # Generate recordDate from filename
+        df["metadata.recordDate"]=date.strftime('%Y-%m-%dT%H:%M:%SZ')
+        df["metadata.ISOWeek"]=date.isocalendar().week
 
-    # Cleaning int cols
-    for col in df.columns:
-        if col.startswith("daily") or col.startswith("cumulative"):
-            df[col]=df[col].fillna(0).infer_objects(copy=False)
-            df[col]=df[col].astype(int)
+        # Cleaning int cols
+        for col in df.columns:
+            if col.startswith("daily") or col.startswith("cumulative"):
+                df[col]=df[col].fillna(0).infer_objects(copy=False)
+                df[col]=df[col].astype(int)
 
-    # Merge with standardised dataset
+    # Append the day to the standardised store, and rebuild the yearly view ({year}.csv) if requested
+    try:
+        with pipeline.stage("Upload", df):
+            store.append(df, raw_file_date)
+            if compact:
+                store.compact(year)
+    except Exception as e:
+        return(f"Failed: Unable to upload to S3: {e}")
+    finally:
+        print(pipeline.summary())
+        pipeline.save(f"pipeline_report_{raw_file_date}.json")
     
-    client.download_file(Bucket='dsih-artpark-03-standardised-data', Key='EP0006DS0015-KA_Dengue_Daily_SUM/2024.csv', Filename=f'{year}.csv')
-
-    main_df=pd.read_csv(f'{year}.csv')
-
-    if len(main_df[main_df["metadata.recordDate"]==date])==0:
-        main_df=main_df._append(df)
-        main_df.to_csv(f'{year}.csv', index=False)
+    os.remove(f'{raw_file_date}.xlsx')
+    return ("Success: Standardised file uploaded to S3")
 
-        main_df
+if __name__ == "__main__":
+    # e.g. python standardise.py 2024-05-13 2024-05-14 - report dates are standardised back-to-back in one process,
+    # and each year's view is rebuilt once after its last date with --compact
+    parser=argparse.ArgumentParser(description="Standardise the daily summaries of one or more report dates")
+    parser.add_argument("dates", nargs="+", help="report dates as yyyy-mm-dd")
+    parser.add_argument("--compact", action="store_true", help="rebuild the yearly views after appending")
+    args=parser.parse_args()
+
+    dates=sorted(args.dates)
+    for i, raw_file_date in enumerate(dates):
+        last_of_year=i==len(dates)-1 or dates[i+1][:4]!=raw_file_date[:4]
         try:
-            client.upload_file(Filename=f'{year}.csv', Bucket='dsih-artpark-03-standardised-data', Key=f'EP0006DS0015-KA_Dengue_Daily_SUM/{year}.csv')
+            print(raw_file_date, standardise_day(raw_file_date, compact=args.compact and last_of_year))
         except Exception as e:
-            return(f"Failed: Unable to upload to S3: {e}")
-    else:
-        raise("Duplicate Alert: Date already exists in standardised data")
-    
-    os.remove(f'{raw_file_date}.csv')
-    os.remove(f'{year}.csv')
-    return ("Success: Standardised file uploaded to S3")
-
-# sample input
-standardise("2024-05-13")
-
-
-
-
-
-
-
+            # a failed date does not stop the remaining dates
+            print(raw_file_date, f"Failed: {e}")
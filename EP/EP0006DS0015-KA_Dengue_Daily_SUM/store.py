@@ -0,0 +1,176 @@
+import io
+import json
+import os
+import pandas as pd
+
+
+## -----------------------------BACKENDS--------------------------------------- ##
+
+class LocalBackend:
+    """Stores objects as files under a local root directory - stand-in for S3 when testing"""
+
+    def __init__(self, root: str):
+        """
+        Args:
+            root (str): root directory of the store
+        """
+        self.root = root
+
+    def read(self, key: str) -> bytes:
+        """Returns the object at key, None if it does not exist"""
+        path = os.path.join(self.root, key)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            return f.read()
+
+    def write(self, key: str, data: bytes):
+        """Writes data to key, replacing any existing object"""
+        path = os.path.join(self.root, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+
+
+class S3Backend:
+    """Stores objects in an S3 bucket under a key prefix"""
+
+    def __init__(self, client, bucket: str, prefix: str):
+        """
+        Args:
+            client: boto3 S3 client
+            bucket (str): bucket name
+            prefix (str): key prefix of the dataset, e.g. EP0006DS0015-KA_Dengue_Daily_SUM
+        """
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.rstrip("/")
+
+    def read(self, key: str) -> bytes:
+        """Returns the object at key, None if it does not exist"""
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=f"{self.prefix}/{key}")
+        except self.client.exceptions.NoSuchKey:
+            return None
+        return response["Body"].read()
+
+    def write(self, key: str, data: bytes):
+        """Writes data to key, replacing any existing object"""
+        self.client.put_object(Bucket=self.bucket, Key=f"{self.prefix}/{key}", Body=data)
+
+
+## -----------------------------DAILY STORE------------------------------------ ##
+
+class DailyStore:
+    """Append-only store of the standardised daily summaries, with one object per report date
+
+    Layout (relative to the backend root):
+        {year}/manifest.json       - report dates stored for the year
+        {year}/By_Day/{date}.csv   - standardised rows for one report date
+        {year}.csv                 - compacted yearly view, rebuilt on demand by compact()
+
+    Years standardised before the store existed only have {year}.csv - its rows are split into daily objects by
+    metadata.recordDate, and listed in a new manifest, the first time the year is accessed (see migrate()), so
+    compacting never drops them and their dates are not stored twice.
+    """
+
+    def __init__(self, backend):
+        """
+        Args:
+            backend (LocalBackend | S3Backend): object storage backend
+        """
+        self.backend = backend
+
+    def dates(self, year: int) -> list:
+        """Returns the report dates stored for a year, from the manifest
+
+        Args:
+            year (int): year
+
+        Returns:
+            list: report dates as yyyy-mm-dd strings, sorted
+        """
+        manifest = self.backend.read(f"{year}/manifest.json")
+        return json.loads(manifest)["dates"] if manifest else self.migrate(year)
+
+    def migrate(self, year: int) -> list:
+        """Splits a yearly file written before the store existed ({year}.csv without a manifest) into daily objects,
+        keeping each row's text as written, and records their dates in the manifest
+
+        Args:
+            year (int): year
+
+        Returns:
+            list: report dates migrated as yyyy-mm-dd strings, sorted - empty if there is no yearly file
+        """
+        data = self.backend.read(f"{year}.csv")
+        if data is None:
+            return []
+
+        df = pd.read_csv(io.BytesIO(data), dtype=str, keep_default_na=False)
+        days = df["metadata.recordDate"].str[:10]
+        assert days.str.match(r"\d{4}-\d{2}-\d{2}$").all(), f"Invalid data: {year}.csv has rows without a recordDate"
+
+        dates = sorted(days.unique())
+        for date in dates:
+            self.backend.write(f"{year}/By_Day/{date}.csv", df[days == date].to_csv(index=False).encode())
+        # manifest is written after the days' objects, so a listed date always has its data
+        self.backend.write(f"{year}/manifest.json", json.dumps({"dates": dates}).encode())
+        return dates
+
+    def has_date(self, date: str) -> bool:
+        """Checks the manifest for a report date
+
+        Args:
+            date (str): report date as yyyy-mm-dd
+
+        Returns:
+            bool: whether the date is already stored
+        """
+        return date in self.dates(pd.to_datetime(date, format="%Y-%m-%d").year)
+
+    def append(self, df: pd.DataFrame, date: str):
+        """Stores the standardised rows for a report date and records the date in the manifest
+
+        Args:
+            df (pd.DataFrame): standardised rows for the date
+            date (str): report date as yyyy-mm-dd
+
+        Raises:
+            Exception: Date already exists in the store
+        """
+        year = pd.to_datetime(date, format="%Y-%m-%d").year
+        dates = self.dates(year)
+        if date in dates:
+            raise Exception("Duplicate Alert: Date already exists in standardised data")
+
+        self.backend.write(f"{year}/By_Day/{date}.csv", df.to_csv(index=False).encode())
+        # manifest is written after the day's object, so a listed date always has its data
+        self.backend.write(f"{year}/manifest.json", json.dumps({"dates": sorted(dates + [date])}).encode())
+
+    def read_day(self, date: str) -> pd.DataFrame:
+        """Reads the standardised rows for a report date
+
+        Args:
+            date (str): report date as yyyy-mm-dd
+
+        Returns:
+            pd.DataFrame: standardised rows, None if the date is not stored
+        """
+        year = pd.to_datetime(date, format="%Y-%m-%d").year
+        data = self.backend.read(f"{year}/By_Day/{date}.csv")
+        return pd.read_csv(io.BytesIO(data)) if data is not None else None
+
+    def compact(self, year: int) -> pd.DataFrame:
+        """Builds the yearly view from the daily objects, in report date order, and writes it as {year}.csv
+
+        Args:
+            year (int): year
+
+        Returns:
+            pd.DataFrame: standardised rows for the year
+        """
+        frames = [self.read_day(date) for date in self.dates(year)]
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        self.backend.write(f"{year}.csv", df.to_csv(index=False).encode())
+        return df
@@ -1,15 +1,139 @@
 import pandas as pd
 import re
 import os
-import boto3
-client = boto3.client('s3')
+import argparse
+import sys
+from openpyxl import Workbook, load_workbook
+
+# shared modules (pipeline.py, set_headers.py, ...) live in utils/ at the repo root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "utils"))
+from resources import s3_client
+
+# sheet names for daily reports, e.g. DDR 4-2-24 (d-m-yy) - tolerates DDR-4-2-24, D.D.R 04.02.2024, ddr 4_2_24
+SHEET_DATE_PATTERN=re.compile(r"D\.?\s*D\.?\s*R\W*?(\d{1,2})\s*[-./_ ]\s*(\d{1,2})\s*[-./_ ]\s*(\d{4}|\d{2})(?!\d)", re.IGNORECASE)
+
+## -----------------------------WORKBOOK INDEX------------------------------ ##
+
+def sheet_date(sheet_name: str) -> pd.Timestamp:
+    """Parses the report date from a daily report sheet name
+
+    Args:
+        sheet_name (str): sheet name, e.g. DDR 4-2-24
+
+    Returns:
+        pd.Timestamp: report date, None if the sheet is not a daily report
+    """
+    match=SHEET_DATE_PATTERN.search(sheet_name)
+    if not match:
+        return None
+    day, month, year=(int(group) for group in match.groups())
+    if year<100:
+        year+=2000
+    try:
+        return pd.Timestamp(year=year, month=month, day=day)
+    except ValueError:
+        return None
+
+
+def index_sheets(sheet_names: list) -> dict:
+    """Builds a report date -> sheet name map for a workbook
+
+    Args:
+        sheet_names (list): sheet names of the workbook
+
+    Returns:
+        dict: {yyyy-mm-dd: sheet name}, the first sheet is kept if a date appears twice
+    """
+    index={}
+    for sheet in sheet_names:
+        date=sheet_date(sheet)
+        if date is not None:
+            index.setdefault(date.strftime("%Y-%m-%d"), sheet)
+    return index
+
+
+def extract_sheets(workbook_path: str, report_dates: list) -> dict:
+    """Copies the sheets for the report dates into one workbook per date ({yyyy-mm-dd}.xlsx), opening the source
+    workbook once and streaming cell values - no pandas round-trip
+
+    Args:
+        workbook_path (str): workbook shared by GoK
+        report_dates (list): report dates as yyyy-mm-dd
+
+    Returns:
+        dict: {report date: extracted filename} for dates with a sheet in the workbook
+    """
+    workbook=load_workbook(workbook_path, read_only=True, data_only=True)
+    index=index_sheets(workbook.sheetnames)
+
+    extracted={}
+    for report_date in report_dates:
+        if report_date not in index:
+            continue
+        raw=Workbook(write_only=True)
+        sheet=raw.create_sheet(index[report_date])
+        for row in workbook[index[report_date]].iter_rows(values_only=True):
+            sheet.append(row)
+        raw.save(f"{report_date}.xlsx")
+        extracted[report_date]=f"{report_date}.xlsx"
+
+    workbook.close()
+    return extracted
 
 ## -----------------------------UPLOAD-------------------------------------- ##
 
 # Steps:
 ## 1. Download daily report excel workbook received from department via email
-## 2. Pass file path and report date (mentioned in email) into the extract_raw_summary function below 
+## 2. Pass file path and report date (mentioned in email) into the upload_raw_summary function below
 ## which will extract the sheet and push it to the raw bucket on AWS
+## To backfill, pass the file path and all missing report dates into backfill_raw_summary
+
+def backfill_raw_summary(raw_file_path, report_dates: list) -> dict:
+
+    """Extracts daily summaries for all specified report dates from the workbook shared by GoK in a single pass, and
+    uploads each to AWS S3. The workbook is removed if every date is uploaded.
+
+    Raises:
+        Exception: Unable to locate raw file through raw_file_path provided
+
+    Returns:
+        dict : {report date: Success/Failure message for upload}
+    """
+
+    for report_date in report_dates:
+        assert re.match(r"\d{4}\-\d{2}\-\d{2}", report_date), "Invalid report date, enter as yyyy-mm-dd"
+
+    if not os.path.exists(raw_file_path):
+        raise Exception("Unable to locate raw file")
+
+    extracted=extract_sheets(raw_file_path, report_dates)
+
+    client=s3_client()
+    results={}
+    for report_date in report_dates:
+        if report_date not in extracted:
+            results[report_date]="Failed: Sheet not found for date."
+            continue
+
+        # boto3 upload raw to aws
+        RAW_FILENAME=extracted[report_date]
+        key=f'EPRDS8-KA_Dengue_Chikungunya_SUM/Daily/{report_date[:4]}/By_Day/{RAW_FILENAME}'
+        response=client.list_objects_v2(Bucket='dsih-artpark-01-raw-data', Prefix=key)
+
+        if 'Contents' in response:
+            results[report_date]="Failed: File already exists in S3"
+        else:
+            try:
+                client.upload_file(Filename=RAW_FILENAME, Bucket='dsih-artpark-01-raw-data', Key=key)
+                results[report_date]="Success: Raw file uploaded to S3"
+            except Exception as e:
+                results[report_date]=f"Failed: Unable to upload to S3: {e}"
+        os.remove(RAW_FILENAME)
+
+    if all(result.startswith("Success") for result in results.values()):
+        os.remove(raw_file_path)
+    return (results)
+
 
 def upload_raw_summary(raw_file_path, report_date: str) -> str:
 
@@ -19,62 +143,23 @@ def upload_raw_summary(raw_file_path, report_date: str) -> str:
         Exception: Unable to locate raw file through raw_file_path provided
         Exception: Unable to find sheet for report_date specified
         Exception: Raw file already exists in AWS S3
-        Exception: Failed to upload file to AWS S3
 
     Returns:
         str : Success/Failure message for upload
     """
 
-    assert re.match(r"\d{4}\-\d{2}\-\d{2}", report_date), "Invalid report date, enter as yyyy-mm-dd"
+    result=backfill_raw_summary(raw_file_path, [report_date])[report_date]
+    if result in ["Failed: Sheet not found for date.", "Failed: File already exists in S3"]:
+        raise Exception(result)
+    return (result)
 
-    if os.path.exists(raw_file_path):
-        filename=f"wb_{report_date}.xlsx"
-        os.rename(raw_file_path, filename)
-    else:
-        raise Exception("Unable to locate raw file")
 
-    # extract date from filename
-    date_pattern=re.search(r"(\d{4}\-\d{2}\-\d{2})(.xlsx)", filename)
-    if date_pattern:
-        if date_pattern.group(1):
-            date=pd.to_datetime(date_pattern.group(1))
-            year=date.strftime("%y")
-            # assuming sheet names are in the format 4-2-24 (d-m-yy)
-            sheet_pattern=f"DDR {date.day}-{date.month}-{year}"
-        else:
-            raise Exception("Failed: Sheet not found for date.")
-    else:
-        raise Exception("Failed: Sheet not found for date.")
-
-    # open workbook, and locate sheet based on date
-    workbook=pd.ExcelFile(filename)
-    found=False
-    for sheet in workbook.sheet_names:
-        if re.search(sheet_pattern, sheet):
-            df=pd.read_excel(workbook, sheet_name=sheet)
-            RAW_FILENAME=f'{date.strftime("%Y")}-{date.strftime("%m")}-{date.strftime("%d")}.xlsx'
-            df.to_excel(f"{RAW_FILENAME}", index=False)
-            found=True
-            break
-    if not found:
-        raise Exception("Failed: Sheet not found for date.")
-
-    # boto3 upload raw to aws
-
-    response=client.list_objects_v2(Bucket='dsih-artpark-01-raw-data',Prefix=f'EPRDS8-KA_Dengue_Chikungunya_SUM/Daily/{year}/By_Day/')
-
-    if 'Contents' in response:
-        raise Exception("Failed: File already exists in S3")
-    else:
-        try:
-            client.upload_file(Filename=RAW_FILENAME, Bucket='dsih-artpark-01-raw-data', Key=f'EPRDS8-KA_Dengue_Chikungunya_SUM/Daily/{year}/By_Day/{RAW_FILENAME}')
-        except Exception as e:
-            return(f"Failed: Unable to upload to S3: {e}")
-    
-    os.remove(RAW_FILENAME)
-    os.remove(filename)
-    return ("Success: Raw file uploaded to S3")
-
-# sample input
-upload_raw_summary("wb_2024-05-13.xlsx")
+if __name__ == "__main__":
+    # e.g. python upload.py wb_2024-05-13.xlsx 2024-05-13 - pass several report dates to backfill them from one workbook
+    parser=argparse.ArgumentParser(description="Extract daily report sheets from a GoK workbook and upload them to S3")
+    parser.add_argument("workbook", help="path to the workbook shared by GoK")
+    parser.add_argument("dates", nargs="+", help="report dates as yyyy-mm-dd")
+    args=parser.parse_args()
 
+    for report_date, result in backfill_raw_summary(args.workbook, args.dates).items():
+        print(report_date, result)
@@ -5,42 +5,56 @@ import numpy as np
 import yaml
 from fuzzywuzzy import process
 import datetime
-import uuid
+import sys
 
+# shared modules (pipeline.py, set_headers.py, ...) live in utils/ at the repo root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "utils"))
+from columns import ColumnMapper
+from geomapping import RegionGazetteer, get_matcher
+from identity import record_ids
+from pipeline import Pipeline
+
+
+# per-stage timings, memory and row counts - set PIPELINE_PROFILE_STAGE to a stage name to profile it
+pipeline=Pipeline("ET0004DS0043 district summary")
 
 # 1.0 - FILES CONSOLIDATION
 
 years=["2021", "2022", "2023"]
 
-main_df=pd.DataFrame()
-
-for year in years:
-    for file in os.listdir(f"{year}"):
-        if re.search(r"summary", file, re.IGNORECASE):
-            df=pd.read_csv(f"./{year}/{file}")
-            # drop extra columns 
-            for col in df.columns:
-                if re.search(r"unnamed", col, re.IGNORECASE):
-                    df.drop(columns=col, inplace=True)
+with pipeline.stage("Files consolidation") as stage:
+    main_df=pd.DataFrame()
+
+    for year in years:
+        for file in os.listdir(f"{year}"):
+            if re.search(r"summary", file, re.IGNORECASE):
+                df=pd.read_csv(f"./{year}/{file}")
+                # drop extra columns 
+                for col in df.columns:
+                    if re.search(r"unnamed", col, re.IGNORECASE):
+                        df.drop(columns=col, inplace=True)
                    
-            # strip symbols, left/right spaces
-            df.columns=[re.sub(r"[^\w\d\s]", "", col.lstrip().rstrip()) for col in df.columns]
+                # strip symbols, left/right spaces
+                df.columns=[re.sub(r"[^\w\d\s]", "", col.lstrip().rstrip()) for col in df.columns]
     
-            # extract date from filename
-            df["dateRange"]=re.search(r"(\d+.\d+)", file).group(0)
+                # extract date from filename
+                df["dateRange"]=re.search(r"(\d+.\d+)", file).group(0)
 
-            main_df=main_df._append(df)
+                main_df=main_df._append(df)
 
-            print(df.columns)
-    path=f"./clean"
+                print(df.columns)
+        path=f"./clean"
 
-# export
-if not os.path.exists(path):
-    os.mkdir(path)
-main_df.to_csv(f"{path}/consolidated_summary(2021-2023).csv", index=False)
+    # export
+    if not os.path.exists(path):
+        os.mkdir(path)
+    main_df.to_csv(f"{path}/consolidated_summary(2021-2023).csv", index=False)
+    stage.output(main_df)
 
 # 02 - DATA CLEANING
-main_df=pd.read_csv("./clean/consolidated_summary(2021-2023).csv")
+with pipeline.stage("Read consolidated file") as stage:
+    main_df=pd.read_csv("./clean/consolidated_summary(2021-2023).csv")
+    stage.output(main_df)
 
 # LOADING CONFIG FILE
 with open("metadata.yaml", "r") as f:
@@ -48,116 +62,105 @@ with open("metadata.yaml", "r") as f:
 
 
 # renaming preprocessed columns to their standardised names
-preprocessed_col_map=D["column_mapping"]
-
-
-def MapColumns(colname:str, map_dict: dict) -> str: 
-    """_summary_
-
-    Args:
-        colname (str): Current column in DataFrame
-        map (dict): Dictionary mapping of preprocessed col names to standardised col names
+with pipeline.stage("Map columns", main_df) as stage:
+    preprocessed_col_map=ColumnMapper(D["column_mapping"], normalise=False)
 
-    Returns:
-        str: Standardised column name
-    """
+    main_df.columns=preprocessed_col_map.map_columns(main_df.columns)
 
-    for key, values in map_dict.items():
-        if colname in values:
-            return key
-    return colname
-
-main_df.columns=[MapColumns(col, preprocessed_col_map) for col in main_df.columns]
-
-# drop null rows & totals
-main_df.dropna(subset="location.district.name", inplace=True)
-main_df=main_df[main_df["location.district.name"]!="Total"]
+    # drop null rows & totals
+    main_df.dropna(subset="location.district.name", inplace=True)
+    main_df=main_df[main_df["location.district.name"]!="Total"]
+    stage.output(main_df)
 
 
 # Standardising districts
-regions=pd.read_csv("regionids.csv")
-regions=regions[regions["parentID"]==D["column_values"]["location.state.ID"]]
+with pipeline.stage("Standardise districts", main_df):
+    gazetteer=RegionGazetteer.from_csv("regionids.csv", matcher=get_matcher(**D["config"].get("matcher", {})))
+    state_id=D["column_values"]["location.state.ID"]
 
-dist_map=dict()
-for index, row in regions.iterrows():
-    dist_map[row["regionName"]]=row["regionID"]
+    dist_map=gazetteer.regions(state_id)
 
-score_config=D["config"]["district_fuzzymatch"]
+    score_config=D["config"]["district_fuzzymatch"]
 
-def DistrictMatch(x:str, districts:dict=dist_map, score=score_config)-> tuple:
-    """_summary_
+    def DistrictMatch(x:str, gazetteer:RegionGazetteer=gazetteer, parentID:str=state_id, score=score_config)-> tuple:
+        """Matches a raw district name to its LGD name and code
 
-    Args:
-        x (str): District Name in the DataFrame
-        districts (dict, optional): Dictionary mapping district names to district IDs, created from regions.csv 
+        Args:
+            x (str): District Name in the DataFrame
+            gazetteer (RegionGazetteer, optional): regionids.csv indexed by parent region
+            parentID (str, optional): standardised state ID
+            score (int, optional): cut-off for fuzzy matching
 
-    Returns:
-        tuple: _description_
-    """
-    result=process.extractOne(x, districts.keys(), score_cutoff=score_config)
+        Returns:
+            tuple: (LGD district name, LGD district code), or (raw name, nan) if not matched
+        """
+        result=gazetteer.match(parentID, x, score)
 
-    if result:
-        return result[0], districts[result[0]]
-    else:
-        return x, np.nan
+        if result:
+            return result
+        else:
+            return x, np.nan
 
-main_df["location.admin.hierarchy"]=""
-main_df["location.ulb.ID"]=""
-main_df["location.ulb.name"]=""
-main_df["location.district.name"]=main_df["location.district.name"].apply(lambda x: re.sub(r"[^\w\s]","", x.lstrip().rstrip().upper()))
-main_df["location.district.name"]=main_df["location.district.name"].apply(lambda x: re.sub(r"[^\w\s]","", x.lstrip().rstrip().upper()))
-main_df.loc[main_df["location.district.name"]=="BBMP", "location.ulb.name"]="BBMP"
-main_df.loc[main_df["location.district.name"]=="BBMP", "location.ulb.ID"]="ulb_276600"
-main_df.loc[main_df["location.district.name"]=="BBMP", "location.district.name"]="BENGALURU URBAN"
+    main_df["location.admin.hierarchy"]=""
+    main_df["location.ulb.ID"]=""
+    main_df["location.ulb.name"]=""
+    main_df["location.district.name"]=main_df["location.district.name"].apply(lambda x: re.sub(r"[^\w\s]","", x.lstrip().rstrip().upper()))
+    main_df["location.district.name"]=main_df["location.district.name"].apply(lambda x: re.sub(r"[^\w\s]","", x.lstrip().rstrip().upper()))
+    main_df.loc[main_df["location.district.name"]=="BBMP", "location.ulb.name"]="BBMP"
+    main_df.loc[main_df["location.district.name"]=="BBMP", "location.ulb.ID"]="ulb_276600"
+    main_df.loc[main_df["location.district.name"]=="BBMP", "location.district.name"]="BENGALURU URBAN"
 
-match=main_df["location.district.name"].apply(lambda x: DistrictMatch(x))
+    match=main_df["location.district.name"].apply(lambda x: DistrictMatch(x))
 
-main_df["location.district.name"], main_df["location.district.ID"]=zip(*match)
+    main_df["location.district.name"], main_df["location.district.ID"]=zip(*match)
 
-assert main_df["location.district.ID"].isna().sum()==0
+    assert main_df["location.district.ID"].isna().sum()==0
 
 
 # Add missing districts
 
-dates=main_df["dateRange"].unique()
+with pipeline.stage("Add missing districts", main_df) as stage:
+    dates=main_df["dateRange"].unique()
 
-date_dist=[]
-for date in dates:
-    date_dist.extend([(date, key,value ) for key, value in dist_map.items()])
+    date_dist=[]
+    for date in dates:
+        date_dist.extend([(date, key,value ) for key, value in dist_map.items()])
 
-dist_date_df=pd.DataFrame(date_dist, columns=["dateRange","location.district.name","location.district.ID"])
+    dist_date_df=pd.DataFrame(date_dist, columns=["dateRange","location.district.name","location.district.ID"])
 
 
-main_df=main_df.merge(dist_date_df, on=["dateRange","location.district.name","location.district.ID"], how="right")
+    main_df=main_df.merge(dist_date_df, on=["dateRange","location.district.name","location.district.ID"], how="right")
 
-main_df.groupby(by="dateRange")["location.district.name"].nunique()
+    main_df.groupby(by="dateRange")["location.district.name"].nunique()
 
-# add missing cols and their corresponding values from the config file
-master_col_vals=D["column_values"]
-master_cols=list(master_col_vals.keys())
-cols_add=set(master_cols) - set(main_df.columns)
+    # add missing cols and their corresponding values from the config file
+    master_col_vals=D["column_values"]
+    master_cols=list(master_col_vals.keys())
+    cols_add=set(master_cols) - set(main_df.columns)
 
-for col in cols_add:
-    main_df[col]=master_col_vals[col]
+    for col in cols_add:
+        main_df[col]=master_col_vals[col]
 
-main_df.loc[main_df["location.ulb.name"]=="BBMP", "location.admin.hierarchy"]="ULB"
-main_df.loc[main_df["location.ulb.name"]!="BBMP", "location.admin.hierarchy"]="REVENUE"
+    main_df.loc[main_df["location.ulb.name"]=="BBMP", "location.admin.hierarchy"]="ULB"
+    main_df.loc[main_df["location.ulb.name"]!="BBMP", "location.admin.hierarchy"]="REVENUE"
+    stage.output(main_df)
 
 # fixing date vars
     
-main_df["dateRange"]=main_df["dateRange"].str.split("_")
+with pipeline.stage("Fix dates", main_df):
+    main_df["dateRange"]=main_df["dateRange"].str.split("_")
 
-def date_time_set(x: list) -> tuple:
-    start_date=x[0]
-    end_date=x[1]
-    start_date=datetime.date(day=int(x[0][:2]), month=int(x[0][2:4]), year=int(x[0][4:8])).isoformat()
-    end_date=datetime.date(day=int(x[1][:2]), month=int(x[1][2:4]), year=int(x[1][4:8])).isoformat()
+    def date_time_set(x: list) -> tuple:
+        start_date=x[0]
+        end_date=x[1]
+        start_date=datetime.date(day=int(x[0][:2]), month=int(x[0][2:4]), year=int(x[0][4:8])).isoformat()
+        end_date=datetime.date(day=int(x[1][:2]), month=int(x[1][2:4]), year=int(x[1][4:8])).isoformat()
 
-    return([start_date, end_date], end_date)
+        return([start_date, end_date], end_date)
 
-dates=main_df["dateRange"].apply(lambda x: date_time_set(x))
+    dates=main_df["dateRange"].apply(lambda x: date_time_set(x))
 
-main_df["metadata.reportPeriod"], main_df["metadata.primaryDate"]=zip(*dates)
+    main_df["metadata.reportPeriod"], main_df["metadata.primaryDate"]=zip(*dates)
 
 
 # standardise dtypes
@@ -179,43 +182,49 @@ def NumvarStd(x):
     else:
         return x
 
-# fixing dtypes
-for col in main_df.columns:
-    if col.startswith("summary") or col.startswith("survey"):
-        if main_df[col].dtype=="object":
-            main_df[col]=main_df[col].apply(lambda x: NumvarStd(x))
-            main_df[col]=main_df[col].astype(float)
+with pipeline.stage("Standardise dtypes", main_df):
+    # fixing dtypes
+    for col in main_df.columns:
+        if col.startswith("summary") or col.startswith("survey"):
+            if main_df[col].dtype=="object":
+                main_df[col]=main_df[col].apply(lambda x: NumvarStd(x))
+                main_df[col]=main_df[col].astype(float)
+
+    # adding calc variables
+    main_df["survey.houseIndex.calc"]=(main_df["survey.housesPositive"]/main_df["survey.housesVisited"]) * 100
+    main_df["survey.containerIndex.calc"]=(main_df["survey.containersPositive"]/main_df["survey.containersSearched"]) * 100
+    main_df["survey.breteauIndex.calc"]=(main_df["survey.containersPositive"]/main_df["survey.housesVisited"]) * 100
 
-# adding calc variables
-main_df["survey.houseIndex.calc"]=(main_df["survey.housesPositive"]/main_df["survey.housesVisited"]) * 100
-main_df["survey.containerIndex.calc"]=(main_df["survey.containersPositive"]/main_df["survey.containersSearched"]) * 100
-main_df["survey.breteauIndex.calc"]=(main_df["survey.containersPositive"]/main_df["survey.housesVisited"]) * 100
+    # rounding-up int cols
+    int_cols=['summary.noOfTaluks', 'summary.noOfPhcs','summary.noOfHouses', 'survey.housesVisited', 'survey.housesPositive','survey.containersSearched', 'survey.containersPositive', 'survey.containersReduced']
 
-# rounding-up int cols
-int_cols=['summary.noOfTaluks', 'summary.noOfPhcs','summary.noOfHouses', 'survey.housesVisited', 'survey.housesPositive','survey.containersSearched', 'survey.containersPositive', 'survey.containersReduced']
+    for col in int_cols:
+        main_df[col]=main_df[col].round(0)
 
-for col in int_cols:
-    main_df[col]=main_df[col].round(0)
 
+    float_cols=['survey.houseIndex', 'survey.containerIndex', 'survey.breteauIndex', 'survey.houseIndex.calc', 'survey.containerIndex.calc', 'survey.breteauIndex.calc']
 
-float_cols=['survey.houseIndex', 'survey.containerIndex', 'survey.breteauIndex', 'survey.houseIndex.calc', 'survey.containerIndex.calc', 'survey.breteauIndex.calc']
+    for col in float_cols:
+        main_df[col]=main_df[col].round(2)
 
-for col in float_cols:
-    main_df[col]=main_df[col].round(2)
+    # nullifying invalid 0's
+    main_df.loc[main_df["survey.housesVisited"].isna(),"survey.houseIndex"]=np.nan
+    main_df.loc[main_df["survey.containersSearched"].isna(),"survey.containerIndex"]=np.nan
+    main_df.loc[main_df["survey.housesVisited"].isna(),"survey.breteauIndex"]=np.nan
 
-# nullifying invalid 0's
-main_df.loc[main_df["survey.housesVisited"].isna(),"survey.houseIndex"]=np.nan
-main_df.loc[main_df["survey.containersSearched"].isna(),"survey.containerIndex"]=np.nan
-main_df.loc[main_df["survey.housesVisited"].isna(),"survey.breteauIndex"]=np.nan
+with pipeline.stage("Export", main_df) as stage:
+    # creating uuids
+    main_df["metadata.recordID"]=record_ids(df=main_df)
 
-# creating uuids
-main_df["metadata.recordID"]=[uuid.uuid4() for i in range(len(main_df))]
+    # filtering & ordering dataset
+    main_df=main_df[master_cols]
 
-# filtering & ordering dataset
-main_df=main_df[master_cols]
+    print(main_df.columns, len(main_df))
 
-print(main_df.columns, len(main_df))
+    main_df.to_csv("ka-dengue-larval-survey.csv", index=False)
+    stage.output(main_df)
 
-main_df.to_csv("ka-dengue-larval-survey.csv", index=False)
+print(pipeline.summary())
+pipeline.save("pipeline_report_district_summary.json")
 
 # The End!
@@ -0,0 +1,13 @@
+import os
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATASET_DIR = os.path.join(REPO_DIR, "EP", "EP0005DS0014-KA_Dengue_LL")
+DAILY_DIR = os.path.join(REPO_DIR, "EP", "EP0006DS0015-KA_Dengue_Daily_SUM")
+SURVEY_DIR = os.path.join(REPO_DIR, "CS", "CS0023DS0056-Bengaluru_Water_Tanker_Survey")
+
+# the scripts put utils/ on sys.path themselves - the tests import the shared modules, the line-list scripts, the
+# synthetic inputs of the benchmarks, the daily summary store and the survey's geocoding module directly. The daily
+# summary's standardise.py is shadowed by the line list's, only its store module is imported
+sys.path[:0] = [os.path.join(REPO_DIR, "utils"), DATASET_DIR, os.path.join(DATASET_DIR, "benchmarks"), SURVEY_DIR,
+                DAILY_DIR]
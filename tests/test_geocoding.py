@@ -0,0 +1,169 @@
+import asyncio
+import os
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("googlemaps")
+
+import geocoding  # noqa: E402
+from geocoding import CentroidIndex, GeocodeCache, GeocodeError, geocode_many, geocode_series, haversine  # noqa: E402
+
+CENTROIDS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "pincode_centroids.csv")
+
+
+@pytest.fixture
+def centroids():
+    return CentroidIndex.from_csv(CENTROIDS_FILE, key="pincode")
+
+
+def test_lookup(centroids):
+    keys = pd.Series(["560001", 560034.0, "#12, 4th Cross, Koramangala, Bengaluru 560034", "560999", np.nan, "Hebbal"])
+    lat, long = centroids.lookup(keys)
+    assert lat.iloc[:3].tolist() == [12.9716, 12.9352, 12.9352]
+    assert long.iloc[:3].tolist() == [77.5946, 77.6245, 77.6245]
+    assert lat.iloc[3:].isna().all() and long.iloc[3:].isna().all()
+
+    assert centroids.geocode("Whitefield 560066") == (12.9698, 77.75)
+    with pytest.raises(GeocodeError):
+        centroids.geocode("560999")
+
+
+def test_nearest_matches_brute_force(centroids):
+    # points across and around Bengaluru, against the closest centroid by great-circle distance
+    table = pd.read_csv(CENTROIDS_FILE, dtype={"pincode": str})
+    rng = np.random.default_rng(0)
+    for lat, long in zip(rng.uniform(12.6, 13.3, 200), rng.uniform(77.3, 78.0, 200)):
+        dists = [haversine(lat, long, row.lat, row.long) for row in table.itertuples()]
+        pincode, dist = centroids.nearest(lat, long)
+        assert pincode == table["pincode"].iloc[int(np.argmin(dists))]
+        assert dist == pytest.approx(min(dists))
+
+    assert centroids.nearest(12.9716, 77.5946) == ("560001", 0.0)
+
+
+def test_nearest_on_empty_table():
+    empty = CentroidIndex(pd.DataFrame({"pincode": [], "lat": [], "long": []}))
+    assert empty.nearest(12.97, 77.59) == (None, None)
+
+
+class FakeGeocoder:
+    """Geocodes any address to a fixed point, failing the first fail_times calls per address"""
+
+    def __init__(self, fail_times: int = 0, retryable: bool = True):
+        self.fail_times = fail_times
+        self.retryable = retryable
+        self.calls = {}
+
+    def geocode(self, full_address: str) -> tuple:
+        self.calls[full_address] = self.calls.get(full_address, 0) + 1
+        if self.calls[full_address] <= self.fail_times:
+            raise GeocodeError("Status OVER_QUERY_LIMIT", retryable=self.retryable)
+        return (12.97, 77.59)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Wall clock of the geocoding module, advanced by hand"""
+    now = SimpleNamespace(time=1_700_000_000.0)
+    monkeypatch.setattr(geocoding, "time", SimpleNamespace(time=lambda: now.time, monotonic=time.monotonic))
+    return now
+
+
+def test_cache_expiry(tmp_path, clock):
+    cache = GeocodeCache(str(tmp_path / "cache.sqlite"), ttl_days=1)
+    cache.set_many({"560001": (12.97, 77.59), "560034": (12.93, 77.62)})
+    assert cache.get_many(["560001", "560034", "560066"]) == {"560001": (12.97, 77.59), "560034": (12.93, 77.62)}
+
+    # entries persist across connections, until they expire
+    cache.close()
+    cache = GeocodeCache(str(tmp_path / "cache.sqlite"), ttl_days=1)
+    clock.time += 23 * 60 * 60
+    assert len(cache.get_many(["560001", "560034"])) == 2
+    clock.time += 2 * 60 * 60
+    assert cache.get_many(["560001", "560034"]) == {}
+    cache.close()
+
+
+def test_cache_evicts_oldest(tmp_path, clock):
+    cache = GeocodeCache(str(tmp_path / "cache.sqlite"), max_size=2)
+    for pincode in ["560001", "560034", "560066"]:
+        cache.set_many({pincode: (12.97, 77.59)})
+        clock.time += 1
+    assert sorted(cache.get_many(["560001", "560034", "560066"])) == ["560034", "560066"]
+    cache.close()
+
+
+def test_geocode_series_looks_up_each_address_once(tmp_path):
+    cache = GeocodeCache(str(tmp_path / "cache.sqlite"))
+    addresses = pd.Series(["12, MG Road", " 12,  mg road ", "560034", None, "12, MG Road"])
+
+    geocoder = FakeGeocoder()
+    lat, long = geocode_series(addresses=addresses, geocoder=geocoder, cache=cache)
+    assert geocoder.calls == {"12,MG ROAD": 1, "560034": 1}
+    assert lat.isna().tolist() == [False, False, False, True, False]
+
+    # a second run is served from the cache
+    geocoder = FakeGeocoder()
+    pd.testing.assert_series_equal(geocode_series(addresses=addresses, geocoder=geocoder, cache=cache)[1], long)
+    assert geocoder.calls == {}
+    cache.close()
+
+
+def test_retries_with_backoff():
+    geocoder = FakeGeocoder(fail_times=2)
+    start = time.monotonic()
+    found, failures = geocode_many(addresses=["560001", "560034"], geocoder=geocoder, concurrency=2, retries=2,
+                                   backoff=0.05)
+    # waits of at least 0.05s and 0.1s before the two retries
+    assert time.monotonic() - start >= 0.15
+    assert found == {"560001": (12.97, 77.59), "560034": (12.97, 77.59)}
+    assert failures.empty and geocoder.calls == {"560001": 3, "560034": 3}
+
+
+def test_failure_report(tmp_path):
+    # out of retries
+    found, failures = geocode_many(addresses=["560001"], geocoder=FakeGeocoder(fail_times=3), retries=2, backoff=0)
+    assert found == {}
+    assert failures.to_dict("records") == [{"address": "560001", "error": "Status OVER_QUERY_LIMIT", "attempts": 3}]
+
+    # permanent failures are not retried
+    geocoder = FakeGeocoder(fail_times=1, retryable=False)
+    found, failures = geocode_many(addresses=["560001"], geocoder=geocoder, retries=2, backoff=0)
+    assert found == {} and failures["attempts"].tolist() == [1] and geocoder.calls == {"560001": 1}
+
+    # geocode_series writes the report
+    report = tmp_path / "failures.csv"
+    geocoder = FakeGeocoder(fail_times=1, retryable=False)
+    lat, _ = geocode_series(addresses=pd.Series(["560001", "560034"]), geocoder=geocoder, failure_report=str(report))
+    assert lat.isna().all()
+    assert pd.read_csv(report, dtype={"address": str})["address"].tolist() == ["560001", "560034"]
+
+
+def test_rate_limit():
+    class TimedGeocoder:
+        """Async geocoder recording when each request is sent and how many are in flight"""
+
+        def __init__(self):
+            self.sent, self.in_flight, self.max_in_flight = [], 0, 0
+
+        async def geocode(self, full_address: str) -> tuple:
+            self.sent.append(time.monotonic())
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            await asyncio.sleep(0.01)
+            self.in_flight -= 1
+            return (12.97, 77.59)
+
+    geocoder = TimedGeocoder()
+    start = time.monotonic()
+    found, _ = geocode_many(addresses=[str(560001 + i) for i in range(30)], geocoder=geocoder, concurrency=5, rate=20)
+    assert len(found) == 30
+    assert geocoder.max_in_flight <= 5
+    # a burst of 20 (one second of tokens), then the rest at 20 per second
+    assert time.monotonic() - start >= 0.45
+    sent = np.array(geocoder.sent) - start
+    assert all((sent <= t + 0.05).sum() <= 20 + 20 * t for t in np.arange(0, 0.6, 0.05))
@@ -0,0 +1,21 @@
+import pandas as pd
+
+from identity import assign_group_ids, normalise_text
+
+PATIENTS = pd.DataFrame({"metadata.nameAddress": ["ರಾಮ Ward 5", "ಸೀತಾ Ward 5", "ರಾಮ, ward-5"],
+                         "demographics.age": [34.0, 34.0, 34.0],
+                         "demographics.gender": ["MALE", "MALE", "MALE"]})
+
+
+def test_normalise_text_keeps_kannada():
+    normalised = normalise_text(s=PATIENTS["metadata.nameAddress"])
+    assert normalised.tolist() == ["ರಾಮ WARD 5", "ಸೀತಾ WARD 5", "ರಾಮ WARD 5"]
+
+
+def test_kannada_names_get_separate_patient_ids():
+    for deterministic in [False, True]:
+        ids = assign_group_ids(df=PATIENTS, keys=list(PATIENTS.columns), normalise=["metadata.nameAddress"],
+                               deterministic=deterministic)
+        # different patients in the same ward are told apart, spelling variants of one patient are not
+        assert ids[0] != ids[1]
+        assert ids[0] == ids[2]
@@ -0,0 +1,233 @@
+import datetime
+import importlib.util
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from functions import (active_passive, active_passive_series, extract_age_gender, extract_age_gender_series,
+                       extract_contact, extract_contact_series, extract_test_method_with_result,
+                       extract_test_method_without_result, extract_test_methods_series, fix_date_sequence,
+                       fix_symptom_date, fix_two_dates, fix_two_dates_series, fix_year_hist, fix_year_hist_series,
+                       map_unique, normalise_dates, opd_ipd, opd_ipd_series, parse_dates, public_private,
+                       public_private_series, rural_urban, rural_urban_series, standardise_age, standardise_age_series,
+                       standardise_gender, standardise_gender_series, standardise_test_result,
+                       standardise_test_result_series, string_clean_dates, swap_day_month, validate_age)
+
+CONTACTS = [None, np.nan, 9845012345, "", "RAMESH K, HEBBAL", "RAMESH K 9845012345, HEBBAL",
+            "RAMESH K\n9845012345\nHEBBAL", "9845012345 / 9900112233 / 9845012345", "919845012345 SUMA",
+            "ರಮೇಶ್ 9845012345 ಹೆಬ್ಬಾಳ", "ರಮೇಶ್ ೯೮೪೫೦೧೨೩೪೫", "RAMESH ೯೮೪೫೦೧೨೩೪೫ / 9900112233"]
+AGE_GENDERS = [None, np.nan, 25, 25.0, "", "25Y/M", "6M/Female", "/F", "25/", "25", "೨೫/M", "25Y/M\n30Y/F",
+               "25Y/M 30Y/F", "25Y/M", " 40 Yrs / Male "]
+# date entries - nulls, formats month-first and day-first, times, leap days, invalid dates and datetimes
+DATES = [None, np.nan, pd.NaT, "", "NA", "2023-06-01", " 2023-06-01 ", "2023--06--01", "05-06-2023", "13-06-2023",
+         "05/06/2023", "13/06/23", "06.13.2023", "2023/06/01", "1-Jun-2023", "01 Jun 2023", "2023-06-01 10:30:00",
+         "06/01/2023 10:30", "2024-02-29", "2023-02-29", "31-04-2023", "5 days", "June 1, 2023",
+         datetime.datetime(2023, 6, 1, 10, 30), pd.Timestamp("2023-06-01"), "2023-06-01"]
+# test methods, and the results entered alongside them
+TEST_METHODS = [None, np.nan, pd.NA, "", "NS1", "IgM", "ns1 igm", "NS1+IgM", "NS1/IGM ELISA", "Elisa", "RDT", 1,
+                "IgM", "NS1"]
+TEST_RESULTS = ["Positive", "Negative", "Positive", "Positive", "Positive", "Negative", None, np.nan, "Pos",
+                "Positive", "", "Positive", 1, "NS1"]
+# ages in years, months and years-months, beyond the upper limit, non-positive and unparseable
+AGES = [None, np.nan, pd.NA, 25, 25.0, 0, -3, 150, 1050, "", "25", "25.5", "105", "106", "0", "6m", "6 M", "0.5m",
+        "1.5 months", "15m", "5y6m", "5Y 6M", "5 yrs 11m", "5.5y", "25 years", "abc", "y25", "೨೫", "25\n"]
+# entries of the categorical columns - nulls of each kind, numbers equal across types, codes as text and words
+CATEGORIES = [None, np.nan, pd.NA, 1, 1.0, True, 0, "", " ", "1", "1.0", "0.0", "10", "Male", "m ", "f", "Boy",
+              "GIRL", "W", "ಗಂಡು", "Positive", "-ve", "NS1 positive", "Neg", "IPD", "opd", "Pvt", "Govt", "Active", "p",
+              "Rural", "u", "XYZ", "Male"]
+
+
+def parse_date(value):
+    """string_clean_dates and pd.to_datetime, on the entry stripped and with -- as - (as parse_dates cleans it)"""
+    if isinstance(value, str):
+        value = value.strip().replace("--", "-")
+    value = string_clean_dates(Date=value)
+    return pd.NaT if pd.isna(value) else pd.to_datetime(value, format="mixed")
+
+
+# each column-wise function against its scalar function applied row by row - (series function, scalar function,
+# column values per argument)
+CASES = [
+    pytest.param(lambda s: extract_contact_series(address=s), lambda x: extract_contact(address=x), [CONTACTS],
+                 id="extract_contact"),
+    pytest.param(lambda s: extract_age_gender_series(agegender=s), lambda x: extract_age_gender(agegender=x),
+                 [AGE_GENDERS], id="extract_age_gender"),
+    pytest.param(lambda s: standardise_age_series(age=s)[0], lambda x: validate_age(age=standardise_age(age=x)),
+                 [AGES], id="standardise_age"),
+    pytest.param(lambda s: extract_test_methods_series(test_method=s),
+                 lambda x: extract_test_method_without_result(test_method=x), [TEST_METHODS],
+                 id="extract_test_method_without_result"),
+    pytest.param(lambda s, r: extract_test_methods_series(test_method=s, result=r),
+                 lambda x, y: extract_test_method_with_result(test_method=x, result=y), [TEST_METHODS, TEST_RESULTS],
+                 id="extract_test_method_with_result"),
+    pytest.param(lambda s: parse_dates(dates=s), parse_date, [DATES], id="parse_dates"),
+    pytest.param(lambda s: map_unique(series=s, func=repr), repr, [CATEGORIES], id="map_unique"),
+    pytest.param(lambda s: standardise_gender_series(gender=s), lambda x: standardise_gender(gender=x),
+                 [CATEGORIES], id="standardise_gender"),
+    pytest.param(lambda s: standardise_test_result_series(result=s), lambda x: standardise_test_result(result=x),
+                 [CATEGORIES], id="standardise_test_result"),
+    pytest.param(lambda s: opd_ipd_series(s=s), lambda x: opd_ipd(s=x), [CATEGORIES], id="opd_ipd"),
+    pytest.param(lambda s: public_private_series(s=s), lambda x: public_private(s=x), [CATEGORIES],
+                 id="public_private"),
+    pytest.param(lambda s: active_passive_series(s=s), lambda x: active_passive(s=x), [CATEGORIES],
+                 id="active_passive"),
+    pytest.param(lambda s: rural_urban_series(s=s), lambda x: rural_urban(s=x), [CATEGORIES], id="rural_urban"),
+]
+
+
+@pytest.fixture(params=["pyarrow", "re"])
+def regex_engine(request, monkeypatch):
+    """Runs a test with pyarrow's regex kernels and again as if pyarrow were not installed"""
+    if request.param == "re":
+        find_spec = importlib.util.find_spec
+        monkeypatch.setattr(importlib.util, "find_spec", lambda name, *args: None if name == "pyarrow"
+                            else find_spec(name, *args))
+    return request.param
+
+
+def same(a, b) -> bool:
+    """Equality treating NA, NaN and None alike, element-wise for tuples"""
+    if isinstance(a, tuple) and isinstance(b, tuple):
+        return len(a) == len(b) and all(same(x, y) for x, y in zip(a, b))
+    if pd.api.types.is_scalar(a) and pd.api.types.is_scalar(b) and pd.isna(a) and pd.isna(b):
+        return True
+    return type(a) is type(b) and a == b
+
+
+@pytest.mark.parametrize("series_func, scalar_func, columns", CASES)
+def test_series_matches_scalar(series_func, scalar_func, columns, regex_engine):
+    index = pd.RangeIndex(10, 10 + len(columns[0]))
+    result = series_func(*(pd.Series(values, dtype=object, index=index) for values in columns))
+    if isinstance(result, tuple):
+        assert all(part.index.equals(index) for part in result)
+        result = list(zip(*(part.tolist() for part in result)))
+    else:
+        assert result.index.equals(index)
+        result = result.tolist()
+
+    rows = list(zip(*columns))
+    expected = [scalar_func(*row) for row in rows]
+    mismatches = [(row, got, want) for row, got, want in zip(rows, result, expected) if not same(got, want)]
+    assert not mismatches
+
+
+# (early date, late date) - valid, null, one pair per swap rule, rejected swaps, time components and leap days
+DATE_PAIRS = [
+    ("2023-06-01", "2023-06-05"), (None, "2023-06-05"), ("2023-06-01", None), (None, None),
+    ("2023-02-05", "2023-06-02"),  # day of late date = month of early date
+    ("2023-02-20", "2023-06-02"),  # as above, the swap gives a negative delta
+    ("2023-06-02", "2023-02-10"),  # day of early date = month of late date
+    ("2023-08-02", "2023-11-02"),  # same day
+    ("2023-08-02", "2023-12-02"),  # as above, the swap gives more than 60 days
+    ("2023-08-27", "2023-06-09"),  # day of late date - month of early date = 1
+    ("2023-10-07", "2023-08-09"),  # day of early date - month of late date = -1
+    ("2023-01-25", "2023-05-28"),  # no rule applies
+    ("2023-06-02 10:30", "2023-02-10 08:00"), ("2023-06-02 10:30", "2023-06-30 08:00"),
+    ("2024-02-29", "2024-03-02"), ("2024-06-02", "2024-02-29"), ("2024-02-29", "2024-12-02"),
+    ("2023-12-30", "2024-01-02"),
+]
+
+
+def to_dates(values: list) -> pd.Series:
+    return pd.to_datetime(pd.Series(values, dtype=object), format="ISO8601")
+
+
+def random_dates(rng, n: int) -> pd.Series:
+    """Dates in 2023 and early 2024 with times on some and NaT for a tenth"""
+    dates = pd.Timestamp("2023-01-01") + pd.to_timedelta(rng.integers(0, 425, n), unit="D")
+    dates = dates + pd.to_timedelta(np.where(rng.random(n) < 0.2, rng.integers(0, 86400, n), 0), unit="s")
+    return pd.Series(dates).mask(rng.random(n) < 0.1)
+
+
+def row_wise(func, *columns) -> list:
+    """A scalar function applied row by row, as datetime64 columns"""
+    index = columns[0].index
+    results = [func(*values) for values in zip(*columns)]
+    if not isinstance(results[0], tuple):
+        return pd.to_datetime(pd.Series(results, index=index, dtype=object))
+    return [pd.to_datetime(pd.Series(part, index=index, dtype=object)) for part in zip(*results)]
+
+
+def test_swap_day_month():
+    dates = to_dates(["2023-02-05", "2023-06-12 10:30", "2023-06-13", "2024-02-29", "2023-12-01", None])
+
+    def swap(date):
+        try:
+            return datetime.datetime(day=date.month, month=date.day, year=date.year)
+        except ValueError:
+            return pd.NaT
+
+    expected = row_wise(lambda date: pd.NaT if pd.isna(date) else swap(date), dates)
+    pd.testing.assert_series_equal(swap_day_month(Date=dates), expected)
+
+
+def test_fix_year_hist_series():
+    # this year, December of last year and January of next year, the same months further off, times and nulls
+    dates = to_dates(["2023-06-01", "2022-06-01", "2022-12-30", "2024-01-02", "2022-01-02", "2024-12-30", "2019-12-30",
+                      "2027-01-05", "2022-06-01 10:30", "2020-02-29", None])
+    for year in (2023, 2024):
+        expected = row_wise(lambda date: fix_year_hist(Date=date, Year=year), dates.drop(9))
+        pd.testing.assert_series_equal(fix_year_hist_series(Date=dates.drop(9), Year=year), expected)
+
+    # a leap day moved to a leap year stays a leap day, moved to a common year it is not a date in either
+    assert fix_year_hist_series(Date=dates[9:10], Year=2024).tolist() == [fix_year_hist(Date=dates[9], Year=2024)]
+    with pytest.raises(ValueError):
+        fix_year_hist(Date=dates[9], Year=2023)
+    with pytest.raises(ValueError):
+        fix_year_hist_series(Date=dates[9:10], Year=2023)
+
+
+def test_fix_two_dates_series():
+    early, late = to_dates([early for early, _ in DATE_PAIRS]), to_dates([late for _, late in DATE_PAIRS])
+    rng = np.random.default_rng(0)
+    early, late = pd.concat([early, random_dates(rng, 2000)]), pd.concat([late, random_dates(rng, 2000)])
+    early.index = late.index = range(len(early))
+
+    expected = row_wise(lambda e, lt: fix_two_dates(earlyDate=e, lateDate=lt), early, late)
+    result = fix_two_dates_series(earlyDate=early, lateDate=late)
+    pd.testing.assert_series_equal(result[0], expected[0])
+    pd.testing.assert_series_equal(result[1], expected[1])
+    # the swap rules fired
+    assert not result[0].equals(early) and not result[1].equals(late)
+
+
+def test_fix_date_sequence_matches_three_passes():
+    rng = np.random.default_rng(1)
+    datevars = ["event.symptomOnsetDate", "event.test.sampleCollectionDate", "event.test.resultDate"]
+    df = pd.DataFrame({var: random_dates(rng, 3000) for var in datevars})
+
+    # symptom -> sample, sample -> result, and symptom -> sample again, row by row as standardise.py did
+    expected = df.copy()
+    for early, late in [datevars[:2], datevars[1:], datevars[:2]]:
+        expected[early], expected[late] = row_wise(lambda e, lt: fix_two_dates(earlyDate=e, lateDate=lt),
+                                                   expected[early], expected[late])
+
+    pd.testing.assert_frame_equal(fix_date_sequence(df=df.copy(), datevars=datevars), expected)
+
+
+def test_normalise_dates_matches_row_wise():
+    datevars = ["event.symptomOnsetDate", "event.test.sampleCollectionDate", "event.test.resultDate"]
+    df = pd.DataFrame({
+        "event.symptomOnsetDate": ["2023-06-01", "5 days", "3 Days", "5 days", "5 days", None, "2022-06-01",
+                                   "12-30-2022", "01-02-2022"],
+        "event.test.sampleCollectionDate": ["2023-06-02", "2023-06-09", None, "2023-06-09", "2023-06-09",
+                                            "2023--06--09", "2022-06-02", "01-01-2023", "01-03-2022"],
+        "event.test.resultDate": ["2023-06-03", "2023-06-10", "06-10-2023", None, "no result", "2023-06-10",
+                                  "2022-06-03", "01-02-2023", "01-04-2022"]})
+
+    # fix_symptom_date, then string_clean_dates and fix_year_hist, row by row as standardise.py did
+    expected = {var: [] for var in datevars}
+    for _, row in df.iterrows():
+        row = row.copy()
+        row[datevars[0]], row[datevars[2]] = fix_symptom_date(symptomDate=row[datevars[0]],
+                                                              resultDate=row[datevars[2]])
+        for var in datevars:
+            expected[var].append(fix_year_hist(Date=parse_date(row[var]), Year=2023))
+    expected = pd.DataFrame({var: pd.to_datetime(pd.Series(dates, dtype=object)) for var, dates in expected.items()})
+
+    pd.testing.assert_frame_equal(normalise_dates(df=df.copy(), datevars=datevars, year=2023), expected)
+
+    # the whole number of days is used - fix_symptom_date took only the last digit
+    df = pd.DataFrame({var: [value] for var, value in zip(datevars, ["12 days", None, "2023-06-20"])})
+    assert normalise_dates(df=df, datevars=datevars, year=2023)[datevars[0]].tolist() == [pd.Timestamp("2023-06-08")]
@@ -0,0 +1,50 @@
+import numpy as np
+import pandas as pd
+import yaml
+
+import synthetic
+from functions import standardise_test_result_series
+from standardise import run_standardise
+
+YEAR = 2023
+
+
+def line_list_row(contact: str, result: str = "Positive") -> dict:
+    """A preprocessed row of one patient in Mysuru, with the contact and first test result given."""
+    row = {col: value for col, value in synthetic.COLUMN_VALUES.items()}
+    row.update({"metadata.nameAddress": "RAMESH K , #12, 3rd Cross, HEBBAL", "metadata.contact": contact,
+                "demographics.age": "34", "demographics.gender": "M", "event.test.test1.result": result,
+                "event.test.resultDate": "2023-08-10", "location.admin2.name": "Mysuru",
+                "location.admin3.name": "Hunsur", "location.admin5.name": "Hebbal"})
+    return row
+
+
+def test_duplicate_across_chunks_is_dropped(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    synthetic.make_regions().to_csv("regionids.csv", index=False)
+    with open("metadata.yaml", "w") as f:
+        yaml.safe_dump(synthetic.make_metadata(chunk_size=2), f, sort_keys=False)
+
+    # read_csv would infer metadata.contact as float in the first chunk and as text in the second, where one contact
+    # is not a number - the first row is repeated in the second chunk and the patient tested again in the third
+    rows = [line_list_row("7513206182"), line_list_row("9845012345", result="Negative"),
+            line_list_row("7513206182"), line_list_row("9845 / 9900", result="Negative"),
+            line_list_row("7513206182", result="Negative")]
+    rows[1]["metadata.nameAddress"] = rows[3]["metadata.nameAddress"] = "SUMA R , #7, 1st Main, HEBBAL"
+    pd.DataFrame(rows).to_csv(f"preprocessed_{YEAR}.csv", index=False)
+
+    run_standardise(YEAR, config=str(tmp_path / "metadata.yaml"), download_regions=False)
+
+    df = pd.read_csv(f"preprocessed/{YEAR}.csv", dtype=str)
+    assert len(df) == 4
+    assert df["metadata.contact"].tolist() == ["7513206182", "9845012345", "9845 / 9900", "7513206182"]
+    # the patient keeps one ID across chunks
+    ramesh = df[df["metadata.nameAddress"].str.startswith("RAMESH")]
+    assert ramesh["metadata.patientID"].nunique() == 1
+
+
+def test_float_coded_results_read_as_text():
+    # a result column coded 1/0 and written as floats comes back from the text read as 1.0/0.0
+    result = pd.Series(["1.0", "0.0", "1", "0", np.nan, "Positive"])
+    assert standardise_test_result_series(result=result).tolist() == ["POSITIVE", "NEGATIVE", "POSITIVE", "NEGATIVE",
+                                                                      "UNKNOWN", "POSITIVE"]
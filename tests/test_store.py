@@ -0,0 +1,68 @@
+import json
+
+import pandas as pd
+import pytest
+
+from store import DailyStore, LocalBackend
+
+
+def summary(date: str, districts: list) -> pd.DataFrame:
+    """Standardised rows of one daily report"""
+    return pd.DataFrame({"metadata.recordDate": f"{date}T00:00:00Z", "location.admin2.ID": districts,
+                         "daily.suspected": range(len(districts))})
+
+
+@pytest.fixture
+def store(tmp_path):
+    return DailyStore(LocalBackend(str(tmp_path)))
+
+
+def test_append_and_read_day(store, tmp_path):
+    store.append(summary("2024-05-14", ["district_524", "district_525"]), "2024-05-14")
+    store.append(summary("2024-05-13", ["district_524"]), "2024-05-13")
+
+    assert store.dates(2024) == ["2024-05-13", "2024-05-14"]
+    assert json.loads((tmp_path / "2024" / "manifest.json").read_text()) == {"dates": ["2024-05-13", "2024-05-14"]}
+    assert store.has_date("2024-05-14") and not store.has_date("2024-05-15")
+    pd.testing.assert_frame_equal(store.read_day("2024-05-14"), summary("2024-05-14", ["district_524", "district_525"]))
+    assert store.read_day("2024-05-15") is None
+    assert store.dates(2023) == []
+
+
+def test_duplicate_date_is_rejected(store):
+    store.append(summary("2024-05-13", ["district_524"]), "2024-05-13")
+    with pytest.raises(Exception, match="Duplicate Alert"):
+        store.append(summary("2024-05-13", ["district_525"]), "2024-05-13")
+    # the stored day is kept
+    assert store.read_day("2024-05-13")["location.admin2.ID"].tolist() == ["district_524"]
+
+
+def test_yearly_file_is_migrated(store, tmp_path):
+    # written before the store existed - no manifest, dates in the rows' text kept as they are
+    yearly = pd.concat([summary("2023-11-02", ["district_524", "district_525"]),
+                        summary("2023-11-01", ["district_526"])])
+    yearly.to_csv(tmp_path / "2023.csv", index=False)
+
+    assert store.dates(2023) == ["2023-11-01", "2023-11-02"]
+    assert (tmp_path / "2023" / "manifest.json").exists()
+    assert store.read_day("2023-11-02")["location.admin2.ID"].tolist() == ["district_524", "district_525"]
+    with pytest.raises(Exception, match="Duplicate Alert"):
+        store.append(summary("2023-11-01", ["district_526"]), "2023-11-01")
+
+    # new days go alongside the migrated ones, and compacting keeps both
+    store.append(summary("2023-11-03", ["district_524"]), "2023-11-03")
+    compacted = store.compact(2023)
+    days = compacted["metadata.recordDate"].str[:10]
+    assert days.tolist() == ["2023-11-01", "2023-11-02", "2023-11-02", "2023-11-03"]
+    pd.testing.assert_frame_equal(pd.read_csv(tmp_path / "2023.csv"), compacted)
+
+
+def test_compact(store, tmp_path):
+    store.append(summary("2024-05-14", ["district_525"]), "2024-05-14")
+    store.append(summary("2024-05-13", ["district_524"]), "2024-05-13")
+
+    compacted = store.compact(2024)
+    assert compacted["location.admin2.ID"].tolist() == ["district_524", "district_525"]
+    pd.testing.assert_frame_equal(pd.read_csv(tmp_path / "2024.csv"), compacted)
+    # compacting again does not duplicate the days
+    pd.testing.assert_frame_equal(store.compact(2024), compacted)
@@ -0,0 +1,135 @@
+import re
+
+import yaml
+
+# Column mapping - resolves raw column names to the standardised names of a metadata.yaml column mapping
+
+
+def normalise_colname(colname: str) -> str:
+    """Normalises a raw column name - lower case, symbols stripped, whitespace as underscores
+
+    Args:
+        colname (str): raw column name
+
+    Returns:
+        str: normalised column name
+    """
+    colname = re.sub(r"[^\w\s]", "", colname.lstrip().rstrip().lower())
+    colname = re.sub(r"(\s+)", " ", colname)
+    colname = re.sub(r"\s", "_", colname)
+    return colname
+
+
+def map_columns(*, colname: str, map_dict: dict) -> str:
+    """Standardises column names using mapping in config file
+
+    Args:
+        colname (str): Current column in DataFrame
+        map (dict): Dictionary mapping of preprocessed col names to standardised col names
+
+    Returns:
+        str: Standardised column name
+    """
+    assert isinstance(colname, str) and isinstance(
+        map_dict, dict), "Invalid input type for column name or dictionary"
+
+    colname = normalise_colname(colname)
+
+    for key, values in map_dict.items():
+        if colname in values:
+            return key
+
+    return colname
+
+
+class ColumnMapper:
+    """Resolves raw column names to standardised names from a metadata.yaml column mapping
+
+    The mapping {standardised name: [aliases]} is inverted once into an alias -> standardised name index (the first
+    standardised name listed wins for repeated aliases), and resolutions are cached by raw name so repeated headers
+    across files are resolved once. Columns without a mapping keep their (normalised) name and are recorded in
+    unmapped.
+    """
+
+    def __init__(self, map_dict: dict, normalise: bool = True):
+        """Builds the alias index
+
+        Args:
+            map_dict (dict): Dictionary mapping of standardised col names to lists of preprocessed col names
+            normalise (bool, optional): normalise raw names before lookup, as map_columns does
+        """
+        assert isinstance(map_dict, dict), "Invalid input: map_dict must be a dictionary"
+
+        self.normalise = normalise
+        self.canonical = set(map_dict)
+        self.index = {}
+        for key, values in map_dict.items():
+            for alias in ([values] if isinstance(values, str) else values or []):
+                self.index.setdefault(alias, key)
+        self.cache = {}
+        self.unmapped = set()
+
+    @classmethod
+    def from_yaml(cls, path: str, *keys: str, normalise: bool = True) -> "ColumnMapper":
+        """Builds the mapper from a column mapping in a yaml config
+
+        Args:
+            path (str): path to the yaml config, e.g. metadata.yaml
+            *keys (str): keys leading to the column mapping, e.g. "column_mapping", "historical"
+            normalise (bool, optional): normalise raw names before lookup
+
+        Returns:
+            ColumnMapper: column mapper
+        """
+        with open(path) as f:
+            map_dict = yaml.safe_load(f)
+        for key in keys:
+            map_dict = map_dict[key]
+        return cls(map_dict, normalise=normalise)
+
+    def map(self, colname: str) -> str:
+        """Standardises a column name
+
+        Args:
+            colname (str): Current column in DataFrame
+
+        Returns:
+            str: Standardised column name
+        """
+        if colname in self.cache:
+            return self.cache[colname]
+
+        if self.normalise:
+            assert isinstance(colname, str), "Invalid input type for column name"
+            name = normalise_colname(colname)
+        else:
+            name = colname
+        if name in self.index:
+            resolved = self.index[name]
+        else:
+            resolved = name
+            self.unmapped.add(colname)
+        self.cache[colname] = resolved
+        return resolved
+
+    def map_columns(self, columns) -> list:
+        """Standardises a list of column names
+
+        Args:
+            columns (list or pd.Index): Current columns in DataFrame
+
+        Returns:
+            list: Standardised column names
+        """
+        return [self.map(col) for col in columns]
+
+    def unmapped_columns(self, columns) -> list:
+        """Lists the columns that are not standardised names in the mapping
+
+        Args:
+            columns (list or pd.Index): columns after mapping
+
+        Returns:
+            list: columns without a standardised name
+        """
+        return [col for col in columns if col not in self.canonical]
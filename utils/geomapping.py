@@ -0,0 +1,563 @@
+import functools
+import json
+import os
+import re
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from fuzzywuzzy import fuzz, process
+
+from resources import s3_client
+
+# Geo-mapping - fuzzy matcher backends, the LGD regions (regionids.csv) indexed by parent region, and column-wise
+# mapping of raw region names to LGD names and codes
+
+REGIONS_BUCKET = "dsih-artpark-03-standardised-data"
+REGIONS_KEY = "GS0015DS0034-LGD_Region_IDs_and_Names/regionids.csv"
+
+
+def _pair_scores(left: list, right: list) -> list:
+    """Scores each (left, right) pair with fuzzywuzzy's token_sort_ratio"""
+    return [fuzz.token_sort_ratio(a, b) for a, b in zip(left, right)]
+
+
+def _extract_best(queries: list, choices: list, threshold: int) -> list:
+    """Returns the index of the best scoring choice per query with fuzzywuzzy (None if below threshold)"""
+    indexed = dict(enumerate(choices))
+    best = []
+    for query in queries:
+        match = process.extractOne(query, indexed, score_cutoff=threshold)
+        best.append(match[2] if match else None)
+    return best
+
+
+class FuzzywuzzyMatcher:
+    """Matcher backend scoring with fuzzywuzzy's process.extractOne (WRatio, full_process) - the reference scores
+    that the thresholds in metadata.yaml are tuned to. Batches can be split across processes with workers > 1.
+    """
+
+    # backend and scorer, part of the GeoCache keys - scores differ between backends
+    name = "fuzzywuzzy.WRatio"
+
+    def __init__(self, workers: int = 1):
+        """
+        Args:
+            workers (int, optional): number of processes to split a batch across
+        """
+        assert isinstance(workers, int) and workers > 0, "Invalid input: workers must be a positive integer"
+        self.workers = workers
+
+    def best_matches(self, queries: list, choices: list, threshold: int) -> list:
+        """Finds the best scoring choice for each query
+
+        Args:
+            queries (list): cleaned names to match
+            choices (list): candidate names
+            threshold (int): cut-off for fuzzy matching
+
+        Returns:
+            list: index of the best choice per query, None where no choice scores >= threshold
+        """
+        if not choices:
+            return [None] * len(queries)
+        if self.workers == 1 or len(queries) < 2 * self.workers:
+            return _extract_best(queries, choices, threshold)
+
+        size = -(-len(queries) // self.workers)
+        chunks = [queries[i:i + size] for i in range(0, len(queries), size)]
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            results = pool.map(_extract_best, chunks, [choices] * len(chunks), [threshold] * len(chunks))
+        return [best for chunk in results for best in chunk]
+
+    def pair_scores(self, left: list, right: list) -> np.ndarray:
+        """Scores aligned pairs of names with token_sort_ratio, so that reordered tokens (e.g. initials) still match
+
+        Args:
+            left (list): names
+            right (list): names compared element-wise with left
+
+        Returns:
+            np.ndarray: score (0-100) per pair
+        """
+        if self.workers == 1 or len(left) < 2 * self.workers:
+            return np.asarray(_pair_scores(left, right), dtype=float)
+
+        size = -(-len(left) // self.workers)
+        starts = range(0, len(left), size)
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            results = pool.map(_pair_scores, [left[i:i + size] for i in starts], [right[i:i + size] for i in starts])
+        return np.asarray([score for chunk in results for score in chunk], dtype=float)
+
+
+class RapidfuzzMatcher:
+    """Matcher backend scoring a whole batch of queries against all choices in one call with rapidfuzz's cdist
+    (query x choice WRatio matrix, top-1 per row with cut-off), optionally multi-threaded.
+
+    Scores are rounded to integers on fuzzywuzzy's 0-100 scale, so the metadata.yaml thresholds keep their meaning.
+    rapidfuzz computes partial ratios exactly where fuzzywuzzy approximates them, so some scores differ by a few
+    points - use FuzzywuzzyMatcher where results must be identical to process.extractOne.
+    """
+
+    # backend and scorer, part of the GeoCache keys - scores differ between backends
+    name = "rapidfuzz.WRatio"
+
+    def __init__(self, workers: int = 1):
+        """
+        Args:
+            workers (int, optional): number of threads used by cdist, -1 for all cores
+        """
+        assert isinstance(workers, int) and (workers > 0 or workers == -1), \
+            "Invalid input: workers must be a positive integer or -1"
+        self.workers = workers
+
+    def best_matches(self, queries: list, choices: list, threshold: int) -> list:
+        """Finds the best scoring choice for each query
+
+        Args:
+            queries (list): cleaned names to match
+            choices (list): candidate names
+            threshold (int): cut-off for fuzzy matching
+
+        Returns:
+            list: index of the best choice per query, None where no choice scores >= threshold
+        """
+        from rapidfuzz import fuzz, utils
+        from rapidfuzz import process as rf_process
+
+        if not choices or not queries:
+            return [None] * len(queries)
+
+        scores = np.rint(rf_process.cdist(queries, choices, scorer=fuzz.WRatio,
+                         processor=utils.default_process, workers=self.workers))
+        best = scores.argmax(axis=1)
+        return [int(i) if scores[row, i] >= threshold else None for row, i in enumerate(best)]
+
+    def pair_scores(self, left: list, right: list) -> np.ndarray:
+        """Scores aligned pairs of names with token_sort_ratio in one cpdist call
+
+        Args:
+            left (list): names
+            right (list): names compared element-wise with left
+
+        Returns:
+            np.ndarray: score (0-100) per pair
+        """
+        from rapidfuzz import fuzz, utils
+        from rapidfuzz import process as rf_process
+
+        if not left:
+            return np.zeros(0)
+        return np.rint(rf_process.cpdist(left, right, scorer=fuzz.token_sort_ratio, processor=utils.default_process,
+                                         workers=self.workers))
+
+
+MATCHERS = {"fuzzywuzzy": FuzzywuzzyMatcher, "rapidfuzz": RapidfuzzMatcher}
+
+
+def get_matcher(*, name: str = "fuzzywuzzy", workers: int = 1):
+    """Creates a fuzzy matcher backend by name (config.matcher in metadata.yaml)
+
+    Args:
+        name (str, optional): fuzzywuzzy or rapidfuzz
+        workers (int, optional): number of processes/threads used per batch
+
+    Returns:
+        FuzzywuzzyMatcher | RapidfuzzMatcher: matcher backend
+    """
+    assert name in MATCHERS, f"Invalid input: matcher must be one of {list(MATCHERS)}"
+    return MATCHERS[name](workers=workers)
+
+
+class RegionGazetteer:
+    """Indexed view of the LGD regions (regionids.csv), built once and queried per parent region
+
+    Holds a parentID -> child region names index (in file order) and a (parentID, regionName) -> regionID map,
+    so that geo-mapping a name only scans the children of its parent instead of the whole regions table.
+    """
+
+    def __init__(self, regions_df: pd.DataFrame, matcher=None):
+        """Builds the parent and (parent, name) indices from the regions dataframe
+
+        Args:
+            regions_df (pd.DataFrame): regionids.csv as a dataframe (regionID, regionName, parentID)
+            matcher (optional): fuzzy matcher backend, defaults to FuzzywuzzyMatcher
+        """
+        assert isinstance(regions_df, pd.DataFrame) and {"regionID", "regionName", "parentID"}.issubset(
+            regions_df.columns), "Invalid input: regions_df must have regionID, regionName and parentID columns"
+
+        self.matcher = matcher or FuzzywuzzyMatcher()
+        self.children = {}
+        self.ids = {}
+        for regionID, regionName, parentID in zip(regions_df["regionID"], regions_df["regionName"], regions_df["parentID"]):
+            if pd.isna(parentID):
+                continue
+            self.children.setdefault(parentID, []).append(regionName)
+            # retain the first ID for repeated names under the same parent
+            self.ids.setdefault((parentID, regionName), regionID)
+
+    @classmethod
+    def from_csv(cls, path: str = "regionids.csv", matcher=None) -> "RegionGazetteer":
+        """Builds the gazetteer from regionids.csv
+
+        Args:
+            path (str): path to regionids.csv
+            matcher (optional): fuzzy matcher backend, defaults to FuzzywuzzyMatcher
+
+        Returns:
+            RegionGazetteer: indexed regions
+        """
+        return cls(pd.read_csv(path), matcher=matcher)
+
+    def names(self, parentID: str) -> list:
+        """Returns the names of all child regions of a parent region
+
+        Args:
+            parentID (str): standardised parent region ID
+
+        Returns:
+            list: child region names, empty if parent is null or unknown
+        """
+        if pd.isna(parentID):
+            return []
+        return self.children.get(parentID, [])
+
+    def region_id(self, parentID: str, regionName: str) -> str:
+        """Returns the LGD code of a child region by exact name
+
+        Args:
+            parentID (str): standardised parent region ID
+            regionName (str): LGD region name
+
+        Returns:
+            str: LGD region code, None if not found
+        """
+        if pd.isna(parentID):
+            return None
+        return self.ids.get((parentID, regionName))
+
+    def regions(self, parentID: str) -> dict:
+        """Returns a mapping of child region names to LGD codes for a parent region
+
+        Args:
+            parentID (str): standardised parent region ID
+
+        Returns:
+            dict: {region name: region code}
+        """
+        return {name: self.ids[(parentID, name)] for name in self.names(parentID)}
+
+    def match(self, parentID: str, regionName: str, threshold: int) -> tuple:
+        """Fuzzy matches a name against the children of a parent region
+
+        Args:
+            parentID (str): standardised parent region ID
+            regionName (str): cleaned region name
+            threshold (int): cut-off for fuzzy matching
+
+        Returns:
+            tuple: (LGD region name, LGD region code), None if not matched
+        """
+        return self.match_many(parentID, [regionName], threshold)[0]
+
+    def match_many(self, parentID: str, regionNames: list, threshold: int) -> list:
+        """Fuzzy matches a batch of names against the children of a parent region in one matcher call
+
+        Args:
+            parentID (str): standardised parent region ID
+            regionNames (list): cleaned region names
+            threshold (int): cut-off for fuzzy matching
+
+        Returns:
+            list: (LGD region name, LGD region code) per name, None where not matched
+        """
+        choices = self.names(parentID)
+        matches = []
+        for best in self.matcher.best_matches(list(regionNames), choices, threshold):
+            if best is None:
+                matches.append(None)
+            else:
+                matches.append((choices[best], self.ids[(parentID, choices[best])]))
+        return matches
+
+
+def clean_district_name(*, districtName: str) -> str:
+    """Cleans raw district names and replaces old/short names with current LGD spellings before matching
+
+    Args:
+        districtName (str): raw district name
+
+    Returns:
+        str: cleaned district name in upper case
+    """
+
+    districtName = districtName.upper().strip()
+    districtName = re.sub(r"GULBARGA", "KALABURAGI", districtName)
+    districtName = re.sub(r"\(?\sU\)?$", " URBAN", districtName)
+    districtName = re.sub(r"\(?\sR\)?$", " RURAL", districtName)
+    districtName = re.sub(r"BIJAPUR", "VIJAYAPURA", districtName)
+    districtName = re.sub(
+        r"B[AE]NGAL[OU]R[UE]\s?C?I?T?Y?|BBMP", "BENGALURU URBAN", districtName)
+    return districtName
+
+
+def clean_subdist_name(*, subdistName: str) -> str:
+    """Cleans raw subdistrict/ulb names before matching
+
+    Args:
+        subdistName (str): raw subdistrict/ulb name
+
+    Returns:
+        str: cleaned subdistrict/ulb name in upper case
+    """
+
+    subdistName = subdistName.upper().strip()
+    subdistName = re.sub(r'\(?\sU\)?$', " URBAN", subdistName, re.IGNORECASE)
+    subdistName = re.sub(r'\(?\sR\)?$', " RURAL", subdistName, re.IGNORECASE)
+    return subdistName
+
+
+def clean_village_name(*, villageName: str) -> str:
+    """Cleans raw village/ward names before matching
+
+    Args:
+        villageName (str): raw village/ward name
+
+    Returns:
+        str: cleaned village/ward name in upper case
+    """
+
+    return villageName.upper().strip()
+
+
+def dist_mapping(*, stateID: str, districtName: str, gazetteer: RegionGazetteer, threshold: int) -> tuple:
+    """Standardises district names and codes (based on LGD), provided the standardised state ID
+
+    Args:
+        stateID (str): standarised state ID
+        districtName (str): raw district name
+        gazetteer (RegionGazetteer): regionids.csv indexed by parent region
+        threshold (int): cut-off for fuzzy matching
+
+    Returns:
+        tuple: (LGD district name, LGD district code or admin_0 if not matched)
+    """
+
+    if pd.isna(districtName):
+        return (pd.NA, pd.NA)
+
+    districtName = clean_district_name(districtName=districtName)
+
+    match = gazetteer.match(stateID, districtName, threshold)
+    if match:
+        districtName, districtCode = match
+    else:
+        districtCode = "admin_0"
+    return (districtName, districtCode)  # returns original name if unmatched
+
+
+def subdist_ulb_mapping(*, districtID: str, subdistName: str, gazetteer: RegionGazetteer, threshold: int) -> tuple:
+    """Standardises subdistrict/ulb names and codes (based on LGD), provided the standardised district ID
+
+    Args:
+        districtID (str): standarised district ID
+        subdistName (str): raw subdistrict/ulb name
+        gazetteer (RegionGazetteer): regionids.csv indexed by parent region
+        threshold (int): cut-off for fuzzy matching
+
+    Returns:
+        tuple: (LGD subdistrict/ulb name, LGD subdistrict/ulb code or admin_0 if not matched)
+    """
+    # subdist
+    if pd.isna(subdistName):
+        return (pd.NA, pd.NA)
+
+    subdistName = clean_subdist_name(subdistName=subdistName)
+    match = gazetteer.match(districtID, subdistName, threshold)
+    if match:
+        return match
+    else:
+        return (subdistName, "admin_0")  # returns original name if unmatched
+
+
+def village_ward_mapping(*, subdistID: str, villageName: str, gazetteer: RegionGazetteer, threshold: int) -> tuple:
+    """Standardises village names and codes (based on LGD), provided the standardised district ID
+
+    Args:
+        subdistID (str): standarised subdistrict/ulb ID
+        villageName (str): raw village/ward name
+        gazetteer (RegionGazetteer): regionids.csv indexed by parent region
+        threshold (int): cut-off for fuzzy matching
+
+    Returns:
+        tuple: (LGD village/ward name, LGD village/ward code or admin_0 if not matched)
+    """
+    if pd.isna(villageName):
+        return (pd.NA, pd.NA)
+
+    villageName = clean_village_name(villageName=villageName)
+    match = gazetteer.match(subdistID, villageName, threshold)
+    if match:
+        return match
+    else:
+        return (villageName, "admin_0")  # returns original name if unmatched
+
+
+class GeoCache:
+    """Persistent, size-bounded cache of resolved (level, parentID, cleaned name, threshold, matcher) -> (LGD name,
+    LGD code), where matcher names the backend and scorer (e.g. fuzzywuzzy.WRatio) that resolved the spelling
+
+    Entries are kept in least-recently-used order and the oldest are evicted beyond max_size. The cache is stored as
+    JSON so that spellings resolved in one run are reused in the next; delete the file whenever regionids.csv changes.
+    """
+
+    def __init__(self, path: str = None, max_size: int = 100000):
+        """Loads previously resolved spellings from path, if it exists
+
+        Args:
+            path (str, optional): JSON file to persist the cache to. In-memory only if None.
+            max_size (int, optional): maximum number of entries retained
+        """
+        assert isinstance(max_size, int) and max_size > 0, "Invalid input: max_size must be a positive integer"
+
+        self.path = path
+        self.max_size = max_size
+        self.entries = OrderedDict()
+
+        if path and os.path.exists(path):
+            with open(path) as f:
+                for entry in json.load(f):
+                    # entries written before the matcher was part of the key are dropped
+                    if len(entry) == 7:
+                        self.entries[tuple(entry[:5])] = tuple(entry[5:])
+
+    def get(self, key: tuple):
+        """Returns the cached match for key, marking it as recently used
+
+        Args:
+            key (tuple): (level, parentID, cleaned name, threshold, matcher)
+
+        Returns:
+            tuple: (LGD name, LGD code or admin_0), None if not cached
+        """
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        return None
+
+    def set(self, key: tuple, value: tuple):
+        """Caches a match, evicting the least recently used entries beyond max_size
+
+        Args:
+            key (tuple): (level, parentID, cleaned name, threshold, matcher)
+            value (tuple): (LGD name, LGD code or admin_0)
+        """
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def save(self):
+        """Writes the cache to disk, if a path was provided"""
+        if self.path:
+            with open(self.path, "w") as f:
+                json.dump([list(key) + list(value) for key, value in self.entries.items()], f)
+
+
+GEO_LEVELS = {"district": lambda name: clean_district_name(districtName=name),
+              "subdistrict": lambda name: clean_subdist_name(subdistName=name),
+              "village": lambda name: clean_village_name(villageName=name)}
+
+
+def geo_mapping(*, parentIDs: pd.Series, names: pd.Series, level: str, gazetteer: RegionGazetteer, threshold: int,
+                cache: GeoCache = None) -> tuple:
+    """Standardises region names and codes (based on LGD) for a whole column, matching each unique
+    (parent ID, cleaned name) pair once and broadcasting the result back to every row
+
+    Args:
+        parentIDs (pd.Series): standardised parent region IDs
+        names (pd.Series): raw region names
+        level (str): district, subdistrict or village - selects the name cleaning applied before matching
+        gazetteer (RegionGazetteer): regionids.csv indexed by parent region
+        threshold (int): cut-off for fuzzy matching
+        cache (GeoCache, optional): previously resolved spellings, updated with new matches
+
+    Returns:
+        tuple: (LGD names, LGD codes or admin_0 if not matched) as Series aligned with names
+    """
+    assert level in GEO_LEVELS, f"Invalid input: level must be one of {list(GEO_LEVELS)}"
+    assert len(parentIDs) == len(names), "Invalid input: parentIDs and names must be the same length"
+
+    clean = GEO_LEVELS[level]
+    # cached matches are only reused for the same backend and scorer
+    matcher = getattr(gazetteer.matcher, "name", type(gazetteer.matcher).__name__)
+    keys = pd.DataFrame({"parentID": parentIDs.to_numpy(), "raw": names.to_numpy()})
+
+    # clean each unique raw spelling once
+    unique_raw = keys.drop_duplicates().reset_index(drop=True)
+    unique_raw["name"] = [pd.NA if pd.isna(name) else clean(name)
+                          for name in unique_raw["raw"]]
+
+    # match each unique (parent, cleaned name) pair once, batching cache misses by parent
+    unique_names = unique_raw[["parentID", "name"]].drop_duplicates().reset_index(drop=True)
+    matches = [None] * len(unique_names)
+    misses = {}
+    for i, (parentID, name) in enumerate(zip(unique_names["parentID"], unique_names["name"])):
+        if pd.isna(name):
+            matches[i] = (pd.NA, pd.NA)
+        elif cache is not None and not pd.isna(parentID) and cache.get((level, parentID, name, threshold, matcher)):
+            matches[i] = tuple(cache.get((level, parentID, name, threshold, matcher)))
+        else:
+            misses.setdefault(parentID, []).append(i)
+
+    for parentID, rows in misses.items():
+        batch = [unique_names.at[i, "name"] for i in rows]
+        for i, name, match in zip(rows, batch, gazetteer.match_many(parentID, batch, threshold)):
+            matches[i] = match or (name, "admin_0")
+            if cache is not None and not pd.isna(parentID):
+                cache.set((level, parentID, name, threshold, matcher), matches[i])
+    unique_names["regionName"], unique_names["regionID"] = zip(*matches) if matches else ([], [])
+
+    # broadcast back to every row
+    unique_raw = unique_raw.merge(unique_names, on=["parentID", "name"], how="left")
+    result = keys.merge(unique_raw, on=["parentID", "raw"], how="left")
+
+    return (pd.Series(result["regionName"].to_numpy(), index=names.index, name=names.name),
+            pd.Series(result["regionID"].to_numpy(), index=names.index))
+
+
+def download_regionids(*, path: str = "regionids.csv") -> bool:
+    """Downloads the LGD regions (regionids.csv) from the standardised data bucket
+
+    Args:
+        path (str, optional): local path to download to
+
+    Returns:
+        bool: whether the file was downloaded - a local copy, if any, is kept otherwise
+    """
+    try:
+        s3_client().download_file(Bucket=REGIONS_BUCKET, Key=REGIONS_KEY, Filename=path)
+        return True
+    except Exception as e:
+        print(f"File did not download: {e}")
+        return False
+
+
+@functools.lru_cache(maxsize=None)
+def load_gazetteer(*, path: str = "regionids.csv", name: str = "fuzzywuzzy", workers: int = 1,
+                   download: bool = True) -> RegionGazetteer:
+    """Builds the region gazetteer once per process, downloading regionids.csv first if requested
+
+    Args:
+        path (str, optional): path to regionids.csv
+        name (str, optional): fuzzy matcher backend (config.matcher in metadata.yaml)
+        workers (int, optional): number of processes/threads used by the matcher
+        download (bool, optional): refresh regionids.csv from S3 before reading it
+
+    Returns:
+        RegionGazetteer: indexed regions
+    """
+    if download:
+        download_regionids(path=path)
+    return RegionGazetteer.from_csv(path, matcher=get_matcher(name=name, workers=workers))
@@ -0,0 +1,183 @@
+import os
+import re
+import unicodedata
+import uuid
+
+import numpy as np
+import pandas as pd
+
+# Record and patient IDs, generated in bulk. IDs are random (uuid4) by default; deterministic IDs are derived from the
+# row content (uuid5), so that re-runs and incremental loads give the same records and patients the same IDs. Content
+# IDs of PII columns can be recomputed by anyone who knows the namespace and the person - keep it private for those.
+
+RECORD_NAMESPACE = uuid.UUID("0429a249-d0ea-5298-b7af-b010129e3c4d")
+PATIENT_NAMESPACE = uuid.UUID("2853131e-012b-5989-ae13-7a954f6d2a05")
+
+PATIENT_KEYS = ["metadata.nameAddress", "demographics.age", "demographics.gender"]
+
+_HEX_DIGITS = np.frombuffer(b"0123456789abcdef", dtype=np.uint8)
+
+# separators in free text - anything but letters, digits and combining marks. \w does not match combining marks (e.g.
+# Kannada vowel signs and virama), which are part of the letter they follow
+_MARKS = "".join(chr(c) for c in range(0x10000) if unicodedata.category(chr(c)).startswith("M"))
+SEPARATOR_PATTERN = re.compile(f"(?:[^\\w{re.escape(_MARKS)}]|_)+")
+
+
+def normalise_text(*, s: pd.Series) -> pd.Series:
+    """Normalises free text for matching - NFKC, upper case, runs of punctuation/whitespace as a single space,
+    stripped. Letters of every script are kept, so names in Kannada stay distinct
+
+    Args:
+        s (pd.Series): text, e.g. nameAddress
+
+    Returns:
+        pd.Series: normalised text, NaN where missing or empty after normalisation
+    """
+    # repeated entries are normalised once
+    codes, uniques = pd.factorize(s)
+    uniques = pd.Series(uniques, dtype="string").str.normalize("NFKC").str.upper()
+    uniques = uniques.str.replace(SEPARATOR_PATTERN, " ", regex=True).str.strip()
+    uniques = uniques.fillna("").astype(object)
+    uniques = uniques.where(uniques != "", np.nan).to_numpy()
+    normalised = np.full(len(s), np.nan, dtype=object)
+    normalised[codes >= 0] = uniques[codes[codes >= 0]]
+    return pd.Series(normalised, index=s.index)
+
+
+def _key_projection(df: pd.DataFrame, columns: list = None, normalise: list = None) -> pd.DataFrame:
+    """Key columns as strings (None for nulls) - numbers as floats, so that the same row projects alike in chunks where
+    read_csv infers different dtypes, and the normalise columns through normalise_text"""
+    projection = pd.DataFrame(index=df.index)
+    for col in (columns or list(df.columns)):
+        values = df[col]
+        if normalise and col in normalise:
+            values = normalise_text(s=values)
+        elif pd.api.types.is_numeric_dtype(values) and not isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.astype(float)
+        projection[col] = values.astype(str).where(values.notna(), None).astype(object)
+    return projection
+
+
+def random_ids(*, n: int) -> np.ndarray:
+    """Generates n random uuid4 strings at once - [str(uuid.uuid4()) for i in range(n)] without the per-row objects
+
+    Args:
+        n (int): number of ids
+
+    Returns:
+        np.ndarray: uuid strings
+    """
+    raw = np.frombuffer(os.urandom(16 * n), dtype=np.uint8).reshape(n, 16).copy()
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40  # version 4
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80  # RFC 4122 variant
+
+    digits = np.empty((n, 32), dtype=np.uint8)
+    digits[:, 0::2] = _HEX_DIGITS[raw >> 4]
+    digits[:, 1::2] = _HEX_DIGITS[raw & 0x0F]
+    digits = np.insert(digits, [8, 12, 16, 20], ord("-"), axis=1)
+    return digits.view("S36").ravel().astype(str).astype(object)
+
+
+def row_keys(*, df: pd.DataFrame, columns: list = None, normalise: list = None) -> pd.Series:
+    """Projects rows to compact 64-bit keys, so that global stages (de-duplication, grouping) can run across chunks
+    without holding the rows. Values are normalised first - numbers as floats and nulls as None - so the same row
+    hashes alike in chunks where read_csv infers different dtypes.
+
+    Args:
+        df (pd.DataFrame): rows
+        columns (list, optional): columns forming the key, all if None
+        normalise (list, optional): text columns compared through normalise_text
+
+    Returns:
+        pd.Series: uint64 key per row, aligned with df
+    """
+    return pd.util.hash_pandas_object(_key_projection(df, columns, normalise), index=False)
+
+
+def content_keys(*, df: pd.DataFrame, columns: list = None, normalise: list = None) -> pd.Series:
+    """Canonical text of the key columns per row - values projected as in row_keys, joined with "|", nulls empty
+
+    Args:
+        df (pd.DataFrame): rows
+        columns (list, optional): columns forming the key, all if None
+        normalise (list, optional): text columns compared through normalise_text
+
+    Returns:
+        pd.Series: key text per row, aligned with df
+    """
+    return _join_keys(_key_projection(df, columns, normalise))
+
+
+def _join_keys(projection: pd.DataFrame) -> pd.Series:
+    """Joins a key projection into one string per row"""
+    projection = projection.fillna("")
+    if projection.shape[1] == 0:
+        return pd.Series("", index=projection.index, dtype=object)
+    return projection.iloc[:, 0].str.cat([projection[col] for col in projection.columns[1:]], sep="|")
+
+
+def _broadcast_ids(labels: list, codes: np.ndarray, present: np.ndarray, index: pd.Index) -> pd.Series:
+    """Maps group codes of the present rows to their labels, NaN elsewhere"""
+    ids = np.full(len(present), np.nan, dtype=object)
+    ids[present] = np.asarray(labels, dtype=object)[codes]
+    return pd.Series(ids, index=index)
+
+
+def record_ids(*, df: pd.DataFrame, deterministic: bool = False, columns: list = None,
+               namespace: uuid.UUID = RECORD_NAMESPACE) -> pd.Series:
+    """Generates a record ID per row in bulk
+
+    Deterministic IDs are uuid5 of the row content, so they only repeat across runs if the content does - identical
+    rows are told apart by their order of occurrence, so de-duplicate first where that order is not stable.
+
+    Args:
+        df (pd.DataFrame): rows
+        deterministic (bool, optional): derive IDs from the content of columns instead of at random
+        columns (list, optional): columns forming the content, all if None
+        namespace (uuid.UUID, optional): namespace of the content IDs
+
+    Returns:
+        pd.Series: uuid string per row, aligned with df
+    """
+    if not deterministic:
+        return pd.Series(random_ids(n=len(df)), index=df.index)
+
+    keys = content_keys(df=df, columns=columns)
+    occurrence = keys.groupby(keys, sort=False).cumcount()
+    keys = keys.where(occurrence == 0, keys + "#" + occurrence.astype(str))
+    codes, uniques = pd.factorize(keys)
+    return _broadcast_ids([str(uuid.uuid5(namespace, key)) for key in uniques], codes, np.ones(len(df), dtype=bool),
+                          df.index)
+
+
+def assign_group_ids(*, df: pd.DataFrame, keys: list, ids: dict = None, normalise: list = None,
+                     deterministic: bool = False, namespace: uuid.UUID = PATIENT_NAMESPACE) -> pd.Series:
+    """Assigns an ID per distinct combination of keys, consistently across chunks - groupby(keys).ngroup() mapped to
+    ids generated in bulk
+
+    Args:
+        df (pd.DataFrame): chunk
+        keys (list): columns identifying a group
+        ids (dict, optional): row key -> uuid for groups in earlier chunks, updated with new groups. Not needed for a
+            single chunk, or with deterministic IDs.
+        normalise (list, optional): text columns compared through normalise_text, e.g. nameAddress
+        deterministic (bool, optional): derive IDs from the normalised key content (uuid5) instead of at random
+        namespace (uuid.UUID, optional): namespace of the content IDs
+
+    Returns:
+        pd.Series: uuid string per row, NaN where a key is missing (as groupby drops null keys)
+    """
+    projection = _key_projection(df, keys, normalise)
+    present = projection.notna().all(axis=1).to_numpy()
+
+    if deterministic:
+        codes, uniques = pd.factorize(_join_keys(projection[present]))
+        labels = [str(uuid.uuid5(namespace, key)) for key in uniques]
+    else:
+        ids = {} if ids is None else ids
+        codes, uniques = pd.factorize(pd.util.hash_pandas_object(projection[present], index=False))
+        new = [key for key in uniques if key not in ids]
+        ids.update(zip(new, random_ids(n=len(new))))
+        labels = [ids[key] for key in uniques]
+
+    return _broadcast_ids(labels, codes, present, df.index)
@@ -0,0 +1,208 @@
+import cProfile
+import datetime
+import json
+import os
+import re
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # not available on Windows - peak memory is then only reported with trace_memory
+    resource = None
+
+
+def count_rows(obj) -> int:
+    """Number of rows in a DataFrame/Series (or list of them), None for anything else."""
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        return len(obj)
+    if isinstance(obj, (list, tuple)) and obj and all(isinstance(o, (pd.DataFrame, pd.Series)) for o in obj):
+        return sum(len(o) for o in obj)
+    return None
+
+
+def peak_rss_mb() -> float:
+    """Peak resident memory of the process so far in MB, None if unavailable."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS, kilobytes on Linux
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+class Stage:
+    """Measurements of one run of a pipeline stage."""
+
+    def __init__(self, name: str, data=None):
+        self.name = name
+        self.data = data
+        self.rows_in = count_rows(data)
+        self.rows_out = None
+        self.status = "running"
+
+    def output(self, data):
+        """Record the stage output, for stages that return a new object instead of modifying the input in place.
+
+        Args:
+            data: Output DataFrame/Series.
+        """
+        self.data = data
+
+    def to_dict(self) -> dict:
+        return {"stage": self.name, "status": self.status, "wall_time": round(self.wall_time, 4),
+                "cpu_time": round(self.cpu_time, 4),
+                "peak_memory_mb": None if self.peak_memory_mb is None else round(self.peak_memory_mb, 2),
+                "rows_in": self.rows_in, "rows_out": self.rows_out}
+
+
+class Pipeline:
+    """Runs a script's transformations as named stages, recording wall time, CPU time (including child processes),
+    peak memory delta and rows in/out for each.
+
+    Usage:
+        pipeline = Pipeline("standardise")
+        with pipeline.stage("Standardise gender", df):
+            df["demographics.gender"] = ...
+        with pipeline.stage("Drop duplicates", df) as stage:
+            df = df.drop_duplicates()
+            stage.output(df)
+        pipeline.save("pipeline_report.json")
+    """
+
+    def __init__(self, name: str, profile_stage: str = None, profile_path: str = None, trace_memory: bool = False):
+        """
+        Args:
+            name (str): Name of the pipeline in the report.
+            profile_stage (str, optional): Stage to run under cProfile, defaults to $PIPELINE_PROFILE_STAGE.
+            profile_path (str, optional): File for the cProfile stats, defaults to {stage}.prof.
+            trace_memory (bool, optional): Measure the peak of Python allocations per stage with tracemalloc (slower).
+                Otherwise the peak memory delta is the growth in the process' peak resident memory.
+        """
+        self.name = name
+        self.profile_stage = profile_stage or os.environ.get("PIPELINE_PROFILE_STAGE")
+        self.profile_path = profile_path
+        self.profiler = cProfile.Profile() if self.profile_stage else None
+        self.trace_memory = trace_memory
+        self.started = datetime.datetime.now()
+        self.stages = []
+        self.counters = {}
+
+    @contextmanager
+    def stage(self, name: str, data=None):
+        """Context manager measuring a stage.
+
+        Args:
+            name (str): Stage name - repeated names (e.g. per chunk) are summed in the summary.
+            data (optional): Input DataFrame/Series, for the row counts. Rows out are counted on the same object
+                unless the stage records a new one with stage.output(df).
+
+        Yields:
+            Stage: The stage being measured.
+        """
+        stage = Stage(name, data)
+        profile = self.profiler is not None and name == self.profile_stage
+
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            memory_start = tracemalloc.get_traced_memory()[0]
+        else:
+            memory_start = peak_rss_mb()
+        cpu_start = sum(os.times()[:4])
+        wall_start = time.perf_counter()
+        if profile:
+            self.profiler.enable()
+
+        try:
+            yield stage
+            stage.status = "ok"
+        except BaseException:
+            stage.status = "failed"
+            raise
+        finally:
+            if profile:
+                self.profiler.disable()
+            stage.wall_time = time.perf_counter() - wall_start
+            stage.cpu_time = sum(os.times()[:4]) - cpu_start
+            if self.trace_memory:
+                stage.peak_memory_mb = (tracemalloc.get_traced_memory()[1] - memory_start) / 1024 ** 2
+            else:
+                stage.peak_memory_mb = None if memory_start is None else peak_rss_mb() - memory_start
+            stage.rows_out = count_rows(stage.data)
+            stage.data = None
+            self.stages.append(stage)
+
+    def iterate(self, name: str, iterable):
+        """Measure producing each item of an iterable (e.g. reading csv chunks) as a run of a stage.
+
+        Args:
+            name (str): Stage name.
+            iterable: Items to produce, e.g. pd.read_csv(..., chunksize=...).
+
+        Yields:
+            Items of the iterable - work done on them by the caller is not part of the stage.
+        """
+        iterator = iter(iterable)
+        end = object()
+        while True:
+            with self.stage(name) as stage:
+                item = next(iterator, end)
+                stage.output(item)
+            if item is end:
+                # the final read that finds no more items is not a run
+                self.stages.pop()
+                return
+            yield item
+
+    def counter(self, name: str) -> dict:
+        """Named counts reported with the stages (e.g. rows parsed per date format), created on first use.
+
+        Args:
+            name (str): Counter name in the report.
+
+        Returns:
+            dict: Counts by key, updated in place by the caller.
+        """
+        return self.counters.setdefault(name, {})
+
+    def summary(self) -> pd.DataFrame:
+        """Per-stage totals, in the order stages first ran.
+
+        Returns:
+            pd.DataFrame: Runs, wall time, CPU time, max peak memory delta and rows in/out per stage name.
+        """
+        df = pd.DataFrame([stage.to_dict() for stage in self.stages],
+                          columns=["stage", "status", "wall_time", "cpu_time", "peak_memory_mb", "rows_in", "rows_out"])
+        return df.groupby("stage", sort=False).agg(runs=("stage", "size"), wall_time=("wall_time", "sum"),
+                                                    cpu_time=("cpu_time", "sum"),
+                                                    peak_memory_mb=("peak_memory_mb", "max"),
+                                                    rows_in=("rows_in", "sum"), rows_out=("rows_out", "sum"))
+
+    def report(self) -> dict:
+        """Report of the run, with every stage run in order."""
+        return {"pipeline": self.name, "started": self.started.isoformat(),
+                "wall_time": round(sum(stage.wall_time for stage in self.stages), 4),
+                "cpu_time": round(sum(stage.cpu_time for stage in self.stages), 4),
+                "stages": [stage.to_dict() for stage in self.stages], "counters": self.counters}
+
+    def save(self, path: str) -> dict:
+        """Write the report as JSON, and the cProfile stats if a stage was profiled.
+
+        Args:
+            path (str): JSON file for the report.
+
+        Returns:
+            dict: The report.
+        """
+        report = self.report()
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+
+        if self.profiler is not None and any(stage.name == self.profile_stage for stage in self.stages):
+            self.profiler.dump_stats(self.profile_path or re.sub(r"[^\w\-]+", "_", self.profile_stage) + ".prof")
+        return report
@@ -0,0 +1,27 @@
+import functools
+
+import boto3
+import yaml
+
+# Resources loaded on first use and reused for the life of the process, so that many years/days can be processed
+# back-to-back without re-parsing configs or re-creating clients
+
+
+@functools.lru_cache(maxsize=None)
+def load_metadata(path: str = "metadata.yaml") -> dict:
+    """Parses a metadata.yaml once per process
+
+    Args:
+        path (str, optional): path to the yaml config
+
+    Returns:
+        dict: metadata, shared between callers - do not modify
+    """
+    with open(path) as f:
+        return yaml.safe_load(f)
+
+
+@functools.lru_cache(maxsize=None)
+def s3_client():
+    """Returns the boto3 S3 client, created on first use"""
+    return boto3.client("s3")
@@ -1,77 +1,153 @@
+import numpy as np
 import pandas as pd
 import re
 
+UNNAMED_PATTERN = re.compile("Unnamed", re.IGNORECASE)
+HEADER_CLEAN_PATTERN = re.compile(r"[\,\.\-\d\(\)\s\*\-\_]+")
 
-def set_headers(df: pd.DataFrame, pivot_column: str, col_start_index: int, col_start_value) -> pd.DataFrame:
-    """Set the correct headers for the DataFrame and clean up the DataFrame.
+
+def find_header_row(df: pd.DataFrame, pivot_column: str, max_rows: int = 6) -> int:
+    """Find the header row as the first of the current headers and the top rows that contains the pivot column.
 
     Args:
         df (pd.DataFrame): DataFrame to be processed.
-        pivot_column (str): Name of the stable column used to identify the header.
-        col_start_index (int): Index of the column used to identify the dataframe start row (start at 0).
-        col_start_value: Value in col_start_index column indicating the start of dataframe.
+        pivot_column (str): Name (regex) of the stable column used to identify the header.
+        max_rows (int, optional): Number of top rows searched.
 
     Returns:
-        pd.DataFrame: DataFrame with correct headers set.
+        int: 0 if the current headers contain the pivot column, else 1 + the position of the header row (the last
+            row searched if the pivot column is not found).
+    """
+    block = np.vstack([np.asarray(df.columns, dtype=object),
+                       df.iloc[:max_rows].to_numpy(dtype=object)])
+    found = pd.Series(block.ravel()).astype(str).str.contains(pivot_column.strip(), case=False, regex=True)
+    found = found.to_numpy().reshape(block.shape).any(axis=1)
+    return int(found.argmax()) if found.any() else len(block) - 1
+
+
+def find_data_start(df: pd.DataFrame, col_start_index: int, col_start_value) -> int:
+    """Find the position of the first row whose col_start_index column equals col_start_value.
+
+    Raises:
+        Exception: Start value not found.
+    """
+    start = np.flatnonzero((df.iloc[:, col_start_index] == col_start_value).to_numpy())
+    if not len(start):
+        raise Exception("Unable to identify where data starts")
+    return int(start[0])
+
+
+def fill_unnamed(columns, pattern: re.Pattern = UNNAMED_PATTERN) -> list:
+    """Forward fill unnamed or NaN headers (from merged cells) with the previous header."""
+    columns = pd.Series(list(columns), dtype=object)
+    unnamed = columns.isna() | columns.astype(str).str.contains(pattern)
+    unnamed.iloc[0] = False
+    return columns.mask(unnamed).ffill().tolist()
+
+
+def merge_header_rows(columns: list, rows: np.ndarray, pattern: re.Pattern = HEADER_CLEAN_PATTERN, sep: str = "",
+                      lower: bool = True, clean_columns: bool = False, skip_pattern: str = None) -> list:
+    """Merge multi-row headers upwards into the column names in one pass.
+
+    Args:
+        columns (list): Current headers.
+        rows (np.ndarray): Header rows below the headers (rows x columns).
+        pattern (re.Pattern, optional): Characters removed from header cells.
+        sep (str, optional): Separator before each merged cell.
+        lower (bool, optional): Lower case merged cells.
+        clean_columns (bool, optional): Also remove pattern from headers that have cells merged into them.
+        skip_pattern (str, optional): Regex for cells not merged, in addition to NaN.
+
+    Returns:
+        list: Merged headers.
+    """
+    cells = pd.Series(rows.ravel(order="F"), dtype=object)
+    keep = cells.notna()
+    if skip_pattern:
+        keep &= ~cells.astype(str).str.contains(skip_pattern, case=False, regex=True)
+    cleaned = cells.astype(str).str.strip().str.replace(pattern, "", regex=True)
+    if lower:
+        cleaned = cleaned.str.lower()
+    parts = (sep + cleaned).where(keep, "").to_numpy().reshape(rows.shape[1], rows.shape[0])
+
+    merged = []
+    for column, part, has_part in zip(columns, parts, keep.to_numpy().reshape(rows.shape[1], rows.shape[0]).any(axis=1)):
+        if not has_part:
+            merged.append(column)
+            continue
+        base = pattern.sub("", str(column).strip()) if clean_columns else str(column)
+        merged.append(base + "".join(part))
+    return merged
+
+
+def resolve_headers(df: pd.DataFrame, pivot_column: str = None, max_header_rows: int = 6, col_start_index: int = 0,
+                    col_start_value=1, unnamed_pattern: re.Pattern = UNNAMED_PATTERN, ffill_header_rows: bool = False,
+                    keep_start_row: bool = False, **merge_options) -> pd.DataFrame:
+    """Resolve the headers of a sheet with multi-row headers, and drop the header rows.
+
+    Args:
+        df (pd.DataFrame): DataFrame to be processed.
+        pivot_column (str, optional): Name of the stable column used to identify the header, headers are used as read if None.
+        max_header_rows (int, optional): Number of top rows searched for the pivot column.
+        col_start_index (int, optional): Index of the column used to identify the dataframe start row (start at 0).
+        col_start_value (optional): Value in col_start_index column indicating the start of dataframe.
+        unnamed_pattern (re.Pattern, optional): Headers forward filled from the previous header.
+        ffill_header_rows (bool, optional): Forward fill header rows (except the last) across merged cells.
+        keep_start_row (bool, optional): Whether the start row is data (kept) or the last header row (dropped).
+        **merge_options: Options for merge_header_rows.
+
+    Returns:
+        pd.DataFrame: DataFrame with resolved headers.
     """
     assert isinstance(
         df, pd.DataFrame), "Invalid input: df must be a DataFrame"
-    assert isinstance(
-        pivot_column, str), "Invalid input: pivot_column must be a string"
     assert isinstance(
         col_start_index, int), "Invalid input: col_start_index must be an integer"
     assert 0 <= col_start_index < len(
         df.columns), "Invalid input: col_start_index out of range"
 
-    def search_header(L: list, pivot_col_name: str) -> bool:
-        """Identify if the current list of DataFrame headers contains the pivot column.
-
-        Args:
-            L (list): Current list of DataFrame headers.
-            pivot_col_name (str): Column name used as a reference to identify the header.
-
-        Returns:
-            bool: Whether the pivot column is not found in the current headers.
-        """
-        assert isinstance(L, list) and isinstance(
-            pivot_col_name, str), "Invalid input"
-
-        pivot_col_name = pivot_col_name.strip()
-        for column in L:
-            if re.search(pivot_col_name, str(column), re.IGNORECASE):
-                return False
-        return True
-
-    # Find the correct header row
-    i = 0
-    while search_header(list(df.columns), pivot_column) and (i < 6):  # Adjust as needed
-        df.columns = df.iloc[i, :]
-        i += 1
-
-    # Drop the rows before the identified header row
-    df = df.drop(index=range(i)).reset_index(drop=True)
+    # Find the correct header row, and drop the rows up to it
+    if pivot_column is not None:
+        assert isinstance(
+            pivot_column, str), "Invalid input: pivot_column must be a string"
+        i = find_header_row(df, pivot_column, max_header_rows)
+        if i:
+            df = df.set_axis(df.iloc[i - 1].tolist(), axis=1)
+        df = df.iloc[i:].reset_index(drop=True)
 
     # Forward fill for NaN or unnamed columns
-    for j in range(1, len(df.columns)):
-        if re.search("Unnamed", str(df.columns[j]), re.IGNORECASE) or pd.isna(df.columns[j]):
-            df.columns.values[j] = df.columns.values[j-1]
+    df = df.set_axis(fill_unnamed(df.columns, unnamed_pattern), axis=1)
 
     # Identify where data starts based on a column and value input
-    start_index = df[df.iloc[:, col_start_index] == col_start_value].index[0]
+    start_index = find_data_start(df, col_start_index, col_start_value)
 
     # Upward fill merged columns if necessary
-    for row in range(start_index):
-        row_data = df.iloc[row].tolist()
-        for j in range(len(row_data)):
-            if not pd.isna(row_data[j]):
-                merge_col = re.sub(
-                    r"[\,\.\-\d\(\)\s\*\-\_]+", "", str(row_data[j])).lower()
-                df.columns.values[j] += merge_col
+    rows = df.iloc[:start_index].to_numpy(dtype=object)
+    if ffill_header_rows and start_index > 1:
+        rows[:start_index - 1] = pd.DataFrame(rows[:start_index - 1]).ffill(axis=1).to_numpy(dtype=object)
+    df = df.set_axis(merge_header_rows(list(df.columns), rows, **merge_options), axis=1)
 
     # Drop the rows before the data starts
-    df = df.drop(index=range(start_index + 1)).reset_index(drop=True)
+    return df.iloc[start_index if keep_start_row else start_index + 1:].reset_index(drop=True)
+
+
+def set_headers(df: pd.DataFrame, pivot_column: str, col_start_index: int, col_start_value) -> pd.DataFrame:
+    """Set the correct headers for the DataFrame and clean up the DataFrame.
+
+    Args:
+        df (pd.DataFrame): DataFrame to be processed.
+        pivot_column (str): Name of the stable column used to identify the header.
+        col_start_index (int): Index of the column used to identify the dataframe start row (start at 0).
+        col_start_value: Value in col_start_index column indicating the start of dataframe.
+
+    Returns:
+        pd.DataFrame: DataFrame with correct headers set.
+    """
+    assert isinstance(
+        pivot_column, str), "Invalid input: pivot_column must be a string"
 
-    return df
+    return resolve_headers(df, pivot_column=pivot_column, col_start_index=col_start_index,
+                           col_start_value=col_start_value)
 
 # Usage example:
 # df = pd.read_csv("your_data.csv")
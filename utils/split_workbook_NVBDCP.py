@@ -2,13 +2,62 @@ import pandas as pd
 import os
 import re
 import datetime
+from concurrent.futures import ThreadPoolExecutor
 
+# sheet name pattern -> output directory, checked in order (PCMC before PMC, which it contains)
+SHEET_RULES = [(re.compile(pattern, re.IGNORECASE), directory) for pattern, directory in [
+    ("PCMC", "PCMC"),
+    ("PMC", "PMC"),
+    ("PR|Rural", "Pune Rural"),
+]]
 
-def split_workbook_NVBDCP(workbook_name: str) -> bool:
+
+def route_sheet(sheet: str, rules: list = SHEET_RULES) -> str:
+    """Finds the output directory for a sheet from the first matching rule.
+
+    Args:
+        sheet (str): Sheet name
+        rules (list, optional): (compiled pattern, directory) pairs
+
+    Returns:
+        str: Output directory, None if no rule matches
+    """
+    for pattern, directory in rules:
+        if pattern.search(sheet):
+            return directory
+    return None
+
+
+def write_sheet(df: pd.DataFrame, path: str, output_format: str = "csv") -> str:
+    """Writes a sheet to csv or parquet.
+
+    Args:
+        df (pd.DataFrame): Sheet
+        path (str): Output path without extension
+        output_format (str, optional): csv or parquet
+
+    Returns:
+        str: Path written
+    """
+    assert output_format in ["csv", "parquet"], "Invalid input: output_format must be csv or parquet"
+
+    if output_format == "csv":
+        df.to_csv(path+".csv", index=False)
+    else:
+        # raw sheets have mixed types in a column - store object columns as strings
+        df = df.astype({col: "string" for col in df.columns[df.dtypes == "object"]})
+        df.columns = df.columns.astype(str)
+        df.to_parquet(path+".parquet", index=False)
+    return path+"."+output_format
+
+
+def split_workbook_NVBDCP(workbook_name: str, output_format: str = "csv", workers: int = None) -> bool:
     """This function splits the NVBDCP Raw Line list into individual csvs by source.
 
     Args:
         workbook_name (str): Name of Raw Excel Workbook
+        output_format (str, optional): csv or parquet
+        workers (int, optional): Number of threads writing sheets, defaults to the executor's default
 
     Returns:
         bool: Whether all sheets have been processed
@@ -17,45 +66,23 @@ def split_workbook_NVBDCP(workbook_name: str) -> bool:
     assert isinstance(workbook_name, str) and re.search(
         ".xls", workbook_name), "Invalid input"
 
-    processed = True
-
-    wb = pd.ExcelFile(workbook_name)
-
-    for sheet in wb.sheet_names:
-        if re.search("PCMC", sheet, re.IGNORECASE):
-            df = pd.read_excel(workbook_name, sheet_name=sheet)
-            path = os.path.join(os.curdir, "PCMC")
-            try:
-                os.mkdir(path)
-            except FileExistsError:  # if directory exists, just save file
-                df.to_csv(os.path.join(path, sheet+".csv"), index=False)
-            else:
-                df.to_csv(os.path.join(path, sheet+".csv"), index=False)
-
-        elif re.search("PMC", sheet, re.IGNORECASE):
-            df = pd.read_excel(workbook_name, sheet_name=sheet)
-            path = os.path.join(os.curdir, "PMC")
-            try:
-                os.mkdir(path)
-            except FileExistsError:  # if directory exists, just save file
-                df.to_csv(os.path.join(path, sheet+".csv"), index=False)
-            else:
-                df.to_csv(os.path.join(path, sheet+".csv"), index=False)
-
-        elif re.search("PR|Rural", sheet, re.IGNORECASE):
-            df = pd.read_excel(workbook_name, sheet_name=sheet)
-            path = os.path.join(os.curdir, "Pune Rural")
-            try:
-                os.mkdir(path)
-            except FileExistsError:  # if directory exists, just save file
-                df.to_csv(os.path.join(path, sheet+".csv"), index=False)
-            else:
-                df.to_csv(os.path.join(path, sheet+".csv"), index=False)
-        else:
-            processed = False
-            log = open("error_log.txt", "a")
-            log.write(f"\nDateTime:{datetime.datetime.now()}")
-            log.write(f"\nCheck source for sheet {
-                      sheet}, and process manually.\n")
-            log.close()
-    return (processed)
+    with pd.ExcelFile(workbook_name) as wb:
+        routes = {sheet: route_sheet(sheet) for sheet in wb.sheet_names}
+        matched = [sheet for sheet, directory in routes.items() if directory]
+        # parse the routed sheets from the open workbook in a single pass
+        frames = wb.parse(sheet_name=matched) if matched else {}
+
+    for directory in set(routes.values()) - {None}:
+        os.makedirs(os.path.join(os.curdir, directory), exist_ok=True)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(lambda sheet: write_sheet(frames[sheet], os.path.join(os.curdir, routes[sheet], sheet),
+                                                output_format), matched))
+
+    unmatched = [sheet for sheet, directory in routes.items() if directory is None]
+    if unmatched:
+        with open("error_log.txt", "a") as log:
+            for sheet in unmatched:
+                log.write(f"\nDateTime:{datetime.datetime.now()}")
+                log.write(f"\nCheck source for sheet {sheet}, and process manually.\n")
+    return (len(unmatched) == 0)